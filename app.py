@@ -1,26 +1,84 @@
 import os
+import asyncio
+import random
+import atexit
+import click
 import stripe
-from database.repositories import JobRepository, AddressRepository
+from database.repositories import JobRepository, UserRepository
 from flask import Flask, jsonify, request, render_template, redirect,url_for, make_response
 from controllers.whatsapp_controller import WhatsAppController
 from clients.whatsapp_client import WhatsAppClient
+from clients.http_client import graph_api_client
+from clients.outbound_dispatcher import outbound_dispatcher
+from clients.classification_client import classification_client
+from clients.stripe_outbox import stripe_outbox
+from clients.settlement_scheduler import settlement_scheduler
 from controllers.dialogflow_controller import DialogflowController
+from controllers.payment_controller import PaymentController
 from clients.stripe_client import StripeClient
+from database.category_catalog import category_catalog
+from utils.user_cache import user_cache
+from utils.work_queue import WorkQueue
+from utils.lane_dispatcher import LaneDispatcher
+from utils.dedup_store import create_dedup_store
+from utils.zip_code_store import zip_code_store, read_zip_code_csv
+from utils.prediction_cache import category_predictions
+from utils.category_classifier import category_classifier, HashedNgramClassifier
 
-from config import WHATSAPP_VERIFY_TOKEN,  STRIPE_SECRET_KEY
+from config import (
+    WHATSAPP_VERIFY_TOKEN, STRIPE_SECRET_KEY, WEBHOOK_ASYNC_PROCESSING,
+    WEBHOOK_QUEUE_MAX_SIZE, WEBHOOK_QUEUE_WORKERS, WEBHOOK_QUEUE_DRAIN_TIMEOUT,
+    SENDER_LANE_IDLE_SECONDS, OUTBOUND_QUEUE_DRAIN_TIMEOUT, CATEGORY_CLASSIFIER_PATH, SETTLEMENT_ENABLED
+)
 
 app = Flask(__name__, static_folder='assets')
 
 stripe.api_key = STRIPE_SECRET_KEY
 
 # Instantiate WhatsApp controller, WhatsApp client, Dialogflow controller
-whatsapp_controller = WhatsAppController()
 dialogflow_controller = DialogflowController()
+whatsapp_controller = WhatsAppController(dialogflow_controller)
 whatsapp_client = WhatsAppClient()
 stripe_client = StripeClient()
+payment_controller = PaymentController(whatsapp_controller, stripe_client)
 
-# In-memory store for processed message IDs
-processed_message_ids = set()
+# Open the Dialogflow channel now rather than on the first message
+dialogflow_controller.dialogflow_client.warm_up()
+
+# Load the category catalog up front so job flows never query categories
+try:
+    asyncio.run(category_catalog.refresh())
+except Exception as e:
+    print(f"Error loading category catalog: {e}")
+
+# Bounded store of processed message IDs, shared across workers with the sqlite backend
+processed_message_ids = create_dedup_store()
+
+# One ordered lane per sender: a sender's messages run in turn, different senders run concurrently
+sender_lanes = LaneDispatcher("sender", SENDER_LANE_IDLE_SECONDS)
+
+# Close pooled WhatsApp API connections on exit; atexit runs in reverse, so this runs after the queues drain
+atexit.register(graph_api_client.close)
+atexit.register(classification_client.close)
+
+# Deliver notifications in the background with rate limiting and retries
+outbound_dispatcher.start()
+atexit.register(outbound_dispatcher.shutdown, OUTBOUND_QUEUE_DRAIN_TIMEOUT)
+
+# Execute recorded Stripe operations (captures, top-ups, Connect accounts) in the background
+stripe_outbox.start()
+atexit.register(stripe_outbox.shutdown)
+
+# Pay out completed jobs in scheduled settlements; stopped before the outbox on exit
+if SETTLEMENT_ENABLED:
+    settlement_scheduler.start()
+    atexit.register(settlement_scheduler.shutdown)
+
+# Queue for acknowledge-then-process webhook handling
+webhook_queue = WorkQueue("webhook", WEBHOOK_QUEUE_MAX_SIZE, WEBHOOK_QUEUE_WORKERS, lanes=sender_lanes)
+if WEBHOOK_ASYNC_PROCESSING:
+    webhook_queue.start()
+    atexit.register(webhook_queue.shutdown, WEBHOOK_QUEUE_DRAIN_TIMEOUT)
 
 @app.route("/", methods=["GET"])
 async def home():
@@ -59,29 +117,49 @@ async def webhook():
     elif request.method == "POST":
         body = request.get_json()
         try:
-            if body.get("object"):
-                entries = body.get("entry", [])
-                for entry in entries:
-                    changes = entry.get("changes", [])
-                    for change in changes:
-                        value = change.get("value", {})
-                        if "messages" in value:
-                            message_id = value["messages"][0]["id"]
-                            if message_id in processed_message_ids:
-                                print(f"Message {message_id} already processed.")
-                                return jsonify({"status": "ok"}), 200
-
-                            processed_message_ids.add(message_id)
-                            response = await whatsapp_controller.handle_whatsapp_message(body)
-                            return jsonify(response), 200
-                        elif "statuses" in value:
-                            # Handle statuses and return status details
-                            statuses = value["statuses"]
-                            status_messages = [status["status"] for status in statuses]
-                            return jsonify({"status": "ok", "message": f"Received a status update: {', '.join(status_messages)}"}), 200
+            if not body.get("object"):
                 return jsonify({"status": "error", "message": "Not a WhatsApp API event"}), 404
-            else:
+
+            messages = whatsapp_controller.split_messages(body)
+            statuses = whatsapp_controller.split_statuses(body)
+            if not messages and not statuses:
                 return jsonify({"status": "error", "message": "Not a WhatsApp API event"}), 404
+
+            results = []
+            pending = []
+            for message_id, sender, message_body in messages:
+                # Claiming is atomic, so a redelivery racing the first copy is dropped too
+                if not processed_message_ids.claim(message_id):
+                    print(f"Message {message_id} already processed.")
+                    results.append({"id": message_id, "status": "duplicate"})
+                    continue
+
+                if WEBHOOK_ASYNC_PROCESSING:
+                    # Acknowledge now; the pipeline runs in the sender's lane, so a busy sender holds up no one else
+                    if webhook_queue.enqueue(whatsapp_controller.handle_whatsapp_message, message_body, key=sender):
+                        results.append({"id": message_id, "status": "queued"})
+                    else:
+                        processed_message_ids.release(message_id)
+                        results.append({"id": message_id, "status": "rejected"})
+                else:
+                    result = {"id": message_id, "status": "processing"}
+                    results.append(result)
+                    pending.append((result, sender_lanes.dispatch(sender, whatsapp_controller.handle_whatsapp_message, message_body)))
+
+            # Senders run concurrently; each sender's lane keeps its messages in order
+            outcomes = await asyncio.gather(*(job for _, job in pending), return_exceptions=True)
+            for (result, _), outcome in zip(pending, outcomes):
+                result["status"] = "processed" if outcome and not isinstance(outcome, Exception) else "failed"
+
+            response = {"status": "ok", "messages": results}
+            if statuses:
+                response["message"] = f"Received a status update: {', '.join(statuses)}"
+
+            if any(result["status"] == "rejected" for result in results):
+                # Ask Meta to redeliver; messages already accepted are skipped as duplicates
+                response.update({"status": "error", "message": "Webhook queue is full"})
+                return jsonify(response), 503
+            return jsonify(response), 200
         except Exception as e:
             print(f"Error processing request: {e}")
             return jsonify({"status": "error", "message": str(e)}), 500
@@ -104,39 +182,31 @@ async def dialogflow_webhook():
         print(f"Error processing Dialogflow webhook: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route("/stripe_webhook", methods=["POST"])
+async def stripe_webhook():
+    """
+    Webhook endpoint for Stripe.
+
+    POST: Verifies the signature and posts the job of a completed checkout session.
+    """
+    response, status = await payment_controller.handle_stripe_webhook(
+        request.get_data(), request.headers.get("Stripe-Signature")
+    )
+    return jsonify(response), status
+
 @app.route('/success', methods=['GET'])
 async def order_success():
     payment_id = request.args.get('paymentID')
     if not payment_id:
         return redirect(url_for('home'))
 
-    session = stripe.checkout.Session.retrieve(payment_id)
-    customer_address = session.customer_details.address
+    session = await payment_controller.get_checkout_session(payment_id)
+    customer_address = session.customer_details.address if session and session.customer_details else None
 
     if session and customer_address:
-        address_data = {
-            "street": f"{customer_address.line1} {customer_address.line2 if customer_address.line2 else ''}",
-            "city": customer_address.city,
-            "zip_code": customer_address.postal_code,
-            "state": customer_address.state,
-            "country": customer_address.country
-        }
-
-        result = await AddressRepository.register_address(address_data, session.metadata.user_id)
-
-        address_id = result['address_data'].id if result['address_data'] else None
-
-        update_job_data = {
-            'status': 'posted',
-            'payment_status': 'authorized',
-            'payment_intent': session.payment_intent,
-            'address_id': address_id
-        }
-        where_criteria = {"id": int(session.metadata.job_id), "payment_status": 'unpaid'}
-
-        job = await JobRepository.update_job(where_criteria, update_job_data)
-        if job:
-            await whatsapp_controller.notify_payment_success( session, customer_address)
+        # The Stripe webhook posts the job; without it, post it before rendering
+        if not payment_controller.webhook_enabled:
+            await payment_controller.complete_checkout(session)
 
         return render_template(
             'success.html',
@@ -146,6 +216,26 @@ async def order_success():
     else:
         return redirect(url_for('home'))
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Expose in-process cache counters for monitoring.
+    """
+    return jsonify({
+        "user_cache": user_cache.stats(),
+        "category_catalog": category_catalog.stats(),
+        "webhook_queue": webhook_queue.stats(),
+        "sender_lanes": sender_lanes.stats(),
+        "processed_message_ids": processed_message_ids.stats(),
+        "outbound_dispatcher": outbound_dispatcher.stats(),
+        "zip_codes": zip_code_store.stats(),
+        "category_predictions": category_predictions.stats(),
+        "classification_client": classification_client.stats(),
+        "category_classifier": category_classifier.stats(),
+        "stripe_outbox": stripe_outbox.stats(),
+        "settlements": settlement_scheduler.stats()
+    }), 200
+
 @app.route("/docs/<path:filename>", methods=["GET"])
 def documentation_file(filename):
     """
@@ -179,6 +269,61 @@ def connected_account_verify():
         print(f"Error verifying connected account: {e}")
         return jsonify({"error": "Internal Server Error"}), 500
     
+@app.cli.command("backfill-phone-index")
+@click.option("--batch-size", default=500, show_default=True, help="Users indexed per transaction.")
+def backfill_phone_index(batch_size):
+    """
+    Populate the phone number blind index for existing users.
+    """
+    indexed, duplicates = asyncio.run(UserRepository.backfill_phone_number_index(batch_size))
+    print(f"Indexed {indexed} users.")
+    if duplicates:
+        print(f"{len(duplicates)} users share a phone number with an indexed user and were skipped: "
+              f"{', '.join(str(user_id) for user_id, _ in duplicates)}. Merge or delete them, then run the backfill again.")
+
+@app.cli.command("load-zip-codes")
+@click.argument("csv_path", type=click.Path(exists=True, dir_okay=False))
+def load_zip_codes(csv_path):
+    """
+    Load an offline US ZIP code dataset into the local ZIP code index.
+    """
+    loaded = zip_code_store.preload(read_zip_code_csv(csv_path))
+    print(f"Loaded {loaded} ZIP codes.")
+
+@app.cli.command("train-category-classifier")
+@click.option("--output", default=CATEGORY_CLASSIFIER_PATH, show_default=True, help="Path of the classifier artifact.")
+@click.option("--holdout", default=0.0, show_default=True, help="Share of jobs held out to report accuracy.")
+def train_category_classifier(output, holdout):
+    """
+    Train the embedded category classifier from the categorized jobs in the database.
+    """
+    rows = asyncio.run(JobRepository.get_job_descriptions_with_categories())
+    if not rows:
+        print("No categorized jobs to train on.")
+        return
+
+    random.Random(0).shuffle(rows)
+    held_out = rows[:int(len(rows) * holdout)]
+    training = rows[len(held_out):]
+    classifier = HashedNgramClassifier.train([row[0] for row in training], [row[1] for row in training])
+    if held_out:
+        correct = sum(
+            [prediction[0] for prediction in classifier.predict(description, top=1)] == [category]
+            for description, category in held_out
+        )
+        print(f"Held-out accuracy: {correct / len(held_out):.2%} on {len(held_out)} jobs.")
+
+    classifier.save(output)
+    print(f"Trained on {len(training)} jobs in {len(classifier.classes)} categories; saved to {output}.")
+
+@app.cli.command("settle-payouts")
+def settle_payouts():
+    """
+    Settle the paid jobs not yet paid out now, without waiting for the next settlement window.
+    """
+    settled = asyncio.run(settlement_scheduler.settle())
+    print(f"Settled {settled} jobs; the running app's Stripe outbox executes the top-ups and transfers.")
+
 if __name__ == "__main__":
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True, use_reloader=True)
@@ -0,0 +1,156 @@
+import asyncio
+import httpx
+from clients.http_client import HttpClient
+from utils.background_loop import background_loop
+from config import (
+    CLASSIFICATION_MODEL_API_URL, CLASSIFICATION_MODEL_API_KEY, CLASSIFICATION_HTTP_TIMEOUT,
+    CLASSIFICATION_HTTP_MAX_CONNECTIONS, CLASSIFICATION_BATCH_SIZE, CLASSIFICATION_BATCH_LINGER_MS
+)
+
+# Status codes meaning the model service has no batch endpoint
+BATCH_UNSUPPORTED_STATUSES = {404, 405, 501}
+
+class ClassificationClient:
+    def __init__(self, batch_size, linger_ms, loop=background_loop):
+        """
+        Initialize a client for the classification model API that gathers concurrent predictions
+        into batched requests on a pooled connection.
+
+        Predictions are held for up to linger_ms milliseconds, or until batch_size are waiting,
+        and sent to /predict_batch as one request. If the service has no batch endpoint, the
+        client switches to one /predict request per description.
+
+        Args:
+            batch_size (int): The maximum number of descriptions per request; 1 disables batching.
+            linger_ms (float): The number of milliseconds a prediction waits for others to join its batch.
+            loop (BackgroundLoop): The loop batches are gathered and sent on.
+        """
+        self.batch_size = max(batch_size, 1)
+        self.linger = linger_ms / 1000
+        self.background_loop = loop
+        self.http_client = HttpClient(
+            CLASSIFICATION_MODEL_API_URL or "",
+            CLASSIFICATION_HTTP_TIMEOUT,
+            CLASSIFICATION_HTTP_MAX_CONNECTIONS,
+            CLASSIFICATION_HTTP_MAX_CONNECTIONS,
+            loop=loop
+        )
+        self.headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {CLASSIFICATION_MODEL_API_KEY}'
+        }
+        self.batching_supported = self.batch_size > 1
+        self._pending = []  # (description, asyncio.Future) waiting for the next batch
+        self._timer = None
+
+        # Metrics
+        self.batches = 0
+        self.batched_predictions = 0
+        self.single_predictions = 0
+
+    async def predict(self, service_description):
+        """
+        Predict the category of a job description. Can be awaited from any event loop.
+
+        Args:
+            service_description (str): The job description.
+
+        Returns:
+            dict: The model response with category suggestions, or None if the prediction failed.
+        """
+        return await self.background_loop.run(self._predict(service_description))
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        self.http_client.close()
+
+    def stats(self):
+        """
+        Return the batching counters.
+
+        Returns:
+            dict: The client statistics.
+        """
+        return {
+            "batching_supported": self.batching_supported,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "batched_predictions": self.batched_predictions,
+            "single_predictions": self.single_predictions,
+        }
+
+    async def _predict(self, service_description):
+        if not self.batching_supported:
+            return await self._predict_one(service_description)
+
+        # Only touched on the background loop, so no lock is needed
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((service_description, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+        if batch:
+            asyncio.get_running_loop().create_task(self._send_batch(batch))
+
+    async def _send_batch(self, batch):
+        descriptions = [description for description, _ in batch]
+        try:
+            if len(batch) == 1 or not self.batching_supported:
+                results = await asyncio.gather(*(self._predict_one(description) for description in descriptions))
+            else:
+                results = await self._predict_batch(descriptions)
+        except Exception as e:
+            print(f"Error calling ML model API: {e}")
+            results = [None] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _predict_batch(self, descriptions):
+        response = await self.http_client.post(
+            f"{CLASSIFICATION_MODEL_API_URL}/predict_batch",
+            json={'service_descriptions': descriptions},
+            headers=self.headers
+        )
+        if response.status_code in BATCH_UNSUPPORTED_STATUSES:
+            print("Classification model has no batch endpoint; sending predictions one at a time.")
+            self.batching_supported = False
+            return await asyncio.gather(*(self._predict_one(description) for description in descriptions))
+
+        response.raise_for_status()
+        predictions = response.json().get('predictions', [])
+        if len(predictions) != len(descriptions):
+            raise ValueError(f"Expected {len(descriptions)} predictions, got {len(predictions)}")
+        self.batches += 1
+        self.batched_predictions += len(descriptions)
+        return predictions
+
+    async def _predict_one(self, service_description):
+        self.single_predictions += 1
+        try:
+            response = await self.http_client.post(
+                f"{CLASSIFICATION_MODEL_API_URL}/predict",
+                json={'service_description': service_description},
+                headers=self.headers
+            )
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            print(f"Error calling ML model API: {e}")
+            return None
+
+
+classification_client = ClassificationClient(CLASSIFICATION_BATCH_SIZE, CLASSIFICATION_BATCH_LINGER_MS)
@@ -1,26 +1,37 @@
 import json
 from google.cloud import dialogflowcx_v3 as dialogflow
+from google.cloud.dialogflowcx_v3.services.sessions.transports import SessionsGrpcAsyncIOTransport
 from google.oauth2 import service_account
-from config import DIALOGFLOW_CX_CREDENTIALS, DIALOGFLOW_CX_AGENTID, DIALOGFLOW_CX_LOCATION
+from utils.background_loop import background_loop
+from config import (
+    DIALOGFLOW_CX_CREDENTIALS, DIALOGFLOW_CX_AGENTID, DIALOGFLOW_CX_LOCATION,
+    DIALOGFLOW_TIMEOUT, DIALOGFLOW_KEEPALIVE_SECONDS
+)
 
 class DialogflowClient:
-    def __init__(self):
+    def __init__(self, loop=background_loop):
         """
         Initialize the DialogflowClient with the necessary credentials.
+
+        The async gRPC channel is bound to the loop that opens it, so it is opened once on the
+        background loop and every call runs there, whichever request loop awaits it.
+
+        Args:
+            loop (BackgroundLoop): The loop the gRPC channel runs on.
         """
         dialogflow_credentials = json.loads(DIALOGFLOW_CX_CREDENTIALS)
         self.dialogflow_project_id = dialogflow_credentials["project_id"]
         self.dialogflow_agent_id = DIALOGFLOW_CX_AGENTID
         self.dialogflow_location = DIALOGFLOW_CX_LOCATION
+        self.timeout = DIALOGFLOW_TIMEOUT
+        self.background_loop = loop
 
         # Create credentials from the service account info
-        credentials = service_account.Credentials.from_service_account_info(dialogflow_credentials)
-        client_options = {
-            "api_endpoint": "dialogflow.googleapis.com",
-        }
+        self.credentials = service_account.Credentials.from_service_account_info(dialogflow_credentials)
+        self.api_endpoint = "dialogflow.googleapis.com:443"
 
-        # Create a Dialogflow SessionsClient
-        self.client = dialogflow.SessionsClient(credentials=credentials, client_options=client_options)
+        # The SessionsAsyncClient is created on first use, on the background loop
+        self.client = None
 
     async def detect_intent(self, sender_message, recipient_number, chat_session_id=None):
         """
@@ -52,11 +63,49 @@ class DialogflowClient:
                     query_input=query_input,
                 )
 
-                # Detect the intent and return the result
-                response = self.client.detect_intent(request=request)
+                # Detect the intent on the shared channel and return the result
+                response = await self.background_loop.run(self._detect_intent(request))
                 return response.query_result
             else:
                 return None
         except Exception as e:
             print(f"Error detecting intent: {e}")
             return None
+
+    def warm_up(self):
+        """
+        Open the gRPC channel in the background so the first message skips the TLS and HTTP/2 handshake.
+
+        Returns:
+            concurrent.futures.Future: A future resolved once the channel is ready.
+        """
+        return self.background_loop.submit(self._warm_up())
+
+    async def _detect_intent(self, request):
+        client = self._get_client()
+        return await client.detect_intent(request=request, timeout=self.timeout)
+
+    async def _warm_up(self):
+        client = self._get_client()
+        try:
+            await client.transport.grpc_channel.channel_ready()
+        except Exception as e:
+            print(f"Error warming up Dialogflow channel: {e}")
+
+    def _get_client(self):
+        # Only called on the background loop, so no lock is needed
+        if self.client is None:
+            keepalive_ms = DIALOGFLOW_KEEPALIVE_SECONDS * 1000
+            channel = SessionsGrpcAsyncIOTransport.create_channel(
+                self.api_endpoint,
+                credentials=self.credentials,
+                options=[
+                    ("grpc.keepalive_time_ms", keepalive_ms),
+                    ("grpc.keepalive_timeout_ms", 10000),
+                    ("grpc.keepalive_permit_without_calls", 1),
+                    ("grpc.http2.max_pings_without_data", 0),
+                ],
+            )
+            transport = SessionsGrpcAsyncIOTransport(host=self.api_endpoint, channel=channel)
+            self.client = dialogflow.SessionsAsyncClient(transport=transport)
+        return self.client
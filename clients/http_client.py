@@ -0,0 +1,102 @@
+import httpx
+from utils.background_loop import background_loop
+from config import (
+    WHATSAPP_HTTP_TIMEOUT, WHATSAPP_HTTP_MAX_CONNECTIONS, WHATSAPP_HTTP_MAX_KEEPALIVE, WHATSAPP_HTTP2
+)
+
+class HttpClient:
+    def __init__(self, base_url, timeout, max_connections, max_keepalive, http2=False, loop=background_loop):
+        """
+        Initialize a pooled async HTTP client that keeps connections alive between requests.
+
+        The underlying httpx.AsyncClient is created on the background loop and every request
+        runs there, because pooled connections are bound to the loop that opened them.
+
+        Args:
+            base_url (str): The base URL requests are resolved against.
+            timeout (float): The default per-request timeout in seconds.
+            max_connections (int): The maximum number of open connections.
+            max_keepalive (int): The maximum number of idle connections kept open.
+            http2 (bool): Whether to negotiate HTTP/2 when the h2 package is installed.
+            loop (BackgroundLoop): The loop the client runs on.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.http2 = http2
+        self.background_loop = loop
+        self._client = None
+
+    async def post(self, url, **kwargs):
+        """
+        Send a POST request.
+
+        Args:
+            url (str): The URL, absolute or relative to the base URL.
+            **kwargs: Arguments passed to httpx, e.g. json, headers or timeout.
+
+        Returns:
+            httpx.Response: The response.
+
+        Raises:
+            httpx.HTTPError: If the request fails or times out.
+        """
+        return await self.request("POST", url, **kwargs)
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request on the shared connection pool. Can be awaited from any event loop.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL, absolute or relative to the base URL.
+            **kwargs: Arguments passed to httpx, e.g. json, headers or timeout.
+
+        Returns:
+            httpx.Response: The response.
+
+        Raises:
+            httpx.HTTPError: If the request fails or times out.
+        """
+        return await self.background_loop.run(self._request(method, url, **kwargs))
+
+    def close(self):
+        """
+        Close the pooled connections.
+        """
+        if self._client is not None:
+            try:
+                self.background_loop.submit(self._client.aclose()).result(5)
+            except Exception as e:
+                print(f"Error closing HTTP client: {e}")
+            self._client = None
+
+    async def _request(self, method, url, **kwargs):
+        if self._client is None:
+            self._client = self._create_client()
+        return await self._client.request(method, url, **kwargs)
+
+    def _create_client(self):
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1.")
+                http2 = False
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=http2
+        )
+
+
+# Shared by every WhatsAppClient so sends reuse warm TLS connections to the Graph API
+graph_api_client = HttpClient(
+    "https://graph.facebook.com",
+    WHATSAPP_HTTP_TIMEOUT,
+    WHATSAPP_HTTP_MAX_CONNECTIONS,
+    WHATSAPP_HTTP_MAX_KEEPALIVE,
+    http2=WHATSAPP_HTTP2
+)
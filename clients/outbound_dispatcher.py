@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import random
+import threading
+from datetime import datetime, timezone
+import httpx
+from clients.whatsapp_client import WhatsAppClient
+from utils.general_utils import GeneralUtils
+from utils.work_queue import WorkQueue
+from config import (
+    OUTBOUND_QUEUE_MAX_SIZE, OUTBOUND_QUEUE_WORKERS, OUTBOUND_MAX_ATTEMPTS,
+    OUTBOUND_RETRY_BASE_DELAY, OUTBOUND_RETRY_MAX_DELAY, OUTBOUND_DEAD_LETTER_PATH
+)
+
+class OutboundDispatcher:
+    def __init__(self, max_size, workers, max_attempts, base_delay, max_delay, dead_letter_path):
+        """
+        Initialize a queue of outbound WhatsApp messages delivered by background workers,
+        retried with jittered exponential backoff and dead-lettered when they keep failing.
+
+        Args:
+            max_size (int): The maximum number of queued messages before senders deliver inline.
+            workers (int): The number of concurrent delivery workers.
+            max_attempts (int): The number of delivery attempts per message.
+            base_delay (float): The backoff ceiling in seconds after the first failed attempt.
+            max_delay (float): The largest backoff ceiling in seconds.
+            dead_letter_path (str): The JSON Lines file undeliverable messages are appended to.
+        """
+        self.whatsapp_client = WhatsAppClient()
+        self.queue = WorkQueue("outbound", max_size, workers)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.dead_letter_path = dead_letter_path
+        self._dead_letter_lock = threading.Lock()
+
+        # Metrics
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def start(self):
+        """
+        Start the delivery workers.
+        """
+        self.queue.start()
+
+    def shutdown(self, timeout=30):
+        """
+        Stop accepting messages and wait up to timeout seconds for queued ones to be delivered.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait.
+        """
+        self.queue.shutdown(timeout)
+
+    async def send(self, to_number, message, message_type='text'):
+        """
+        Queue a message for delivery without waiting on the WhatsApp API.
+        When the queue is full or not running the message is delivered inline instead.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            message (str): The message to send.
+            message_type (str): The type of message ('text' or 'interactive').
+
+        Returns:
+            bool: True if the message was queued or delivered, False if it was dead-lettered.
+        """
+        if self.queue.enqueue(self.deliver, to_number, message, message_type):
+            return True
+        return await self.deliver(to_number, message, message_type)
+
+    async def deliver(self, to_number, message, message_type='text'):
+        """
+        Deliver a message, retrying rate limits (429), server errors (5xx) and network errors.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            message (str): The message to send.
+            message_type (str): The type of message ('text' or 'interactive').
+
+        Returns:
+            bool: True if the message was delivered, False if it was dead-lettered.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after = None
+            try:
+                response = await self.whatsapp_client.post_message(to_number, message, message_type)
+                if response.status_code == 200:
+                    self.delivered += 1
+                    return True
+                error = f"{response.status_code} - {response.text}"
+                retryable = response.status_code == 429 or response.status_code >= 500
+                retry_after = response.headers.get("Retry-After")
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = True
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                retryable = False
+
+            if not retryable or attempt == self.max_attempts:
+                break
+
+            self.retried += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+        self._dead_letter(to_number, message, message_type, attempt, error)
+        return False
+
+    def stats(self):
+        """
+        Return queue and delivery counters.
+
+        Returns:
+            dict: The dispatcher statistics.
+        """
+        return {
+            "queue": self.queue.stats(),
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "rate_limiter": self.whatsapp_client.rate_limiter.stats(),
+        }
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        try:
+            return max(delay, min(float(retry_after), self.max_delay)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def _dead_letter(self, to_number, message, message_type, attempts, error):
+        self.dead_lettered += 1
+        print(f"Dead-lettering WhatsApp message after {attempts} attempt(s): {error}")
+        # Phone numbers and message bodies are kept AES-encrypted at rest, like the users table
+        utils = GeneralUtils()
+        record = {
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+            "to": utils.encrypt_aes(str(to_number)),
+            "message_type": message_type,
+            "message": utils.encrypt_aes(json.dumps(message, default=str)),
+            "attempts": attempts,
+            "error": error,
+        }
+        try:
+            with self._dead_letter_lock:
+                directory = os.path.dirname(self.dead_letter_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as dead_letter_file:
+                    dead_letter_file.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"Error writing dead-letter log: {e}")
+
+
+outbound_dispatcher = OutboundDispatcher(
+    OUTBOUND_QUEUE_MAX_SIZE,
+    OUTBOUND_QUEUE_WORKERS,
+    OUTBOUND_MAX_ATTEMPTS,
+    OUTBOUND_RETRY_BASE_DELAY,
+    OUTBOUND_RETRY_MAX_DELAY,
+    OUTBOUND_DEAD_LETTER_PATH
+)
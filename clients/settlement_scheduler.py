@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from clients.stripe_outbox import stripe_outbox
+from database.repositories import StripeOperationRepository, StripeUserRepository
+from utils.background_loop import background_loop
+from config import SETTLEMENT_WINDOW_SECONDS, SETTLEMENT_MAX_JOBS, SETTLEMENT_MAX_JOBS_PER_TRANSFER
+
+class SettlementScheduler:
+    def __init__(self, window_seconds, max_jobs, jobs_per_transfer, outbox=stripe_outbox, loop=background_loop):
+        """
+        Initialize a scheduler that pays out completed jobs in settlements rather than one by one.
+
+        At the end of every window the paid jobs not yet paid out, whose seeker's Stripe account can
+        receive transfers, are claimed into a settlement, funded by a single top-up, and paid out
+        with one transfer per connected account. The top-up and transfers run through the Stripe
+        outbox, and each job's payment_transfer_id holds the settlement key until its transfer
+        succeeds, then the transfer ID. A settlement that fails returns its jobs to the next one.
+
+        Args:
+            window_seconds (int): The number of seconds between settlements.
+            max_jobs (int): The maximum number of jobs in one settlement; the rest go in another.
+            jobs_per_transfer (int): The maximum number of jobs paid out by one transfer.
+            outbox (StripeOutbox): The outbox executing the top-ups and transfers.
+            loop (BackgroundLoop): The loop the scheduler runs on.
+        """
+        self.window_seconds = window_seconds
+        self.max_jobs = max_jobs
+        self.jobs_per_transfer = jobs_per_transfer
+        self.outbox = outbox
+        self.background_loop = loop
+        self._stop = None
+        self._worker = None
+
+        # Metrics
+        self.settlements = 0
+        self.settled_jobs = 0
+        self.last_settlement_at = None
+
+    def start(self):
+        """
+        Start settling on the background loop at the end of every window.
+        """
+        if self._worker is None:
+            self._worker = self.background_loop.submit(self._run())
+
+    def shutdown(self, timeout=30):
+        """
+        Stop the scheduler. Recorded settlements stay in the outbox and are finished on the next start.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for a running settlement.
+        """
+        if self._worker is None:
+            return
+        if self._stop is not None:
+            self.background_loop.call_soon(self._stop.set)
+        try:
+            self._worker.result(timeout)
+        except Exception as e:
+            print(f"Error stopping settlement scheduler: {e}")
+        self._worker = None
+
+    async def settle(self):
+        """
+        Settle every paid job not yet paid out, in settlements of at most max_jobs jobs. Jobs whose
+        seeker's Stripe account cannot receive transfers yet wait for a later settlement.
+
+        Returns:
+            int: The number of jobs settled.
+        """
+        # Seekers who finished onboarding since the last settlement are paid out in this one
+        for account_id in await StripeUserRepository.get_accounts_awaiting_payouts(self.max_jobs):
+            try:
+                await self.outbox.refresh_payout_account(account_id)
+            except Exception as e:
+                print(f"Error checking Stripe account {account_id}: {e}")
+
+        settled_jobs = 0
+        while True:
+            settlement_key = f"settlement-{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+            stripe_operation = await StripeOperationRepository.enqueue_settlement(
+                settlement_key, self.max_jobs, self.jobs_per_transfer
+            )
+            if not stripe_operation:
+                break
+
+            transfers = json.loads(stripe_operation.payload)["transfers"]
+            job_count = sum(len(transfer["job_ids"]) for transfer in transfers)
+            print(f"Settlement {settlement_key}: {job_count} jobs in {len(transfers)} transfers.")
+            self.settlements += 1
+            self.settled_jobs += job_count
+            self.last_settlement_at = datetime.now(timezone.utc).isoformat()
+            settled_jobs += job_count
+            self.outbox.wake()
+            if job_count < self.max_jobs:
+                break
+        return settled_jobs
+
+    def stats(self):
+        """
+        Return the settlement counters of this process.
+
+        Returns:
+            dict: The scheduler statistics.
+        """
+        return {
+            "running": self._worker is not None,
+            "window_seconds": self.window_seconds,
+            "settlements": self.settlements,
+            "settled_jobs": self.settled_jobs,
+            "last_settlement_at": self.last_settlement_at,
+        }
+
+    async def _run(self):
+        self._stop = asyncio.Event()
+        while not self._stop.is_set():
+            # Windows end on multiples of window_seconds, so every worker settles at the same time
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.window_seconds - time.time() % self.window_seconds)
+                break
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.settle()
+            except Exception as e:
+                print(f"Error settling jobs: {e}")
+
+
+settlement_scheduler = SettlementScheduler(SETTLEMENT_WINDOW_SECONDS, SETTLEMENT_MAX_JOBS, SETTLEMENT_MAX_JOBS_PER_TRANSFER)
@@ -1,36 +1,109 @@
-from config import STRIPE_SECRET_KEY, WEBSITE_URL
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    STRIPE_SECRET_KEY, WEBSITE_URL, STRIPE_EXECUTOR_WORKERS, STRIPE_HTTP_TIMEOUT,
+    STRIPE_CALL_TIMEOUT, STRIPE_MAX_NETWORK_RETRIES
+)
 import stripe
-from database.repositories import StripeUserRepository
+from database.repositories import StripeUserRepository, UserRepository
 from utils.general_utils import GeneralUtils
 
+# The Stripe SDK is blocking, so its calls run on a bounded pool of their own threads. The
+# requests-based HTTP client keeps one keep-alive session per thread, so the pool also bounds
+# the connections to Stripe.
+stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_HTTP_TIMEOUT)
+stripe.max_network_retries = STRIPE_MAX_NETWORK_RETRIES
+stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_EXECUTOR_WORKERS, thread_name_prefix="stripe")
+
 class StripeClient:
     def __init__(self):
         """
         Initialize the StripeClient with the necessary credentials.
         """
         self.website_url = WEBSITE_URL
+        self.timeout = STRIPE_CALL_TIMEOUT
         stripe.api_key = STRIPE_SECRET_KEY
 
+    async def call(self, function, *args, **kwargs):
+        """
+        Run a blocking Stripe SDK call on the Stripe executor, so the event loop keeps serving
+        other requests, and give up after STRIPE_CALL_TIMEOUT seconds including retries.
+
+        Args:
+            function (callable): The Stripe SDK function, e.g. stripe.Customer.create.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            The function's result.
+
+        Raises:
+            stripe.error.StripeError: If Stripe rejects the call.
+            asyncio.TimeoutError: If the call misses its deadline.
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(stripe_executor, functools.partial(function, *args, **kwargs)),
+            self.timeout
+        )
+
+    async def retrieve_checkout_session(self, session_id):
+        """
+        Retrieve a Stripe checkout session.
+
+        :param session_id: Stripe checkout session ID.
+        :return: Stripe checkout session object.
+        """
+        try:
+            return await self.call(stripe.checkout.Session.retrieve, session_id)
+        except stripe.error.StripeError as e:
+            print(f"Error retrieving checkout session: {e.user_message}")
+            raise e
+
+    async def get_customer_id(self, user):
+        """
+        Return the user's Stripe customer ID from the database, calling Stripe only the first time.
+
+        :param user: User object with a decrypted phone number.
+        :return: Stripe customer ID.
+        """
+        if user.stripe_customer_id:
+            return user.stripe_customer_id
+
+        customer = await self.create_or_retrieve_customer({
+            "name": user.name,
+            "phone_number": user.phone_number,
+            "user_id": user.id
+        })
+        stored_customer_id = await UserRepository.set_stripe_customer_id(user.id, customer.id)
+        return stored_customer_id or customer.id
+
     async def create_or_retrieve_customer(self, customer_data):
         """
         Create a new Stripe customer or retrieve an existing one based on the provided phone number.
 
-        :param customer_data: Dictionary containing 'name' and 'phone_number' keys.
+        :param customer_data: Dictionary containing 'name', 'phone_number' and optionally 'user_id' keys.
         :return: Stripe customer object.
         """
         try:
             # Query Stripe for existing customers with the given phone number
             query = f"phone:'{customer_data['phone_number']}'"
-            customers =  stripe.Customer.search(query=query, limit=1)
+            customers = await self.call(stripe.Customer.search, query=query, limit=1)
             
             if customers['data']:
                 # Return the first customer if found
                 return customers['data'][0]
 
-            # Create a new customer if none found
-            new_customer = stripe.Customer.create(
+            # Create a new customer if none found; search lags behind creation, so the
+            # idempotency key stops a second request from creating a duplicate meanwhile
+            user_id = customer_data.get('user_id')
+            user_params = {'metadata': {'user_id': user_id}, 'idempotency_key': f"customer-user-{user_id}"} if user_id else {}
+            new_customer = await self.call(
+                stripe.Customer.create,
                 name=customer_data['name'],
-                phone=customer_data['phone_number']
+                phone=customer_data['phone_number'],
+                **user_params
             )
             
             return new_customer
@@ -47,7 +120,8 @@ class StripeClient:
         """
         try:
             # Create the checkout session
-            checkout_session = stripe.checkout.Session.create(
+            checkout_session = await self.call(
+                stripe.checkout.Session.create,
                 line_items=[{
                     'price_data': {
                         'currency': 'usd',
@@ -88,19 +162,24 @@ class StripeClient:
             print(f"Error stripe create checkout session: {e.user_message}")
             raise e
 
-    async def create_connect_account(self):
+    async def create_connect_account(self, user_id=None, idempotency_key=None):
         """
         Create a Stripe Connect Express Account.
 
+        :param user_id: Optional ID of the user the account is for, stored in its metadata.
+        :param idempotency_key: Optional key so a retried request does not create a second account.
         :return: Stripe Connect account object.
         """
         try:
-            connect_account = stripe.Account.create(
+            connect_account = await self.call(
+                stripe.Account.create,
                 type='express',
                 country='US',
                 capabilities={
                     'transfers': {'requested': True},
                 },
+                **({'metadata': {'user_id': user_id}} if user_id else {}),
+                **self._request_options(idempotency_key)
             )
             return connect_account
         except stripe.error.StripeError as e:
@@ -140,7 +219,7 @@ class StripeClient:
             stripe_user_id = utils.decrypt_aes_url_safe(encrypted_account_id)
 
             # Check if the account exists in the database
-            existing_connect_account = StripeUserRepository.get_stripe_user_by_stripe_user_id(stripe_user_id)
+            existing_connect_account = StripeUserRepository.get_stripe_user_by_stripe_user_id_sync(stripe_user_id)
 
             if existing_connect_account:
                 # Create and return a new Connect Account onboarding link
@@ -163,7 +242,7 @@ class StripeClient:
             dict: Stripe account details.
         """
         try:
-            account = stripe.Account.retrieve(account_id)
+            account = await self.call(stripe.Account.retrieve, account_id)
             return account
         except Exception as e:
             print(f"Error retrieving connected account: {e}")
@@ -186,44 +265,65 @@ class StripeClient:
             print(f"Error creating login link: {e}")
             raise e
         
-    async def capture_payment(self, payment_intent_id, amount, posting_fee, job_id):
+    async def capture_payment_intent(self, payment_intent_id, amount_to_capture, idempotency_key=None):
         """
-        Capture a payment from the job poster and create a top-up for the net amount to be paid to the job seeker.
+        Capture an authorized payment from the job poster.
 
         Args:
             payment_intent_id (str): The Payment Intent ID.
-            amount (float): The total payment amount.
-            posting_fee (float): The fee for posting the job.
-            job_id (int): The job ID.
+            amount_to_capture (int): The amount to capture, in cents.
+            idempotency_key (str, optional): Key so a retried request captures once.
 
         Returns:
-            dict: Captured payment details.
+            dict: The captured Payment Intent.
         """
         try:
-            # Step 1: Calculate the total amount to capture and the net amount for the top-up
-            amount_to_capture = int((amount + posting_fee) * 100)
-            net_amount = int((amount - posting_fee) * 100)
-
-            # Step 2: Capture the payment from the job poster
-            captured_payment = stripe.PaymentIntent.capture(
+            return await self.call(
+                stripe.PaymentIntent.capture,
                 payment_intent_id,
-                amount_to_capture=amount_to_capture
+                amount_to_capture=amount_to_capture,
+                **self._request_options(idempotency_key)
             )
+        except stripe.error.StripeError as e:
+            print(f"Error capturing payment: {e.user_message}")
+            raise e
 
-            if captured_payment and captured_payment['status'] == 'succeeded':
-                # Step 3: Create a top-up for the net amount to pay the job seeker
-                top_up = stripe.Topup.create(
-                    amount=net_amount,
-                    currency='usd',
-                    description=f"Top-up for #{str(job_id).zfill(5)} job payout",
-                    statement_descriptor="Payout top-up"
-                )
-            return captured_payment
-        
-        except Exception as ex:
-            # Log general exceptions
-            print(f"An unexpected error occurred: {str(ex)}")
-            raise ex
+    async def retrieve_payment_intent(self, payment_intent_id):
+        """
+        Retrieve a Payment Intent.
+
+        Args:
+            payment_intent_id (str): The Payment Intent ID.
+
+        Returns:
+            dict: The Payment Intent.
+        """
+        return await self.call(stripe.PaymentIntent.retrieve, payment_intent_id)
+
+    async def create_topup(self, amount, description, idempotency_key=None):
+        """
+        Create a top-up of the platform balance for the net amounts to be paid to job seekers.
+
+        Args:
+            amount (int): The top-up amount, in cents.
+            description (str): What the top-up funds, e.g. a job or a settlement.
+            idempotency_key (str, optional): Key so a retried request tops up once.
+
+        Returns:
+            dict: The top-up.
+        """
+        try:
+            return await self.call(
+                stripe.Topup.create,
+                amount=amount,
+                currency='usd',
+                description=description,
+                statement_descriptor="Payout top-up",
+                **self._request_options(idempotency_key)
+            )
+        except stripe.error.StripeError as e:
+            print(f"Error creating top-up: {e.user_message}")
+            raise e
 
     async def create_payout(self, account_id, amount, posting_fee, job_id):
         """
@@ -243,7 +343,8 @@ class StripeClient:
             net_amount = int((amount - posting_fee) * 100)
 
             # Create the payout to the connected account
-            transfer = stripe.Transfer.create(
+            transfer = await self.call(
+                stripe.Transfer.create,
                 amount=net_amount,
                 currency='usd',
                 description=f"Payment for #{str(job_id).zfill(5)} job",
@@ -255,3 +356,56 @@ class StripeClient:
         except Exception as ex:
             print(f"Unexpected error during payout creation: {str(ex)}")
             raise ex
+
+    async def create_transfer(self, account_id, amount, job_ids, transfer_group, idempotency_key=None):
+        """
+        Transfer the net amount of one or more completed jobs to a connected account.
+
+        Args:
+            account_id (str): Stripe Connect Account ID.
+            amount (int): The transfer amount, in cents.
+            job_ids (list): The IDs of the jobs paid out.
+            transfer_group (str): The group the transfer belongs to, e.g. its settlement.
+            idempotency_key (str, optional): Key so a retried request transfers once.
+
+        Returns:
+            dict: The transfer.
+        """
+        try:
+            return await self.call(
+                stripe.Transfer.create,
+                amount=amount,
+                currency='usd',
+                description=f"Payment for #{str(job_ids[0]).zfill(5)} job" if len(job_ids) == 1 else f"Payment for {len(job_ids)} jobs",
+                destination=account_id,
+                transfer_group=transfer_group,
+                metadata={'job_ids': ','.join(str(job_id) for job_id in job_ids)},
+                **self._request_options(idempotency_key)
+            )
+        except stripe.error.StripeError as e:
+            print(f"Error creating transfer: {e.user_message}")
+            raise e
+
+    async def find_transfer(self, account_id, job_ids, transfer_group):
+        """
+        Find the transfer of a group that paid out the given jobs, e.g. to check whether a request
+        that timed out went through.
+
+        Args:
+            account_id (str): Stripe Connect Account ID.
+            job_ids (list): The IDs of the jobs paid out.
+            transfer_group (str): The group the transfer belongs to.
+
+        Returns:
+            dict: The transfer, or None if there is none.
+        """
+        transfers = await self.call(stripe.Transfer.list, destination=account_id, transfer_group=transfer_group, limit=100)
+        job_ids_metadata = ','.join(str(job_id) for job_id in job_ids)
+        for transfer in transfers.data:
+            if (transfer.get('metadata') or {}).get('job_ids') == job_ids_metadata:
+                return transfer
+        return None
+
+    @staticmethod
+    def _request_options(idempotency_key):
+        return {'idempotency_key': idempotency_key} if idempotency_key else {}
@@ -0,0 +1,355 @@
+import asyncio
+import datetime
+import json
+import random
+import stripe
+from clients.stripe_client import StripeClient
+from clients.outbound_dispatcher import outbound_dispatcher
+from database.repositories import JobRepository, StripeOperationRepository, StripeUserRepository, UserRepository
+from utils.background_loop import background_loop
+from utils.rate_limiter import RateLimiter
+from config import (
+    STRIPE_OUTBOX_POLL_SECONDS, STRIPE_OUTBOX_BATCH_SIZE, STRIPE_OUTBOX_LEASE_SECONDS,
+    STRIPE_OUTBOX_MAX_ATTEMPTS, STRIPE_OUTBOX_RETRY_BASE_DELAY, STRIPE_OUTBOX_RETRY_MAX_DELAY,
+    SETTLEMENT_TRANSFERS_PER_SECOND, SETTLEMENT_TRANSFER_DELAY, SETTLEMENT_FUNDING_RETRY_SECONDS
+)
+
+# Stripe errors worth retrying; anything else (card, invalid request, auth) fails the operation
+RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError, asyncio.TimeoutError)
+
+class RetryLater(Exception):
+    def __init__(self, message, delay):
+        """
+        Raised by a handler whose operation cannot run yet, e.g. a transfer waiting on its top-up.
+        The operation is rescheduled after delay seconds, and the attempt is taken back so waiting
+        never uses up the attempts left for real errors.
+        """
+        super().__init__(message)
+        self.delay = delay
+
+class StripeOutbox:
+    def __init__(self, poll_interval, batch_size, lease_seconds, max_attempts, base_delay, max_delay, loop=background_loop):
+        """
+        Initialize a durable outbox of money-moving Stripe operations.
+
+        Operations are recorded in the stripe_operations table with an idempotency key, then
+        executed by a worker on the background loop, retried with jittered exponential backoff
+        and reported back to the job. A retry, or a second worker after a crash, reuses the key,
+        so Stripe performs each operation once.
+
+        Args:
+            poll_interval (float): The seconds between polls for due operations.
+            batch_size (int): The maximum number of operations executed at once.
+            lease_seconds (float): The seconds a claimed operation is reserved before another worker may retry it.
+            max_attempts (int): The number of attempts before an operation fails.
+            base_delay (float): The backoff ceiling in seconds after the first failed attempt.
+            max_delay (float): The largest backoff ceiling in seconds.
+            loop (BackgroundLoop): The loop the worker runs on.
+        """
+        self.stripe_client = StripeClient()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.background_loop = loop
+        self.handlers = {
+            "capture_payment": self._capture_payment,
+            "create_topup": self._create_topup,
+            "create_connect_account": self._create_connect_account,
+            "create_settlement_topup": self._create_settlement_topup,
+            "create_transfer": self._create_transfer,
+        }
+        # Called when an operation fails for good, so its jobs are not left waiting on it
+        self.failure_handlers = {
+            "capture_payment": self._alert_capture_failure,
+            "create_settlement_topup": self._release_settlement,
+            "create_transfer": self._release_transfer,
+        }
+        # Transfers to connected accounts are paced under Stripe's API rate limit
+        self.transfer_limiter = RateLimiter(SETTLEMENT_TRANSFERS_PER_SECOND, 1)
+        self._wakeup = None
+        self._worker = None
+        self._stopping = False
+
+        # Metrics
+        self.succeeded = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Start the outbox worker on the background loop.
+        """
+        if self._worker is None:
+            self._stopping = False
+            self._worker = self.background_loop.submit(self._run())
+
+    def shutdown(self, timeout=30):
+        """
+        Stop the worker after its current batch. Unfinished operations stay in the table and
+        are picked up on the next start.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for the current batch.
+        """
+        if self._worker is None:
+            return
+        self._stopping = True
+        self.wake()
+        try:
+            self._worker.result(timeout)
+        except Exception as e:
+            print(f"Error stopping Stripe outbox: {e}")
+        self._worker = None
+
+    async def enqueue(self, idempotency_key, operation, payload, job_id=None, run_at=None):
+        """
+        Record a Stripe operation and wake the worker to execute it.
+
+        Args:
+            idempotency_key (str): The Stripe idempotency key, unique per operation.
+            operation (str): One of the operations in self.handlers, e.g. "capture_payment".
+            payload (dict): The operation arguments.
+            job_id (int, optional): The job the operation belongs to.
+            run_at (datetime, optional): The earliest time the operation is executed; defaults to now.
+
+        Returns:
+            bool: True if the operation is recorded, including by an earlier call with the same key.
+        """
+        stripe_operation = await StripeOperationRepository.enqueue_operation(
+            idempotency_key, operation, json.dumps(payload), job_id, run_at
+        )
+        if stripe_operation:
+            self.wake()
+        return stripe_operation is not None
+
+    def wake(self):
+        """
+        Make the worker poll now rather than at its next interval.
+        """
+        if self._wakeup is not None:
+            self.background_loop.call_soon(self._wakeup.set)
+
+    def stats(self):
+        """
+        Return the outbox counters of this process.
+
+        Returns:
+            dict: The outbox statistics.
+        """
+        return {
+            "running": self._worker is not None,
+            "succeeded": self.succeeded,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        while not self._stopping:
+            operations = await StripeOperationRepository.claim_due_operations(self.batch_size, self.lease_seconds)
+            if operations:
+                await asyncio.gather(*(self._execute(operation) for operation in operations))
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, operation):
+        handler = self.handlers.get(operation.operation)
+        if handler is None:
+            print(f"Unknown Stripe operation {operation.operation} ({operation.idempotency_key}).")
+            await StripeOperationRepository.finish_operation(operation.id, "failed", error="Unknown operation")
+            self.failed += 1
+            return
+
+        payload = json.loads(operation.payload)
+        try:
+            result_id = await handler(operation, payload)
+        except RetryLater as e:
+            retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=e.delay)
+            print(f"Deferring Stripe operation {operation.idempotency_key}: {e}")
+            await StripeOperationRepository.finish_operation(
+                operation.id, "pending", error=str(e), retry_at=retry_at, deferred=True
+            )
+            self.retried += 1
+            return
+        except Exception as e:
+            if isinstance(e, RETRYABLE_ERRORS) and operation.attempts < self.max_attempts:
+                ceiling = min(self.max_delay, self.base_delay * 2 ** (operation.attempts - 1))
+                retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=random.uniform(0, ceiling))
+                print(f"Retrying Stripe operation {operation.idempotency_key} after error: {e}")
+                await StripeOperationRepository.finish_operation(operation.id, "pending", error=str(e), retry_at=retry_at)
+                self.retried += 1
+            else:
+                print(f"Stripe operation {operation.idempotency_key} failed: {e}")
+                await StripeOperationRepository.finish_operation(operation.id, "failed", error=str(e))
+                self.failed += 1
+                failure_handler = self.failure_handlers.get(operation.operation)
+                if failure_handler:
+                    try:
+                        await failure_handler(operation, payload)
+                    except Exception as failure_error:
+                        print(f"Error handling failed Stripe operation {operation.idempotency_key}: {failure_error}")
+            return
+
+        await StripeOperationRepository.finish_operation(operation.id, "succeeded", result_id=result_id)
+        self.succeeded += 1
+
+    async def _capture_payment(self, operation, payload):
+        try:
+            captured_payment = await self.stripe_client.capture_payment_intent(
+                payload["payment_intent_id"], payload["amount_to_capture"], operation.idempotency_key
+            )
+        except stripe.error.InvalidRequestError:
+            # Captured by an attempt whose idempotency key has since expired
+            captured_payment = await self.stripe_client.retrieve_payment_intent(payload["payment_intent_id"])
+            if captured_payment["status"] != "succeeded":
+                raise
+
+        if captured_payment["status"] == "succeeded":
+            # The settlement scheduler funds and pays out paid jobs in its next window. Retried with the
+            # same idempotency key, so a failed update does not capture the payment twice
+            if not await JobRepository.update_job({"id": payload["job_id"]}, {"payment_status": "paid"}):
+                raise stripe.error.APIError("Failed to mark the job as paid.")
+        return captured_payment["id"]
+
+    async def _alert_capture_failure(self, operation, payload):
+        # E.g. an authorization that expired before the job was completed, or a captured payment whose
+        # job could not be marked as paid; either way the job is never paid out
+        print(
+            f"ALERT: capture of payment {payload['payment_intent_id']} for job #{str(payload['job_id']).zfill(5)} "
+            f"failed: {operation.idempotency_key} needs attention."
+        )
+
+    async def _create_topup(self, operation, payload):
+        # Per-job top-ups recorded before settlements replaced them
+        top_up = await self.stripe_client.create_topup(
+            payload["amount"], f"Top-up for #{str(payload['job_id']).zfill(5)} job payout", operation.idempotency_key
+        )
+        return top_up["id"]
+
+    async def _create_settlement_topup(self, operation, payload):
+        settlement = payload["settlement"]
+        top_up = await self.stripe_client.create_topup(
+            payload["amount"], f"Top-up for settlement {settlement}", operation.idempotency_key
+        )
+
+        # Pay out each connected account once the top-up had time to become available
+        run_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=SETTLEMENT_TRANSFER_DELAY)
+        for index, transfer in enumerate(payload["transfers"]):
+            recorded = await self.enqueue(
+                f"{settlement}-transfer-{index}",
+                "create_transfer",
+                dict(transfer, settlement=settlement),
+                run_at=run_at
+            )
+            if not recorded:
+                # Retried with the same keys: Stripe returns the same top-up, transfers already recorded are kept
+                raise stripe.error.APIError("Failed to record the settlement transfers.")
+        return top_up["id"]
+
+    async def _create_transfer(self, operation, payload):
+        await self.transfer_limiter.acquire("transfers")
+        try:
+            transfer = await self.stripe_client.create_transfer(
+                payload["account_id"], payload["amount"], payload["job_ids"], payload["settlement"], operation.idempotency_key
+            )
+        except stripe.error.InvalidRequestError as e:
+            if e.code != "balance_insufficient":
+                # Typically an account that can no longer receive transfers; its jobs wait until it can
+                await self.refresh_payout_account(payload["account_id"])
+                raise
+            raise RetryLater("The settlement top-up is not available yet.", SETTLEMENT_FUNDING_RETRY_SECONDS)
+
+        await JobRepository.record_payment_transfer(payload["job_ids"], payload["settlement"], transfer["id"])
+        return transfer["id"]
+
+    async def _release_settlement(self, operation, payload):
+        settlement = payload["settlement"]
+        transfer_keys = [f"{settlement}-transfer-{index}" for index in range(len(payload["transfers"]))]
+        recorded_keys = await StripeOperationRepository.get_recorded_keys(transfer_keys)
+        if recorded_keys is None:
+            print(f"ALERT: settlement {settlement} failed and its jobs could not be released.")
+            return
+
+        # Transfers already recorded still run and pay out their jobs
+        job_ids = [
+            job_id
+            for key, transfer in zip(transfer_keys, payload["transfers"]) if key not in recorded_keys
+            for job_id in transfer["job_ids"]
+        ]
+        released = await JobRepository.release_settlement_jobs(job_ids, settlement) if job_ids else 0
+        print(f"ALERT: settlement {settlement} failed; {released} jobs released to the next settlement.")
+
+    async def _release_transfer(self, operation, payload):
+        # A request that timed out may have gone through; paying the jobs again would pay them twice
+        transfer = await self.stripe_client.find_transfer(payload["account_id"], payload["job_ids"], payload["settlement"])
+        if transfer:
+            await JobRepository.record_payment_transfer(payload["job_ids"], payload["settlement"], transfer["id"])
+            await StripeOperationRepository.finish_operation(operation.id, "succeeded", result_id=transfer["id"])
+            self.failed -= 1
+            self.succeeded += 1
+            return
+
+        released = await JobRepository.release_settlement_jobs(payload["job_ids"], payload["settlement"])
+        print(
+            f"ALERT: transfer {operation.idempotency_key} to {payload['account_id']} failed; "
+            f"{released} jobs released to the next settlement."
+        )
+
+    async def refresh_payout_account(self, account_id):
+        """
+        Check with Stripe whether a connected account can receive transfers, and record it.
+
+        Args:
+            account_id (str): The Stripe Connect account ID.
+
+        Returns:
+            bool: True if the account can receive transfers.
+        """
+        account = await self.stripe_client.get_connected_account(account_id)
+        payouts_enabled = bool(account.get("payouts_enabled")) and (account.get("capabilities") or {}).get("transfers") == "active"
+        await StripeUserRepository.set_payouts_enabled(account_id, payouts_enabled)
+        return payouts_enabled
+
+    async def _create_connect_account(self, operation, payload):
+        user_id = payload["user_id"]
+        stripe_user = await StripeUserRepository.get_stripe_user_by_user_id(user_id)
+        if stripe_user:
+            account_id = stripe_user.stripe_user_id
+        else:
+            # Keyed by user, so one account is created however many jobs the seeker completes
+            connect_account = await self.stripe_client.create_connect_account(user_id, f"user-{user_id}-connect-account")
+            if not await StripeUserRepository.create_stripe_user(user_id=user_id, stripe_user_id=connect_account["id"]):
+                raise stripe.error.APIError("Failed to save the Stripe Connect account.")
+            account_id = connect_account["id"]
+
+        if await self.refresh_payout_account(account_id) or not payload.get("send_setup_link"):
+            return account_id
+
+        # Settlements skip the seeker's jobs until onboarding is finished, so send them the link
+        seeker = await UserRepository.get_user_by_id(user_id)
+        if seeker:
+            setup_link = await self.stripe_client.call(self.stripe_client.create_connect_account_link, account_id)
+            await outbound_dispatcher.send(
+                seeker.phone_number,
+                "💳 To receive your payout for job ID "
+                f"#{str(payload['job_id']).zfill(5)}, complete your Stripe account setup: {setup_link['url']}"
+            )
+        return account_id
+
+
+stripe_outbox = StripeOutbox(
+    STRIPE_OUTBOX_POLL_SECONDS,
+    STRIPE_OUTBOX_BATCH_SIZE,
+    STRIPE_OUTBOX_LEASE_SECONDS,
+    STRIPE_OUTBOX_MAX_ATTEMPTS,
+    STRIPE_OUTBOX_RETRY_BASE_DELAY,
+    STRIPE_OUTBOX_RETRY_MAX_DELAY
+)
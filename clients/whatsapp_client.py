@@ -1,6 +1,17 @@
-import requests
-from config import WHATSAPP_TOKEN, LANGUAGE, WHATSAPP_CHATBOT_PHONE_NUMBER
-from asgiref.sync import sync_to_async
+import asyncio
+import json
+import httpx
+from config import (
+    WHATSAPP_TOKEN, LANGUAGE, WHATSAPP_CHATBOT_PHONE_NUMBER, WHATSAPP_SEND_RATE, WHATSAPP_SEND_BURST,
+    WHATSAPP_BROADCAST_CONCURRENCY
+)
+from clients.http_client import graph_api_client
+from database.repositories import UserRepository
+from clients.whatsapp_templates import whatsapp_templates
+from utils.rate_limiter import RateLimiter
+
+# Cloud API throughput is limited per business phone number ID, so every client shares one limiter
+whatsapp_rate_limiter = RateLimiter(WHATSAPP_SEND_RATE, WHATSAPP_SEND_BURST)
 
 class WhatsAppClient:
     def __init__(self):
@@ -10,6 +21,14 @@ class WhatsAppClient:
         self.whatsapp_token = WHATSAPP_TOKEN
         self.language = LANGUAGE
         self.whatsapp_chatbot_phone_number = WHATSAPP_CHATBOT_PHONE_NUMBER
+        self.http_client = graph_api_client
+        self.rate_limiter = whatsapp_rate_limiter
+        self.templates = whatsapp_templates
+        self.messages_url = f"/v19.0/{self.whatsapp_chatbot_phone_number}/messages"
+        self.headers = {
+            "Authorization": f"Bearer {self.whatsapp_token}",
+            "Content-Type": "application/json",
+        }
 
     async def send_whatsapp_message(self, to_number, message, message_type='text'):
         """
@@ -22,28 +41,132 @@ class WhatsAppClient:
 
         Returns:
             bool: True if the message was sent successfully, False otherwise.
+        """
+        return await self._send(self.post_message(to_number, message, message_type))
+
+    async def send_template(self, to_number, template_name, **slots):
+        """
+        Send a pre-compiled message template through WhatsApp API.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            template_name (str): The name of a template in the registry.
+            **slots: The values of the template's slots, e.g. recipient_name.
+
+        Returns:
+            bool: True if the message was sent successfully, False otherwise.
+        """
+        return await self._send(self.post_template(to_number, template_name, **slots))
+
+    async def broadcast(self, messages, send=None, concurrency=WHATSAPP_BROADCAST_CONCURRENCY, accepted_status="sent"):
+        """
+        Send many messages concurrently. Recipients given by user ID are resolved in one batched query.
+
+        Args:
+            messages (list): Dicts with "message", an optional "message_type" ('text' or 'interactive'),
+                and either "to" (a phone number) or "user_id".
+            send (callable, optional): An async send function with the send_whatsapp_message signature,
+                e.g. OutboundDispatcher.send. Defaults to send_whatsapp_message.
+            concurrency (int): The maximum number of sends in flight.
+            accepted_status (str): The status of a message the send function accepted: 'sent' when it
+                delivers, 'queued' when it only queues the message, as OutboundDispatcher.send does.
+
+        Returns:
+            list: One result dict per message, in order, with "user_id", "to" and "status"
+                (accepted_status, 'failed' or 'not_found').
+        """
+        send = send or self.send_whatsapp_message
+        user_ids = [item["user_id"] for item in messages if not item.get("to") and item.get("user_id")]
+        users = await UserRepository.get_users_by_ids(user_ids) if user_ids else {}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _send(item):
+            result = {"user_id": item.get("user_id"), "to": item.get("to")}
+            if not result["to"]:
+                user = users.get(item.get("user_id"))
+                result["to"] = user.phone_number if user else None
+            if not result["to"]:
+                result["status"] = "not_found"
+                return result
+
+            async with semaphore:
+                try:
+                    sent = await send(result["to"], item["message"], item.get("message_type", "text"))
+                except Exception as e:
+                    print(f"Error broadcasting message: {e}")
+                    sent = False
+            result["status"] = accepted_status if sent else "failed"
+            return result
+
+        return await asyncio.gather(*(_send(item) for item in messages))
+
+    async def post_template(self, to_number, template_name, **slots):
+        """
+        Post a pre-compiled message template to the WhatsApp API, leaving the response to the caller.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            template_name (str): The name of a template in the registry.
+            **slots: The values of the template's slots.
+
+        Returns:
+            httpx.Response: The WhatsApp API response.
 
         Raises:
-            requests.exceptions.RequestException: If the request to WhatsApp API fails.
+            httpx.HTTPError: If the request to WhatsApp API fails.
+            KeyError: If the template or a slot value is missing.
         """
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.whatsapp_token}",
-                "Content-Type": "application/json",
-            }
-            url = f"https://graph.facebook.com/v19.0/{self.whatsapp_chatbot_phone_number}/messages"
-            data = {
-                "messaging_product": "whatsapp",
-                "recipient_type": "individual",
-                "to": to_number,
-            }
-            if message_type == 'interactive':
-                data.update({"type": "interactive", "interactive": message["interactive"]})
-            else:
-                data.update({"type": "text", "text": {"preview_url": False, "body": message}})
+        return await self.post_body(self.templates.render(template_name, to_number, **slots))
+
+    async def post_message(self, to_number, message, message_type='text'):
+        """
+        Post a message to the WhatsApp API within the phone number's rate limit, leaving
+        the response to the caller.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            message (str): The message to send.
+            message_type (str): The type of message ('text' or 'interactive').
 
-            # Sending the request asynchronously
-            response = await sync_to_async(requests.post)(url, json=data, headers=headers)
+        Returns:
+            httpx.Response: The WhatsApp API response.
+
+        Raises:
+            httpx.HTTPError: If the request to WhatsApp API fails.
+        """
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": to_number,
+        }
+        if message_type == 'interactive':
+            data.update({"type": "interactive", "interactive": message["interactive"]})
+        else:
+            data.update({"type": "text", "text": {"preview_url": False, "body": message}})
+
+        return await self.post_body(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    async def post_body(self, body):
+        """
+        Post a serialized message body within the phone number's rate limit.
+
+        Args:
+            body (bytes): The UTF-8 JSON request body.
+
+        Returns:
+            httpx.Response: The WhatsApp API response.
+
+        Raises:
+            httpx.HTTPError: If the request to WhatsApp API fails.
+        """
+        await self.rate_limiter.acquire(self.whatsapp_chatbot_phone_number)
+
+        # Send on the shared keep-alive connection pool
+        return await self.http_client.post(self.messages_url, content=body, headers=self.headers)
+
+    async def _send(self, request):
+        try:
+            response = await request
 
             # Log the response status and text for debugging
             if response.status_code == 200:
@@ -51,7 +174,7 @@ class WhatsAppClient:
             else:
                 print(f"Failed to send message: {response.status_code} - {response.text}")
                 return False
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Request error: {e}")
             return False
         except Exception as err:
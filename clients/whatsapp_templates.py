@@ -0,0 +1,108 @@
+from utils.message_templates import TemplateRegistry
+from config import WEBSITE_URL
+
+def reply_buttons(*titles):
+    """
+    Build WhatsApp reply buttons whose IDs match their titles.
+
+    Args:
+        *titles (str): The button titles.
+
+    Returns:
+        list: The reply buttons.
+    """
+    return [{"type": "reply", "reply": {"id": title, "title": title}} for title in titles]
+
+def button_message(text, buttons):
+    """
+    Build an interactive button message, as DialogflowController.create_button_message does.
+
+    Args:
+        text (str): The text to display with the buttons.
+        buttons (list): The list of buttons.
+
+    Returns:
+        dict: The interactive message with buttons.
+    """
+    return {
+        "interactive": {
+            "type": "button",
+            "body": {"text": text},
+            "action": {"buttons": buttons}
+        }
+    }
+
+MAIN_MENU_BUTTONS = reply_buttons("Post Job", "Find Job", "Mark Job as Complete")
+
+# Fixed conversational messages, compiled once into request bodies with {{slot}} markers
+whatsapp_templates = TemplateRegistry()
+
+whatsapp_templates.register("default_options", button_message(
+    f"*We encountered an issue processing your request.*\n\n"
+    f"Please try one of the following options:\n"
+    f'1️⃣ Post Job: Type "Post Job" to start posting a new job.\n'
+    f'2️⃣ Find Job: Type "Find Job" to search for available jobs.\n'
+    f'3️⃣ Mark Job as Complete: Type "Mark Job as Complete" to update the job status to complete.\n\n'
+    f"If you need any assistance, just type 'help'. 💬",
+    MAIN_MENU_BUTTONS
+), 'interactive')
+
+whatsapp_templates.register("welcome", button_message(
+    "Hello, {{recipient_name}}! This is HOME SERVICE CHATBOT! 🏠🤖\n\n"
+    "✨ What would you like to do today?\n"
+    "1️⃣ Post Job\n"
+    "2️⃣ Find Job\n"
+    "3️⃣ Mark Job as Complete\n\n"
+    "If you need any assistance, just type 'help'. 💬",
+    MAIN_MENU_BUTTONS
+), 'interactive')
+
+whatsapp_templates.register("registered", button_message(
+    "Hello, this is HOME SERVICE CHATBOT! 🏠🤖\n\n"
+    "Welcome, {{recipient_name}}! You have been successfully registered in our system. 🎉\n\n"
+    "✨ What would you like to do next?\n"
+    "1️⃣ Post Job\n"
+    "2️⃣ Find Job\n"
+    "3️⃣ Mark Job as Complete\n\n"
+    "If you need any assistance, just type 'help'. 💬",
+    MAIN_MENU_BUTTONS
+), 'interactive')
+
+whatsapp_templates.register("user_agreement", button_message(
+    "Hello, this is HOME SERVICE CHATBOT! 🏠🤖\n\n"
+    "To proceed, please note that by using this service, your phone number will be saved for job-related notifications and updates."
+    "Your data is secure and handled according to our privacy policy. 🛡️ Reply 'Agree' to continue.",
+    reply_buttons("Agree", "Decline")
+), 'interactive')
+
+whatsapp_templates.register("delete_account_confirm", button_message(
+    "⚠️ *Account Deletion Request*\n\n"
+    "You have requested to delete your account. This action is irreversible. All your data, "
+    "including posted jobs, accepted jobs, and payment details, will be permanently deleted.\n\n"
+    "If you wish to proceed, please confirm by clicking 'Confirm Delete' below.",
+    reply_buttons("Confirm Delete", "Cancel")
+), 'interactive')
+
+whatsapp_templates.register("decline",
+    "We respect your choice. However, you need to agree to our data handling policy to use our services. "
+    "If you change your mind, please type 'Agree' to proceed."
+)
+
+whatsapp_templates.register("help",
+    "📋 *Help Guide*\n\n"
+    "   🔹 *Post Job:* Type 'Post Job' to start posting a new job.\n\n"
+    "   🔹 *Find Job:* Type 'Find Job' to search for available jobs.\n\n"
+    "   🔹 *My Jobs:* Type 'My Jobs' to see a list of jobs you have posted or accepted.\n\n"
+    "   🔹 *Privacy:* Your data is secure. Type 'Privacy' for info.\n"
+)
+
+whatsapp_templates.register("privacy",
+    "🔒 *Privacy Policy Overview*\n\n"
+    "We take your privacy seriously. Your phone number and data are stored securely and used only for service-related communications, such as job notifications and updates. We do not share your data with unauthorized third parties.\n\n"
+    "If you wish to delete your account and all associated data, please type 'Delete Account'.\n\n"
+    f"For more details, please visit our full privacy policy at: {WEBSITE_URL}/privacy-policy"
+)
+
+whatsapp_templates.register("error",
+    "We encountered an issue processing your request. Please try again later."
+)
@@ -13,6 +13,10 @@ if DIALOGFLOW_CX_CREDENTIALS:
 DIALOGFLOW_CX_AGENTID = os.getenv("DIALOGFLOW_CX_AGENTID")
 DIALOGFLOW_CX_LOCATION = os.getenv("DIALOGFLOW_CX_LOCATION")
 
+# Dialogflow gRPC call deadline and channel keepalive, in seconds
+DIALOGFLOW_TIMEOUT = float(os.getenv("DIALOGFLOW_TIMEOUT", 10))
+DIALOGFLOW_KEEPALIVE_SECONDS = int(os.getenv("DIALOGFLOW_KEEPALIVE_SECONDS", 30))
+
 # Load WhatsApp credentials
 WHATSAPP_CHATBOT_PHONE_NUMBER = os.getenv("WHATSAPP_CHATBOT_PHONE_NUMBER")
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
@@ -23,6 +27,8 @@ LANGUAGE = os.getenv("LANGUAGE", "en-US")
 
 # Load Stripe credentials
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
+# Signing secret of the /stripe_webhook endpoint; without it /success posts the job itself
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 WEBSITE_URL = os.getenv("WEBSITE_URL")
 
 # Load Google Map credentials
@@ -36,6 +42,101 @@ CLASSIFICATION_MODEL_API_KEY = os.getenv("CLASSIFICATION_MODEL_API_KEY")
 AES_KEY = os.getenv("AES_KEY")
 AES_IV = os.getenv("AES_IV")
 
+# Optional key for the phone number blind index (derived from AES_KEY when unset)
+BLIND_INDEX_KEY = os.getenv("BLIND_INDEX_KEY")
+# Fall back to the encrypted-column scan for rows not yet backfilled
+BLIND_INDEX_LEGACY_FALLBACK = os.getenv("BLIND_INDEX_LEGACY_FALLBACK", "true").lower() == "true"
+
+# User cache settings
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+
+# Local ZIP code index; invalid ZIP codes are remembered for the negative TTL
+ZIP_CODE_DB_PATH = os.getenv("ZIP_CODE_DB_PATH", "instance/zip_codes.sqlite3")
+ZIP_CODE_NEGATIVE_TTL = int(os.getenv("ZIP_CODE_NEGATIVE_TTL", 86400))
+
+# Batched requests to the classification model API; a batch size of 1 sends one request per prediction
+CLASSIFICATION_BATCH_SIZE = int(os.getenv("CLASSIFICATION_BATCH_SIZE", 16))
+CLASSIFICATION_BATCH_LINGER_MS = float(os.getenv("CLASSIFICATION_BATCH_LINGER_MS", 5))
+CLASSIFICATION_HTTP_TIMEOUT = float(os.getenv("CLASSIFICATION_HTTP_TIMEOUT", 15))
+CLASSIFICATION_HTTP_MAX_CONNECTIONS = int(os.getenv("CLASSIFICATION_HTTP_MAX_CONNECTIONS", 10))
+
+# Category prediction cache settings
+CATEGORY_PREDICTION_CACHE_MAX_SIZE = int(os.getenv("CATEGORY_PREDICTION_CACHE_MAX_SIZE", 5000))
+CATEGORY_PREDICTION_CACHE_TTL = int(os.getenv("CATEGORY_PREDICTION_CACHE_TTL", 3600))
+
+# Embedded category classifier: "fallback" when the model API fails, "fast_path" to answer first when confident, or "off"
+CATEGORY_CLASSIFIER_MODE = os.getenv("CATEGORY_CLASSIFIER_MODE", "fallback").lower()
+CATEGORY_CLASSIFIER_PATH = os.getenv("CATEGORY_CLASSIFIER_PATH", "instance/category_classifier.npz")
+CATEGORY_CLASSIFIER_THRESHOLD = float(os.getenv("CATEGORY_CLASSIFIER_THRESHOLD", 0.8))
+
+# Seconds between reloads of the in-memory category catalog
+CATEGORY_CATALOG_REFRESH_SECONDS = int(os.getenv("CATEGORY_CATALOG_REFRESH_SECONDS", 3600))
+
+# Stripe calls run on a bounded thread pool; each call has an overall deadline including retries
+STRIPE_EXECUTOR_WORKERS = int(os.getenv("STRIPE_EXECUTOR_WORKERS", 8))
+STRIPE_HTTP_TIMEOUT = float(os.getenv("STRIPE_HTTP_TIMEOUT", 10))
+STRIPE_CALL_TIMEOUT = float(os.getenv("STRIPE_CALL_TIMEOUT", 30))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", 2))
+
+# Durable outbox of money-moving Stripe operations, executed and retried in the background
+STRIPE_OUTBOX_POLL_SECONDS = float(os.getenv("STRIPE_OUTBOX_POLL_SECONDS", 5))
+STRIPE_OUTBOX_BATCH_SIZE = int(os.getenv("STRIPE_OUTBOX_BATCH_SIZE", 10))
+STRIPE_OUTBOX_LEASE_SECONDS = int(os.getenv("STRIPE_OUTBOX_LEASE_SECONDS", 120))
+STRIPE_OUTBOX_MAX_ATTEMPTS = int(os.getenv("STRIPE_OUTBOX_MAX_ATTEMPTS", 8))
+STRIPE_OUTBOX_RETRY_BASE_DELAY = float(os.getenv("STRIPE_OUTBOX_RETRY_BASE_DELAY", 5))
+STRIPE_OUTBOX_RETRY_MAX_DELAY = float(os.getenv("STRIPE_OUTBOX_RETRY_MAX_DELAY", 600))
+
+# Scheduled settlement of paid jobs: one top-up per window, then transfers batched per connected account
+SETTLEMENT_ENABLED = os.getenv("SETTLEMENT_ENABLED", "true").lower() == "true"
+SETTLEMENT_WINDOW_SECONDS = int(os.getenv("SETTLEMENT_WINDOW_SECONDS", 3600))
+SETTLEMENT_MAX_JOBS = int(os.getenv("SETTLEMENT_MAX_JOBS", 500))
+SETTLEMENT_MAX_JOBS_PER_TRANSFER = int(os.getenv("SETTLEMENT_MAX_JOBS_PER_TRANSFER", 50))
+SETTLEMENT_TRANSFERS_PER_SECOND = float(os.getenv("SETTLEMENT_TRANSFERS_PER_SECOND", 2))
+SETTLEMENT_TRANSFER_DELAY = int(os.getenv("SETTLEMENT_TRANSFER_DELAY", 0))
+SETTLEMENT_FUNDING_RETRY_SECONDS = int(os.getenv("SETTLEMENT_FUNDING_RETRY_SECONDS", 3600))
+
+# Conversation backend for the job flows: "dialogflow", or "local" for the in-process flow engine
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "dialogflow").lower()
+CONVERSATION_SESSION_MAX_SIZE = int(os.getenv("CONVERSATION_SESSION_MAX_SIZE", 10000))
+CONVERSATION_SESSION_TTL = int(os.getenv("CONVERSATION_SESSION_TTL", 1800))
+# Posting fee charged on top of the job amount by the local Post Job flow; required with the local
+# backend, and must match the fee of the Dialogflow agent
+POSTING_FEE_PERCENT = float(os.getenv("POSTING_FEE_PERCENT")) if os.getenv("POSTING_FEE_PERCENT") else None
+
+# Acknowledge WhatsApp webhooks immediately and process messages on background workers
+WEBHOOK_ASYNC_PROCESSING = os.getenv("WEBHOOK_ASYNC_PROCESSING", "false").lower() == "true"
+WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", 1000))
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", 8))
+WEBHOOK_QUEUE_DRAIN_TIMEOUT = int(os.getenv("WEBHOOK_QUEUE_DRAIN_TIMEOUT", 30))
+
+# Per-sender processing lanes
+SENDER_LANE_IDLE_SECONDS = int(os.getenv("SENDER_LANE_IDLE_SECONDS", 60))
+
+# Pooled HTTP client for the WhatsApp Graph API
+WHATSAPP_HTTP_TIMEOUT = float(os.getenv("WHATSAPP_HTTP_TIMEOUT", 10))
+WHATSAPP_HTTP_MAX_CONNECTIONS = int(os.getenv("WHATSAPP_HTTP_MAX_CONNECTIONS", 20))
+WHATSAPP_HTTP_MAX_KEEPALIVE = int(os.getenv("WHATSAPP_HTTP_MAX_KEEPALIVE", 10))
+WHATSAPP_HTTP2 = os.getenv("WHATSAPP_HTTP2", "false").lower() == "true"
+
+# Outbound WhatsApp sends: per phone number ID rate limit, retries and dead-letter log
+WHATSAPP_SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", 80))
+WHATSAPP_SEND_BURST = int(os.getenv("WHATSAPP_SEND_BURST", 80))
+WHATSAPP_BROADCAST_CONCURRENCY = int(os.getenv("WHATSAPP_BROADCAST_CONCURRENCY", 16))
+OUTBOUND_QUEUE_MAX_SIZE = int(os.getenv("OUTBOUND_QUEUE_MAX_SIZE", 5000))
+OUTBOUND_QUEUE_WORKERS = int(os.getenv("OUTBOUND_QUEUE_WORKERS", 8))
+OUTBOUND_QUEUE_DRAIN_TIMEOUT = int(os.getenv("OUTBOUND_QUEUE_DRAIN_TIMEOUT", 30))
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", 5))
+OUTBOUND_RETRY_BASE_DELAY = float(os.getenv("OUTBOUND_RETRY_BASE_DELAY", 1))
+OUTBOUND_RETRY_MAX_DELAY = float(os.getenv("OUTBOUND_RETRY_MAX_DELAY", 60))
+OUTBOUND_DEAD_LETTER_PATH = os.getenv("OUTBOUND_DEAD_LETTER_PATH", "instance/outbound_dead_letter.jsonl")
+
+# Webhook message deduplication ("memory" per process, "sqlite" shared by all workers)
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory").lower()
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", 86400))
+DEDUP_MAX_SIZE = int(os.getenv("DEDUP_MAX_SIZE", 100000))
+DEDUP_SQLITE_PATH = os.getenv("DEDUP_SQLITE_PATH", "instance/dedup.sqlite3")
+
 # Ensure critical environment variables are loaded
 required_vars = [
     DIALOGFLOW_CX_CREDENTIALS,
@@ -69,5 +170,8 @@ missing_vars = [var for var, value in zip([
     "CLASSIFICATION_MODEL_API_KEY"
 ], required_vars) if not value]
 
+if CONVERSATION_BACKEND == "local" and POSTING_FEE_PERCENT is None:
+    missing_vars.append("POSTING_FEE_PERCENT")
+
 if missing_vars:
     raise EnvironmentError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -0,0 +1,392 @@
+import datetime
+from types import SimpleNamespace
+from database.category_catalog import category_catalog
+from utils.flow_engine import END, Flow, FlowEngine, FlowSession, Step, Turn
+from utils.slot_extractors import extract_amount, extract_date, extract_job_id, extract_time, extract_zip_code
+from utils.ttl_cache import TTLCache
+from config import CONVERSATION_SESSION_MAX_SIZE, CONVERSATION_SESSION_TTL, POSTING_FEE_PERCENT
+
+ERROR_TEXT = "Something went wrong, please try again."
+MAIN_MENU = ["Post Job", "Find Job", "Mark Job as Complete"]
+
+def text_response(text, parameters=None):
+    """
+    Build a webhook-style text response.
+
+    Args:
+        text (str): The text to send.
+        parameters (dict, optional): Session parameters to set.
+
+    Returns:
+        dict: The response.
+    """
+    response = {"fulfillmentResponse": {"messages": [{"text": {"text": [text]}}]}}
+    if parameters:
+        response["sessionInfo"] = {"parameters": parameters}
+    return response
+
+def chips_response(text, options):
+    """
+    Build a webhook-style response with reply chips.
+
+    Args:
+        text (str): The text to send.
+        options (list): The chip titles.
+
+    Returns:
+        dict: The response.
+    """
+    payload = {"richContent": [{"text": text}, {"type": "chips", "options": [{"text": option} for option in options]}]}
+    return {"fulfillmentResponse": {"messages": [{"payload": payload}]}}
+
+def parameters_response(parameters):
+    """
+    Build a webhook-style response that only sets session parameters.
+    """
+    return {"sessionInfo": {"parameters": parameters}}
+
+def fulfilled(response):
+    """
+    Return a fulfillment handler's response if it is a webhook response, or None for its error dicts.
+    """
+    if isinstance(response, dict) and ("fulfillmentResponse" in response or "sessionInfo" in response):
+        return response
+    return None
+
+def response_parameters(response):
+    return (response or {}).get("sessionInfo", {}).get("parameters", {})
+
+def has_choices(response):
+    return any("payload" in message for message in (response or {}).get("fulfillmentResponse", {}).get("messages", []))
+
+def is_answer(text, *answers):
+    return text.strip().casefold() in answers
+
+def extract_date_time(text):
+    date, time = extract_date(text), extract_time(text)
+    return {"date": date, "time": time} if date and time else None
+
+def extract_date_and_optional_time(text):
+    date = extract_date(text)
+    if not date:
+        return None
+    time = extract_time(text)
+    return {"date": date, **({"time": time} if time else {})}
+
+async def wait_for_answer(session):
+    return Turn()
+
+
+class ConversationController:
+    def __init__(self, dialogflow_controller):
+        """
+        Initialize the in-process conversation engine for the post job, find job and mark job as
+        complete flows. It drives the DialogflowController fulfillment handlers directly, so a turn
+        needs no Dialogflow round trip and no webhook callback.
+
+        Args:
+            dialogflow_controller (DialogflowController): The controller whose fulfillment handlers are used.
+        """
+        self.dialogflow_controller = dialogflow_controller
+        self.engine = FlowEngine()
+        self.sessions = TTLCache(CONVERSATION_SESSION_MAX_SIZE, CONVERSATION_SESSION_TTL)
+        self.flows = {
+            "Post Job": self._post_job_flow(),
+            "Find Job": self._find_job_flow(),
+            "Mark Job as Complete": self._mark_complete_flow(),
+        }
+
+    async def handle_message(self, sender_message, recipient_number, chat_session_id=None):
+        """
+        Handle a message the way DialogflowController.handle_message does, without calling Dialogflow.
+        A flow name starts that flow; anything else continues the user's current flow.
+
+        Args:
+            sender_message (str): The message sent by the user.
+            recipient_number (str): The phone number of the recipient.
+            chat_session_id (str, optional): The chat session ID. Defaults to None.
+
+        Returns:
+            dict: The processed response, or None if the user is not in a flow.
+        """
+        try:
+            flow = self.flows.get(sender_message)
+            if flow:
+                session = FlowSession(flow, recipient_number, chat_session_id)
+                response = await self.engine.start(session)
+            else:
+                session = self.sessions.get(recipient_number)
+                if not session:
+                    return None
+                response = await self.engine.handle(session, sender_message)
+
+            if session.finished:
+                self.sessions.pop(recipient_number)
+            else:
+                self.sessions.set(recipient_number, session)
+            return await self.render(response)
+        except Exception as e:
+            print(f"Error handling conversation message: {e}")
+            self.sessions.pop(recipient_number)
+            return {"error": "Internal error processing message"}
+
+    def has_active_flow(self, recipient_number):
+        """
+        Return True if the user is in the middle of a flow.
+
+        Args:
+            recipient_number (str): The phone number of the recipient.
+        """
+        return self.sessions.peek(recipient_number) is not None
+
+    async def render(self, response):
+        """
+        Turn a webhook-style response into the message format DialogflowController.handle_message returns.
+
+        Args:
+            response (dict): The merged response of a turn.
+
+        Returns:
+            dict: The processed messages in a structured format.
+        """
+        texts = []
+        payload_messages = []
+        for message in response.get("fulfillmentResponse", {}).get("messages", []):
+            if "text" in message:
+                texts.extend(message["text"]["text"][:1])
+            elif "payload" in message:
+                payload_messages.append(SimpleNamespace(payload=message["payload"]))
+                texts.extend(item["text"] for item in message["payload"].get("richContent", []) if "text" in item)
+
+        body = "\n\n".join(text for text in texts if text)
+        reply_btn_message = reply_list_message = None
+        if payload_messages:
+            buttons, lists, _ = await self.dialogflow_controller.process_payload_messages(payload_messages)
+            if buttons:
+                reply_btn_message = await self.dialogflow_controller.create_button_message(body, buttons)
+            if lists:
+                reply_list_message = await self.dialogflow_controller.create_list_message(body, lists)
+
+        return {
+            "replyBtnMessage": reply_btn_message,
+            "replyListMessage": reply_list_message,
+            "simpleTextMessage": body if body and not reply_btn_message and not reply_list_message else None
+        }
+
+    def _category_steps(self, next_step, description_prompt):
+        # Shared by post job and find job: describe the job, then settle on a category
+        async def predict(session, text):
+            response = fulfilled(await self.dialogflow_controller.predict_category(session.parameters, text))
+            predicted = response_parameters(response).get("category_predicted")
+            if predicted == "single":
+                return Turn(response, "confirm_category")
+            if predicted == "multiple":
+                return Turn(response, "choose_category")
+            return Turn(response)
+
+        async def confirm(session, text):
+            if is_answer(text, "yes"):
+                await self.dialogflow_controller.confirm_category(
+                    session.parameters.get("job_description"), session.parameters.get("job_category")
+                )
+                return Turn(goto=next_step)
+            if is_answer(text, "no"):
+                return Turn(parameters_response({"job_category": None}), "describe_more")
+            return Turn()
+
+        async def choose(session, text):
+            category = await category_catalog.get_by_name(text)
+            if not category:
+                return Turn()
+            job_category = category.name.capitalize()
+            await self.dialogflow_controller.confirm_category(session.parameters.get("job_description"), job_category)
+            return Turn(parameters_response({"job_category": job_category}), next_step)
+
+        return {
+            "description": Step(
+                prompt=text_response(description_prompt),
+                retry_prompt=text_response("Please tell us a bit more about the job so we can find the right category."),
+                on_input=predict
+            ),
+            "describe_more": Step(
+                prompt=text_response("Please add more details about the job so we can find the right category."),
+                on_input=predict
+            ),
+            "confirm_category": Step(
+                prompt=chips_response("Is this category correct?", ["Yes", "No"]),
+                on_enter=wait_for_answer,
+                on_input=confirm
+            ),
+            "choose_category": Step(
+                prompt=text_response("Please choose one of the suggested categories."),
+                on_enter=wait_for_answer,
+                on_input=choose
+            ),
+        }
+
+    async def _validate_zip_code(self, session, text):
+        response = fulfilled(await self.dialogflow_controller.validate_job_data(
+            {"job_description": session.parameters.get("job_description"), "zip_code": session.parameters.get("zip_code")}
+        ))
+        if not response or response_parameters(response).get("zip_code", "") is None:
+            return Turn(parameters_response({"zip_code": None}))
+        return Turn(response, session.flow.steps[session.step].next)
+
+    async def _validate_amount(self, session, text):
+        response = fulfilled(await self.dialogflow_controller.validate_job_data(
+            {"job_description": session.parameters.get("job_description"), "amount": session.parameters.get("amount")}
+        ))
+        if not response:
+            return Turn(text_response(ERROR_TEXT, {"amount": None}))
+        if response_parameters(response).get("amount", "") is None:
+            return Turn(response)
+        return Turn(response, session.flow.steps[session.step].next)
+
+    def _post_job_flow(self):
+        async def validate_date_time(session, text):
+            date, time = session.parameters["date"], session.parameters["time"]
+            when = datetime.datetime(date["year"], date["month"], date["day"], time["hours"], time["minutes"])
+            if when <= datetime.datetime.now():
+                return Turn(text_response("Please choose a date and time in the future.", {"date": None, "time": None}))
+            return Turn(goto="zip_code")
+
+        async def add_posting_fee(session, text):
+            turn = await self._validate_amount(session, text)
+            if turn.goto:
+                amount = float(session.parameters["amount"]["amount"])
+                turn.response = {**(turn.response or {}), "sessionInfo": {"parameters": {
+                    **response_parameters(turn.response),
+                    "posting_fee": round(amount * POSTING_FEE_PERCENT / 100, 2)
+                }}}
+            return turn
+
+        async def confirmation(session):
+            response = fulfilled(await self.dialogflow_controller.post_job_data_confirmation(session.parameters))
+            return Turn(response) if response else Turn(text_response(ERROR_TEXT), END)
+
+        async def save(session, text):
+            if is_answer(text, "yes"):
+                response = fulfilled(await self.dialogflow_controller.post_job_data_save(
+                    session.parameters, session.recipient_number, session.chat_session_id
+                ))
+                return Turn(response or text_response(ERROR_TEXT), END)
+            if is_answer(text, "no"):
+                return Turn(chips_response("Your job was not posted. What would you like to do next?", MAIN_MENU), END)
+            return Turn()
+
+        steps = self._category_steps("date_time", "📝 Please describe the job you need done.")
+        steps.update({
+            "date_time": Step(
+                prompt=text_response("📅 When should the job be done? For example: 12/24 at 3 PM."),
+                retry_prompt=text_response("Please include both a date and a time, for example: 12/24 at 3 PM."),
+                extract=extract_date_time,
+                on_input=validate_date_time
+            ),
+            "zip_code": Step(
+                prompt=text_response("📍 What is the ZIP code of the job location?"),
+                retry_prompt=text_response("Please enter a valid 5-digit US ZIP code."),
+                extract=lambda text: {"zip_code": zip_code} if (zip_code := extract_zip_code(text)) else None,
+                on_input=self._validate_zip_code,
+                next="amount"
+            ),
+            "amount": Step(
+                prompt=text_response("💵 How much will you pay for this job? The minimum is $10."),
+                retry_prompt=text_response("Please enter the amount in dollars, for example: $45."),
+                extract=lambda text: {"amount": amount} if (amount := extract_amount(text)) else None,
+                on_input=add_posting_fee,
+                next="confirm"
+            ),
+            "confirm": Step(
+                prompt=chips_response("Please respond with *Yes* to confirm or *No* to cancel.", ["Yes", "No"]),
+                on_enter=confirmation,
+                on_input=save
+            ),
+        })
+        return Flow("Post Job", "description", steps, {"job_type": "post_job"})
+
+    def _find_job_flow(self):
+        async def results(session):
+            response = fulfilled(await self.dialogflow_controller.find_job_data_list(session.parameters))
+            if not response:
+                return Turn(text_response(ERROR_TEXT), END)
+            found = response_parameters(response).get("is_found_jobs") == "Yes"
+            return Turn(response, None if found else END)
+
+        async def select(session, text):
+            response = fulfilled(await self.dialogflow_controller.found_jobs_selected_id(session.parameters, session.recipient_number))
+            parameters = response_parameters(response)
+            if parameters.get("selected_job_id_is_valid") == "Yes" and parameters.get("selected_own_job_id") == "No" \
+                    and parameters.get("selected_same_time_job_id") == "No":
+                return Turn(response, "accept")
+            return Turn(response or text_response(ERROR_TEXT))
+
+        async def accept(session, text):
+            if is_answer(text, "accept"):
+                response = fulfilled(await self.dialogflow_controller.assign_user_to_accepted_job(
+                    session.parameters, session.recipient_number
+                ))
+                return Turn(response or text_response(ERROR_TEXT), END)
+            if is_answer(text, "decline"):
+                return Turn(chips_response("No problem. What would you like to do next?", MAIN_MENU), END)
+            return Turn()
+
+        skip_words = ("any", "skip", "none", "no")
+        steps = self._category_steps("date_time", "🔍 What kind of job are you looking for?")
+        steps.update({
+            "date_time": Step(
+                prompt=text_response("📅 From when are you available? For example: 12/24 at 3 PM. Type 'Any' to skip."),
+                retry_prompt=text_response("Please enter a date, for example: 12/24 at 3 PM, or type 'Any'."),
+                extract=extract_date_and_optional_time,
+                skip_words=skip_words,
+                next="zip_code"
+            ),
+            "zip_code": Step(
+                prompt=text_response("📍 Which ZIP code would you like to work in? Type 'Any' to skip."),
+                retry_prompt=text_response("Please enter a valid 5-digit US ZIP code, or type 'Any'."),
+                extract=lambda text: {"zip_code": zip_code} if (zip_code := extract_zip_code(text)) else None,
+                skip_words=skip_words,
+                on_input=self._validate_zip_code,
+                next="amount"
+            ),
+            "amount": Step(
+                prompt=text_response("💵 What is the minimum pay you are looking for? Type 'Any' to skip."),
+                retry_prompt=text_response("Please enter the amount in dollars, for example: $45, or type 'Any'."),
+                extract=lambda text: {"amount": amount} if (amount := extract_amount(text)) else None,
+                skip_words=skip_words,
+                on_input=self._validate_amount,
+                next="results"
+            ),
+            "results": Step(
+                prompt=text_response("Please choose a job from the list."),
+                extract=lambda text: {"selected_job_id": job_id} if (job_id := extract_job_id(text)) else None,
+                on_enter=results,
+                on_input=select
+            ),
+            "accept": Step(
+                prompt=chips_response("Please respond with *Accept* or *Decline*.", ["Accept", "Decline"]),
+                on_enter=wait_for_answer,
+                on_input=accept
+            ),
+        })
+        return Flow("Find Job", "description", steps, {"job_type": "find_job"})
+
+    def _mark_complete_flow(self):
+        async def list_jobs(session):
+            response = fulfilled(await self.dialogflow_controller.get_jobs_to_mark_as_complete(session.recipient_number))
+            if not response:
+                return Turn(text_response(ERROR_TEXT), END)
+            return Turn(response, None if has_choices(response) else END)
+
+        async def mark_complete(session, text):
+            response = fulfilled(await self.dialogflow_controller.job_mark_as_complete(session.parameters, session.recipient_number))
+            return Turn(response or text_response(ERROR_TEXT), END)
+
+        steps = {
+            "select": Step(
+                prompt=text_response("Please choose a job from the list."),
+                extract=lambda text: {"selected_job_id": job_id} if (job_id := extract_job_id(text)) else None,
+                on_enter=list_jobs,
+                on_input=mark_complete
+            ),
+        }
+        return Flow("Mark Job as Complete", "select", steps)
@@ -1,11 +1,19 @@
 from clients.dialogflow_client import DialogflowClient
 import datetime
 from clients.whatsapp_client import WhatsAppClient
-from database.repositories import AddressRepository, ChatSessionRepository, JobRepository, CategoryRepository, StripeUserRepository, UserRepository
+from clients.outbound_dispatcher import outbound_dispatcher
+from database.repositories import AddressRepository, ChatSessionRepository, JobRepository, StripeUserRepository, UserRepository
+from database.category_catalog import category_catalog
 from clients.stripe_client import StripeClient
+from clients.classification_client import classification_client
+from clients.stripe_outbox import stripe_outbox
 import requests
 from config import GOOGLE_MAPS_API_KEY, CLASSIFICATION_MODEL_API_URL, CLASSIFICATION_MODEL_API_KEY, WEBSITE_URL
 from asgiref.sync import sync_to_async
+from utils.user_cache import user_cache
+from utils.zip_code_store import zip_code_store
+from utils.prediction_cache import category_predictions
+from utils.category_classifier import category_classifier
 import logging
 
 
@@ -15,6 +23,7 @@ class DialogflowController:
         Initialize the DialogflowController with necessary clients.
         """
         self.whatsapp_client = WhatsAppClient()
+        self.outbound_dispatcher = outbound_dispatcher
         self.dialogflow_client = DialogflowClient()
         self.stripe_client = StripeClient()
         self.api_key = GOOGLE_MAPS_API_KEY
@@ -255,6 +264,11 @@ class DialogflowController:
         Returns:
             dict: The response to be sent back to Dialogflow.
         """
+        # Resolve the user once per fulfillment call, however many handlers look them up
+        with user_cache.request_scope():
+            return await self._handle_dialogflow_webhook(body)
+
+    async def _handle_dialogflow_webhook(self, body):
         if not body:
             return {"status": "error", "message": "Empty or undefined message received."}
 
@@ -500,9 +514,13 @@ class DialogflowController:
             'confirmed_category': confirmed_category
         }
 
+        # A corrected prediction must not be served from the cache again
+        if job_description:
+            category_predictions.invalidate(self.clean_service_description(job_description), confirmed_category)
+
         try:
             # Send a POST request to the ML model to confirm the category
-            response = await sync_to_async(requests.post)(
+            response = await sync_to_async(requests.post, thread_sensitive=False)(
                 f"{CLASSIFICATION_MODEL_API_URL}/confirm_category",
                 json=payload,
                 headers=headers
@@ -679,8 +697,8 @@ class DialogflowController:
                 second=int(job_time.get('seconds'))
             )
 
-            # Get or create job category
-            category = await CategoryRepository.get_category_by_name(job_category)
+            # Get job category
+            category = await category_catalog.get_by_name(job_category)
             if not category:
                 return {"error": f"Category '{job_category}' not found"}
 
@@ -706,13 +724,9 @@ class DialogflowController:
             # Format job ID with leading zeros
             job_id_padded = str(job.id).zfill(5)
 
-            # Create or retrieve Stripe customer
-            customer_data = {
-                "name": user.name,
-                "phone_number": user.phone_number
-            }
-            stripe_customer = await self.stripe_client.create_or_retrieve_customer(customer_data)
-            if not stripe_customer:
+            # Stripe customer, stored on the user after their first job post
+            stripe_customer_id = await self.stripe_client.get_customer_id(user)
+            if not stripe_customer_id:
                 raise Exception('Failed to create or retrieve Stripe customer.')
 
             # Create Stripe checkout session
@@ -725,7 +739,7 @@ class DialogflowController:
                 'job_description': job_description,
                 'posting_fee': posting_fee,
                 'total_amount': (amount + posting_fee),
-                'stripe_customer_id': stripe_customer.id,
+                'stripe_customer_id': stripe_customer_id,
                 'recipient_number': recipient_number,
                 'user_id': user.id
             }
@@ -802,7 +816,7 @@ class DialogflowController:
 
             # Get the category ID if a job category is provided
             if job_category:
-                category = await CategoryRepository.get_category_by_name(job_category)
+                category = await category_catalog.get_by_name(job_category)
                 job_category_id = category.id if category else None
 
             # Construct conditions
@@ -848,11 +862,12 @@ class DialogflowController:
                 # Dynamically create options for each job
                 for idx, job in enumerate(found_jobs, 1):
                     job_time_str = job.date_time.strftime("%m/%d/%Y at %I:%M %p")
+                    job_category_name = await category_catalog.get_name(job.category_id)
                     job_title = f"Job #{job.id}"
                     job_id = str(job.id)
                     options.append({"text": job_title, "id": job_id})
                     summary_text += (
-                        f"*{idx}) Job ID #{job.id}:* {job.category.name.capitalize()} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f}\n"
+                        f"*{idx}) Job ID #{job.id}:* {job_category_name} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f}\n"
                         f"*Job Requirement:* {job.job_description}\n\n"
                     )
                 summary_text += "Which job do you want to accept?"
@@ -939,6 +954,7 @@ class DialogflowController:
                 # Prepare the job details
                 selected_job_date_str = selected_job.date_time.strftime("%m/%d/%Y")
                 selected_job_time_str = selected_job.date_time.strftime("%I:%M %p")
+                selected_job_category_name = await category_catalog.get_name(selected_job.category_id)
 
                 json_parameters = {
                     "selected_own_job_id": "No",
@@ -949,7 +965,7 @@ class DialogflowController:
                 # Create a response message for job acceptance confirmation
                 response_message = (
                     f"✨ *Great! Please confirm you want to accept this job:* ✨\n\n"
-                    f"  🔹 *Job Category:* {selected_job.category.name.capitalize()}\n"
+                    f"  🔹 *Job Category:* {selected_job_category_name}\n"
                     f"  🔹 *Date:* {selected_job_date_str}\n"
                     f"  🔹 *Time:* {selected_job_time_str}\n"
                     f"  🔹 *Location:* {selected_job.zip_code}\n"
@@ -1069,7 +1085,7 @@ class DialogflowController:
                 ]
                 
                 interactive_message = await self.create_button_message(notification_message_poster, buttons)
-                await self.whatsapp_client.send_whatsapp_message(poster.phone_number, interactive_message, 'interactive')
+                await self.outbound_dispatcher.send(poster.phone_number, interactive_message, 'interactive')
 
             payload_response = {
                 "richContent": [
@@ -1093,7 +1109,9 @@ class DialogflowController:
 
     async def get_job_category(self, service_description):
         """
-        Predict the job category using the ML model.
+        Predict the job category using the ML model. Predictions are cached by normalized
+        description, and identical concurrent requests share one model call. The embedded
+        classifier answers when the model fails, or first when it is confident in fast_path mode.
 
         Args:
             service_description (str): The job description.
@@ -1101,7 +1119,33 @@ class DialogflowController:
         Returns:
             dict: The response from the ML model with category suggestions.
         """
+        service_description = self.clean_service_description(service_description)
+
+        # A confident embedded prediction skips the remote model
+        if category_classifier.fast_path:
+            prediction = category_classifier.predict(service_description, confident_only=True)
+            if prediction:
+                return prediction
+
+        prediction = await category_predictions.get_or_predict(
+            service_description, lambda: self._predict_job_category(service_description)
+        )
+        if prediction is None and category_classifier.fallback:
+            # The remote model failed, so suggest categories rather than ask the user to pick one
+            prediction = category_classifier.predict(service_description)
+        return prediction
+
+    @staticmethod
+    def clean_service_description(service_description):
+        """
+        Remove the job commands from a service description.
+
+        Args:
+            service_description (str): The job description.
 
+        Returns:
+            str: The cleaned job description.
+        """
         # Phrases to be removed from the service description
         post_job_phrases = ["post job", "post a job", "post new job", "post another job"]
         find_job_phrases = ["find job", "find a job", "find new job", "find another job"]
@@ -1109,26 +1153,16 @@ class DialogflowController:
         # Clean the service description by removing unwanted phrases
         for phrase in post_job_phrases + find_job_phrases:
             service_description = service_description.replace(phrase, "").strip()
+        return service_description
 
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {CLASSIFICATION_MODEL_API_KEY}'
-        }
-        payload = {
-            'service_description': service_description
-        }
-
-        try:
-            response = await sync_to_async(requests.post)(f"{CLASSIFICATION_MODEL_API_URL}/predict", json=payload, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error calling ML model API: {e}")
-            return None
+    async def _predict_job_category(self, service_description):
+        # Concurrent predictions are sent to the model together
+        return await classification_client.predict(service_description)
 
     async def is_valid_zip_code(self, zip_code):
         """
-        Validate the zip code using Google Maps API and return the corresponding city and state.
+        Validate the zip code and return the corresponding city and state, from the local ZIP code
+        index when possible and from the Google Maps API otherwise.
 
         Args:
             zip_code (str): The zip code to validate.
@@ -1136,9 +1170,17 @@ class DialogflowController:
         Returns:
             tuple: A tuple containing a boolean indicating validity and a dictionary with city and state information.
         """
+        normalized_zip_code = zip_code_store.normalize(zip_code)
+        if not normalized_zip_code:
+            return False, {}
+
+        cached = zip_code_store.lookup(normalized_zip_code)
+        if cached is not None:
+            return cached
+
         try:
-            url = f"https://maps.googleapis.com/maps/api/geocode/json?address={zip_code}&key={self.api_key}&sensor=true"
-            response = await sync_to_async(requests.get)(url)
+            url = f"https://maps.googleapis.com/maps/api/geocode/json?address={normalized_zip_code}&key={self.api_key}&sensor=true"
+            response = await sync_to_async(requests.get, thread_sensitive=False)(url)
             response.raise_for_status()
             data = response.json()
 
@@ -1156,14 +1198,20 @@ class DialogflowController:
                         state = component['short_name']
 
                 if city and state:
+                    zip_code_store.store(normalized_zip_code, city, state)
                     return True, {"city": city, "state_id": state}
                 else:
+                    zip_code_store.store_invalid(normalized_zip_code)
                     return False, {}
+            elif data['status'] == 'ZERO_RESULTS':
+                zip_code_store.store_invalid(normalized_zip_code)
+                return False, {}
             else:
-                print(f"Error in assign user to accepted job: {e}")("Invalid zip code response from Google Maps API: %s", data)
+                # Quota or key errors say nothing about the ZIP code, so they are not cached
+                print(f"Invalid zip code response from Google Maps API: {data}")
                 return False, {}
         except requests.RequestException as e:
-            print(f"Error in assign user to accepted job: {e}")("Error validating zip code: %s", e)
+            print(f"Error validating zip code: {e}")
             return False, {}
 
     async def get_jobs_to_mark_as_complete(self, recipient_number):
@@ -1205,11 +1253,12 @@ class DialogflowController:
                 summary_text += "🌟 *Your Posted Jobs:*\n\n"
                 for idx, job in enumerate(posted_jobs, 1):
                     job_time_str = job.date_time.strftime("%m/%d/%Y at %I:%M %p")
+                    job_category_name = await category_catalog.get_name(job.category_id)
                     job_title = f"Job #{str(job.id)}"
                     job_id = str(job.id)
                     options.append({"text": job_title, "id": job_id})
                     summary_text += (
-                        f"*{idx}) Job ID #{job.id}:* {job.category.name.capitalize()} on {job_time_str} "
+                        f"*{idx}) Job ID #{job.id}:* {job_category_name} on {job_time_str} "
                         f"in ZIP {job.zip_code} for ${job.amount:.2f}\n\n"
                     )
 
@@ -1218,11 +1267,12 @@ class DialogflowController:
                 summary_text += "👍 *Your Accepted Jobs:*\n\n"
                 for idx, job in enumerate(accepted_jobs, 1):
                     job_time_str = job.date_time.strftime("%m/%d/%Y at %I:%M %p")
+                    job_category_name = await category_catalog.get_name(job.category_id)
                     job_title = f"Job #{str(job.id)}"
                     job_id = str(job.id)
                     options.append({"text": job_title, "id": job_id})
                     summary_text += (
-                        f"*{idx}) Job ID #{job.id}:* {job.category.name.capitalize()} on {job_time_str} "
+                        f"*{idx}) Job ID #{job.id}:* {job_category_name} on {job_time_str} "
                         f"in ZIP {job.zip_code} for ${job.amount:.2f}\n\n"
                     )
 
@@ -1282,67 +1332,64 @@ class DialogflowController:
                 # Notify the seeker and process payouts
                 seeker = await UserRepository.get_user_by_id(job.accepted_by)
                 if seeker:
-                    # Capture the payment
-                    captured_payment = await self.stripe_client.capture_payment(
-                        payment_intent_id=job.payment_intent,
-                        amount=job.amount,
-                        posting_fee=job.posting_fee,
-                        job_id=job.id
+                    # Capture the payment and create the seeker's Connect account through the Stripe
+                    # outbox: recorded with idempotency keys now, executed and retried in the background.
+                    # The settlement scheduler pays the seeker out in its next window.
+                    amount = job.amount
+                    posting_fee = job.posting_fee or 0
+                    capture_recorded = await stripe_outbox.enqueue(
+                        f"job-{job.id}-capture",
+                        "capture_payment",
+                        {
+                            "job_id": job.id,
+                            "payment_intent_id": job.payment_intent,
+                            "amount_to_capture": int((amount + posting_fee) * 100)
+                        },
+                        job.id
                     )
-
-                    # Step 1: Fetch or Create Stripe Connect Account
+                    if not capture_recorded:
+                        # Without a recorded capture the seeker would never be paid, so let the poster retry
+                        await JobRepository.update_job(where_criteria, {'status': job.status})
+                        return await self.webhook_response(
+                            f"⚠️ We could not process the payment for Job ID #{job_id_padded}. Please try again later.", None, None
+                        )
+                    # Settlements only pay out accounts that finished onboarding, so send the setup link
+                    # until then; without an account yet, the outbox creates one and sends the link
                     stripe_user = await StripeUserRepository.get_stripe_user_by_user_id(seeker.id)
-                    if not stripe_user:
-                        # Create a new Stripe Connect account
-                        connect_account = await self.stripe_client.create_connect_account()
-
-                        # Save the account details in the database
-                        await StripeUserRepository.create_stripe_user(
-                            user_id=seeker.id,
-                            stripe_user_id=connect_account['id']
+                    net_amount = amount - posting_fee
+                    if stripe_user and stripe_user.payouts_enabled == "true":
+                        payout_message = (
+                            f"Payout of ${net_amount} will be sent to your account with the next payout run. "
+                            "It may take 2-5 business days to reflect in your bank."
                         )
-                        stripe_user_id = connect_account['id']
+                    elif stripe_user:
+                        try:
+                            setup_link = await self.stripe_client.call(
+                                self.stripe_client.create_connect_account_link, stripe_user.stripe_user_id
+                            )
+                            payout_message = (
+                                f"Complete your Stripe account setup to receive the payout of ${net_amount}. "
+                                f"Use this link: {setup_link['url']}"
+                            )
+                        except Exception as e:
+                            print(f"Error creating Stripe account link: {e}")
+                            payout_message = f"We will send you a link to set up your Stripe account and receive the payout of ${net_amount}."
+                            stripe_user = None
                     else:
-                        stripe_user_id = stripe_user.stripe_user_id
-
-                    # Account setup incomplete, generate setup (onboarding) link
-                    setup_link = self.stripe_client.create_connect_account_link(account_id=stripe_user_id)
-                    payout_message = (
-                        "Complete your Stripe account setup to receive the payout. "
-                        f"Use this link: {setup_link['url']}"
-                    )
+                        payout_message = f"We will send you a link to set up your Stripe account and receive the payout of ${net_amount}."
 
-                    # Step 2: Check Account Setup Status
-                    account_details = await self.stripe_client.get_connected_account(stripe_user_id)
-                    login_link = None
-
-                    # if account_details['payouts_enabled'] and account_details['requirements']['disabled_reason'] is None:
-                    #     # Fully set up account, create payout
-                    #     payout = await self.stripe_client.create_payout(
-                    #         account_id=stripe_user_id,
-                    #         amount=job.amount,
-                    #         job_id=job.id,
-                    #         posting_fee=job.posting_fee
-                    #     )
-                    #     payout_message = f"Payout of ${job.amount - job.posting_fee} has been initiated to your account. It may take 2-5 business days to reflect in your bank."
-
-                    #     # Generate a login link to manage their account
-                    #     login_link = self.stripe_client.create_login_link(stripe_user_id)
-                    # else:
-                    #     # Account setup incomplete, generate setup (onboarding) link
-                    #     setup_link = self.stripe_client.create_connect_account_link(account_id=stripe_user_id)
-                    #     payout_message = (
-                    #         "Complete your Stripe account setup to receive the payout. "
-                    #         f"Use this link: {setup_link['url']}"
-                    #     )
+                    if not await stripe_outbox.enqueue(
+                        f"job-{job.id}-payout-account",
+                        "create_connect_account",
+                        {"user_id": seeker.id, "job_id": job.id, "send_setup_link": stripe_user is None},
+                        job.id
+                    ):
+                        print(f"ALERT: could not record the Stripe account setup of user {seeker.id} for job #{job_id_padded}.")
 
                     # Step 3: Notify the Seeker
                     notification_message_seeker = (
-                        f"✅ The job ID #{job_id_padded} has been marked as completed by the poster. "
-                        f"Payout of ${job.amount - job.posting_fee} has been initiated to your account. It may take 2-5 business days to reflect in your bank."
+                        f"✅ The job ID #{job_id_padded} has been marked as completed by the poster. {payout_message}"
                     )
-                    # if login_link:
-                    #     notification_message_seeker += f"Manage your Stripe account here: {login_link['url']}"
 
                     buttons = [
                         {
@@ -1355,7 +1402,7 @@ class DialogflowController:
                     ]
 
                     interactive_message = await self.create_button_message(notification_message_seeker, buttons)
-                    await self.whatsapp_client.send_whatsapp_message(seeker.phone_number, interactive_message, 'interactive')
+                    await self.outbound_dispatcher.send(seeker.phone_number, interactive_message, 'interactive')
 
                 return await self.webhook_response(f"✅ Job ID #{job_id_padded} has been marked as completed.", None, None)
 
@@ -1383,7 +1430,7 @@ class DialogflowController:
                     ]
 
                     interactive_message = await self.create_button_message(notification_message_poster, buttons)
-                    await self.whatsapp_client.send_whatsapp_message(poster.phone_number, interactive_message, 'interactive')
+                    await self.outbound_dispatcher.send(poster.phone_number, interactive_message, 'interactive')
 
                 # Send confirmation to the seeker
                 notification_message_seeker = (
@@ -0,0 +1,117 @@
+import stripe
+from database.repositories import AddressRepository, JobRepository
+from utils.ttl_cache import TTLCache
+from config import STRIPE_WEBHOOK_SECRET
+
+class PaymentController:
+    def __init__(self, whatsapp_controller, stripe_client):
+        """
+        Initialize the PaymentController, which posts paid jobs from Stripe webhooks.
+
+        Args:
+            whatsapp_controller (WhatsAppController): The controller used to notify the poster.
+            stripe_client (StripeClient): The client used to retrieve checkout sessions.
+        """
+        self.whatsapp_controller = whatsapp_controller
+        self.stripe_client = stripe_client
+        self.webhook_secret = STRIPE_WEBHOOK_SECRET
+        # Sessions seen by the webhook, so /success usually renders without calling Stripe
+        self.completed_sessions = TTLCache(1000, 3600)
+
+    @property
+    def webhook_enabled(self):
+        return bool(self.webhook_secret)
+
+    async def handle_stripe_webhook(self, payload, signature):
+        """
+        Verify and handle a Stripe webhook event.
+
+        Args:
+            payload (bytes): The raw request body.
+            signature (str): The Stripe-Signature header.
+
+        Returns:
+            tuple: The response body and HTTP status. A non-2xx status makes Stripe redeliver the event.
+        """
+        if not self.webhook_enabled:
+            return {"status": "error", "message": "Stripe webhook is not configured."}, 404
+
+        try:
+            event = stripe.Webhook.construct_event(payload, signature, self.webhook_secret)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            print(f"Invalid Stripe webhook: {e}")
+            return {"status": "error", "message": "Invalid signature."}, 400
+
+        if event["type"] != "checkout.session.completed":
+            return {"status": "ignored", "type": event["type"]}, 200
+
+        session = event["data"]["object"]
+        metadata = session.get("metadata") or {}
+        if not metadata.get("job_id") or not metadata.get("user_id"):
+            # Not a job checkout, e.g. a payment link; answering 200 stops Stripe redelivering it
+            return {"status": "ignored", "message": "Not a job checkout."}, 200
+
+        self.completed_sessions.set(session.id, session)
+        try:
+            posted = await self.complete_checkout(session)
+        except Exception as e:
+            print(f"Error completing checkout: {e}")
+            return {"status": "error", "message": "Failed to post the job."}, 500
+        return {"status": "ok", "posted": posted}, 200
+
+    async def complete_checkout(self, session):
+        """
+        Post the job of a completed checkout session: save the billing address, mark the job as
+        posted and authorized, and notify the poster. Safe to call more than once per session.
+
+        Args:
+            session (stripe.checkout.Session): The completed checkout session.
+
+        Returns:
+            bool: True if this call posted the job, False if it was already posted or cannot be.
+
+        Raises:
+            SQLAlchemyError: If the job could not be updated; the webhook answers 500 so Stripe redelivers.
+        """
+        customer_address = session.customer_details.address if session.customer_details else None
+        if not customer_address:
+            print(f"Checkout session {session.id} has no customer address.")
+            return False
+
+        address_data = {
+            "street": f"{customer_address.line1} {customer_address.line2 if customer_address.line2 else ''}",
+            "city": customer_address.city,
+            "zip_code": customer_address.postal_code,
+            "state": customer_address.state,
+            "country": customer_address.country
+        }
+        result = await AddressRepository.register_address(address_data, session.metadata.user_id)
+        address_id = result['address_data'].id if result['address_data'] else None
+
+        update_job_data = {
+            'status': 'posted',
+            'payment_status': 'authorized',
+            'payment_intent': session.payment_intent,
+            'address_id': address_id
+        }
+        job = await JobRepository.transition_payment_status(int(session.metadata.job_id), 'unpaid', update_job_data)
+        if not job:
+            return False
+
+        await self.whatsapp_controller.notify_payment_success(session, customer_address)
+        return True
+
+    async def get_checkout_session(self, session_id):
+        """
+        Return a checkout session for the success page, from the webhook when it already arrived.
+
+        Args:
+            session_id (str): The checkout session ID.
+
+        Returns:
+            stripe.checkout.Session: The checkout session.
+        """
+        session = self.completed_sessions.get(session_id)
+        if session is None:
+            session = await self.stripe_client.retrieve_checkout_session(session_id)
+        return session
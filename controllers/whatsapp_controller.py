@@ -1,20 +1,64 @@
+import asyncio
 from datetime import datetime, timezone
 import logging
 import uuid
 from clients.whatsapp_client import WhatsAppClient
+from clients.outbound_dispatcher import outbound_dispatcher
 from controllers.dialogflow_controller import DialogflowController
+from controllers.conversation_controller import ConversationController
 from database.repositories import JobRepository, UserRepository, ChatSessionRepository, AddressRepository
-from config import WEBSITE_URL
+from database.category_catalog import category_catalog
+from utils.user_cache import user_cache
+from utils.ttl_cache import TTLCache
+from utils.command_router import CommandRouter
+from config import WEBSITE_URL, CONVERSATION_BACKEND, CONVERSATION_SESSION_MAX_SIZE, CONVERSATION_SESSION_TTL
+
+# Keyword commands answered without Dialogflow; job phrases also match inside short messages
+# from senders who are not in a flow
+command_router = CommandRouter()
+command_router.add("agree", "agree")
+command_router.add("decline", "decline")
+command_router.add("help", "help")
+command_router.add("privacy", "privacy")
+command_router.add("my_jobs", "my jobs")
+command_router.add("hi", "hi")
+command_router.add("delete_account", "delete account")
+command_router.add("confirm_delete", "confirm delete")
+command_router.add("post_job", "post job", "post a job", "post new job", "post another job", contains=True)
+command_router.add("find_job", "find job", "find a job", "find new job", "find another job", contains=True)
+command_router.add(
+    "mark_complete",
+    "complete job", "mark as complete", "mark job as complete", "job complete", "done with job",
+    contains=True
+)
+
+# The Dialogflow flow each job command starts
+JOB_ACTIONS = {
+    "post_job": "Post Job",
+    "find_job": "Find Job",
+    "mark_complete": "Mark Job as Complete",
+}
 
 class WhatsAppController:
-    def __init__(self):
+    def __init__(self, dialogflow_controller=None):
         """
         Initialize the WhatsAppController with the necessary clients and data structures.
+
+        Args:
+            dialogflow_controller (DialogflowController, optional): A controller to share, so the
+                app keeps a single Dialogflow channel. Defaults to a new one.
         """
         self.whatsapp_client = WhatsAppClient()
-        self.dialogflow_controller = DialogflowController()
+        self.outbound_dispatcher = outbound_dispatcher
+        self.dialogflow_controller = dialogflow_controller or DialogflowController()
+        # The job flows run in Dialogflow, or in-process on the same fulfillment handlers
+        if CONVERSATION_BACKEND == "local":
+            self.conversation = ConversationController(self.dialogflow_controller)
+        else:
+            self.conversation = self.dialogflow_controller
         self.sessions = {}
-        self.processed_message_ids = set()
+        # Senders recently in a Dialogflow flow, which does not report when a flow ends
+        self.active_flows = TTLCache(CONVERSATION_SESSION_MAX_SIZE, CONVERSATION_SESSION_TTL)
         self.website_url = WEBSITE_URL
 
     async def process_text_message(self, recipient_number, recipient_name, recipient_message):
@@ -26,82 +70,65 @@ class WhatsAppController:
             recipient_message (str): The message sent by the recipient.
         """
         try:
-            post_job_phrases = ["post job", "post a job", "post new job", "post another job"]
-            find_job_phrases = ["find job", "find a job", "find new job", "find another job"]
-            mark_complete_phrases = ["complete job", "mark as complete", "mark job as complete", "job complete", "done with job"]
+            command = command_router.route(recipient_message, contains=not self.in_flow(recipient_number))
 
             user = await UserRepository.get_user_by_phone_number(recipient_number)
             if not user:
-                if recipient_message.lower() == "agree" or recipient_message.lower() == "decline":
-                    if recipient_message.lower() == "agree":
-                        await self.register_new_user(recipient_number, recipient_name)
-                        return
-                
-                    if recipient_message.lower() == "decline":
-                        await self.send_decline_message(recipient_number)
+                if command == "agree":
+                    await self.register_new_user(recipient_number, recipient_name)
+                elif command == "decline":
+                    await self.send_decline_message(recipient_number)
                 else:
                     await self.request_user_agreement(recipient_number)
-                    return
+                return
 
-            if recipient_message.lower() == "help":
+            if command == "help":
                 await self.send_help_message(recipient_number)
-                return
-            
-            if recipient_message.lower() == "privacy":
+            elif command == "privacy":
                 await self.send_privacy_message(recipient_number)
-                return
-            
-            if recipient_message.lower() == "my jobs":
+            elif command == "my_jobs":
                 await self.job_list(recipient_number)
-                return
-            
-            if recipient_message.lower() == "hi":
+            elif command == "hi":
                 await self.welcome_msg(recipient_number, recipient_name)
-                return
-            
-            if recipient_message.lower() == "delete account":
+            elif command == "delete_account":
                 await self.handle_delete_account_request(recipient_number)
-                return
-            
-            if recipient_message.lower() == "confirm delete":
+            elif command == "confirm_delete":
                 await self.handle_confirm_delete(recipient_number)
-                return
-
-            if recipient_message.lower() in post_job_phrases + find_job_phrases + mark_complete_phrases:
-                await self.handle_job_action(recipient_number, recipient_message, user, post_job_phrases, find_job_phrases, mark_complete_phrases)
+            elif command in JOB_ACTIONS:
+                await self.handle_job_action(recipient_number, JOB_ACTIONS[command], user)
             else:
                 await self.handle_continued_conversation(recipient_number, recipient_message, user)
         except Exception as e:
             print(f"Error processing text message: {e}")
             await self.send_error_message(recipient_number)
 
-    async def handle_job_action(self, recipient_number, recipient_message, user, post_job_phrases, find_job_phrases, mark_complete_phrases):
+    def in_flow(self, recipient_number):
+        """
+        Return True if the user may be answering a question of a job flow.
+
+        Args:
+            recipient_number (str): The phone number of the recipient.
+        """
+        if self.conversation is not self.dialogflow_controller:
+            return self.conversation.has_active_flow(recipient_number)
+        return self.active_flows.peek(recipient_number) is not None
+
+    async def handle_job_action(self, recipient_number, job_action, user):
         """
         Handle the job-related actions (post job, find job, or mark job as complete).
 
         Args:
             recipient_number (str): The phone number of the recipient.
-            recipient_message (str): The message sent by the recipient.
+            job_action (str): The Dialogflow flow to start: "Post Job", "Find Job" or "Mark Job as Complete".
             user (User): The user object retrieved from the database.
-            post_job_phrases (list): List of phrases indicating a post job action.
-            find_job_phrases (list): List of phrases indicating a find job action.
-            mark_complete_phrases (list): List of phrases indicating a mark job as complete action.
         """
         try:
             chat_session_id = str(uuid.uuid4())
             self.sessions[recipient_number] = chat_session_id
+            await ChatSessionRepository.create_chat_session(chat_session_id, job_action, user.id)
+            self.active_flows.set(recipient_number, True)
 
-            if any(phrase in recipient_message.lower() for phrase in post_job_phrases):
-                recipient_message = "Post Job"
-                await ChatSessionRepository.create_chat_session(chat_session_id, recipient_message, user.id)
-            elif any(phrase in recipient_message.lower() for phrase in find_job_phrases):
-                recipient_message = "Find Job"
-                await ChatSessionRepository.create_chat_session(chat_session_id, recipient_message, user.id)
-            elif any(phrase in recipient_message.lower() for phrase in mark_complete_phrases):
-                recipient_message = "Mark Job as Complete"
-                await ChatSessionRepository.create_chat_session(chat_session_id, recipient_message, user.id)
-
-            dialogflow_response = await self.dialogflow_controller.handle_message(recipient_message, recipient_number, chat_session_id)
+            dialogflow_response = await self.conversation.handle_message(job_action, recipient_number, chat_session_id)
             if dialogflow_response:
                 await self.process_dialogflow_response(recipient_number, dialogflow_response)
             else:
@@ -131,7 +158,8 @@ class WhatsAppController:
                     self.sessions[recipient_number] = chat_session_id
                     chat_session = await ChatSessionRepository.create_chat_session(chat_session_id, "Post Job", user.id)
 
-            dialogflow_response = await self.dialogflow_controller.handle_message(recipient_message, recipient_number, chat_session_id)
+            self.active_flows.set(recipient_number, True)
+            dialogflow_response = await self.conversation.handle_message(recipient_message, recipient_number, chat_session_id)
             if dialogflow_response:
                 await self.process_dialogflow_response(recipient_number, dialogflow_response)
             else:
@@ -182,43 +210,61 @@ class WhatsAppController:
             recipient_number (str): The phone number of the recipient.
         """
         try:
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Post Job",
-                        "title": "Post Job"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Find Job",
-                        "title": "Find Job"
-                    }
-                },
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "Mark Job as Complete",
-                            "title": "Mark Job as Complete"
-                        }
-                    }
-            ]
-            response_message = (
-                f"*We encountered an issue processing your request.*\n\n"
-                f"Please try one of the following options:\n"
-                f'1️⃣ Post Job: Type "Post Job" to start posting a new job.\n'
-                f'2️⃣ Find Job: Type "Find Job" to search for available jobs.\n'
-                f'3️⃣ Mark Job as Complete: Type "Mark Job as Complete" to update the job status to complete.\n\n'
-                f"If you need any assistance, just type 'help'. 💬"
-            )
-            interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, interactive_message, 'interactive')
+            await self.whatsapp_client.send_template(recipient_number, "default_options")
         except Exception as e:
             print(f"Error sending default options: {e}")
             await self.send_error_message(recipient_number)
 
+    def split_messages(self, body):
+        """
+        Split a webhook delivery into one single-message body per message. Meta may batch
+        several entries, changes and messages into one POST.
+
+        Args:
+            body (dict): The request body from WhatsApp.
+
+        Returns:
+            list: (message_id, sender, message_body) tuples in delivery order, where message_body
+                has the shape handle_whatsapp_message expects.
+        """
+        messages = []
+        for entry in body.get("entry", []):
+            for change in entry.get("changes", []):
+                value = change.get("value", {})
+                contacts = value.get("contacts", [])
+                for message in value.get("messages", []):
+                    sender = message.get("from")
+                    # Keep only the sender's contact so the handler's contacts[0] is the right person
+                    contact = next((c for c in contacts if c.get("wa_id") == sender), None)
+                    message_value = {
+                        **value,
+                        "contacts": [contact] if contact else contacts,
+                        "messages": [message]
+                    }
+                    message_body = {
+                        "object": body.get("object"),
+                        "entry": [{**entry, "changes": [{**change, "value": message_value}]}]
+                    }
+                    messages.append((message["id"], sender, message_body))
+        return messages
+
+    def split_statuses(self, body):
+        """
+        Collect every status update in a webhook delivery.
+
+        Args:
+            body (dict): The request body from WhatsApp.
+
+        Returns:
+            list: The status values, e.g. "sent", "delivered", "read".
+        """
+        return [
+            status.get("status")
+            for entry in body.get("entry", [])
+            for change in entry.get("changes", [])
+            for status in change.get("value", {}).get("statuses", [])
+        ]
+
     async def handle_whatsapp_message(self, body):
         """
         Handle the incoming message from WhatsApp.
@@ -229,12 +275,16 @@ class WhatsAppController:
         Returns:
             dict: The response to be sent back to WhatsApp.
         """
+        # Resolve the sender once per message, however many handlers look them up
+        with user_cache.request_scope():
+            return await self._handle_whatsapp_message(body)
+
+    async def _handle_whatsapp_message(self, body):
         try:
             value = body["entry"][0]["changes"][0]["value"]
             message = value["messages"][0]
             recipient_number = value["contacts"][0]["wa_id"]
             recipient_name = value["contacts"][0]["profile"]['name']
-            message_id = message["id"]
 
             user = await UserRepository.get_user_by_phone_number(recipient_number)
             if not user:
@@ -249,23 +299,15 @@ class WhatsAppController:
                     else:
                         recipient_message = None
 
-                if recipient_message:       
-                    if recipient_message.lower() == "agree" or recipient_message.lower() == "decline":
-                        if recipient_message.lower() == "agree":
-                            await self.register_new_user(recipient_number, recipient_name)
-                            return {"status": "ok"}
-                    
-                        if recipient_message.lower() == "decline":
-                            await self.send_decline_message(recipient_number)
-                            return {"status": "ok"}
+                if recipient_message:
+                    command = command_router.route(recipient_message)
+                    if command == "agree":
+                        await self.register_new_user(recipient_number, recipient_name)
+                    elif command == "decline":
+                        await self.send_decline_message(recipient_number)
                     else:
                         await self.request_user_agreement(recipient_number)
-                        return {"status": "ok"}
-
-            if message_id in self.processed_message_ids:
-                return {"status": "ok"}
-
-            self.processed_message_ids.add(message_id)
+                    return {"status": "ok"}
 
             if message["type"] == "text":
                 recipient_message = message["text"]["body"]
@@ -300,39 +342,7 @@ class WhatsAppController:
             recipient_name (str): The name of the recipient.
         """
         try:
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Post Job",
-                        "title": "Post Job"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Find Job",
-                        "title": "Find Job"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Mark Job as Complete",
-                        "title": "Mark Job as Complete"
-                    }
-                }
-            ]
-            response_message = (
-                f"Hello, {recipient_name}! This is HOME SERVICE CHATBOT! 🏠🤖\n\n"
-                f"✨ What would you like to do today?\n"
-                f"1️⃣ Post Job\n"
-                f"2️⃣ Find Job\n"
-                f"3️⃣ Mark Job as Complete\n\n"
-                f"If you need any assistance, just type 'help'. 💬"
-            )
-            interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, interactive_message, 'interactive')
+            await self.whatsapp_client.send_template(recipient_number, "welcome", recipient_name=recipient_name)
         except Exception as e:
             print(f"Error welcome msg: {e}")
             await self.send_error_message(recipient_number)
@@ -348,40 +358,7 @@ class WhatsAppController:
         try:
             user = await UserRepository.create_user(recipient_name, recipient_number)
             if user:
-                buttons = [
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "Post Job",
-                            "title": "Post Job"
-                        }
-                    },
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "Find Job",
-                            "title": "Find Job"
-                        }
-                    },
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": "Mark Job as Complete",
-                            "title": "Mark Job as Complete"
-                        }
-                    }
-                ]
-                response_message = (
-                    f"Hello, this is HOME SERVICE CHATBOT! 🏠🤖\n\n"
-                    f"Welcome, {recipient_name}! You have been successfully registered in our system. 🎉\n\n"
-                    f"✨ What would you like to do next?\n"
-                    f"1️⃣ Post Job\n"
-                    f"2️⃣ Find Job\n"
-                    f"3️⃣ Mark Job as Complete\n\n"
-                    f"If you need any assistance, just type 'help'. 💬"
-                )
-                interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-                await self.whatsapp_client.send_whatsapp_message(recipient_number, interactive_message, 'interactive')
+                await self.whatsapp_client.send_template(recipient_number, "registered", recipient_name=recipient_name)
         except Exception as e:
             print(f"Error registering new user: {e}")
             await self.send_error_message(recipient_number)
@@ -395,29 +372,7 @@ class WhatsAppController:
             recipient_name (str): The name of the recipient.
         """
         try:
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Agree",
-                        "title": "Agree"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": "Decline",
-                        "title": "Decline"
-                    }
-                }
-            ]
-            response_message = (
-                f"Hello, this is HOME SERVICE CHATBOT! 🏠🤖\n\n"
-                f"To proceed, please note that by using this service, your phone number will be saved for job-related notifications and updates."
-                f"Your data is secure and handled according to our privacy policy. 🛡️ Reply 'Agree' to continue."
-            )
-            interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, interactive_message, 'interactive')
+            await self.whatsapp_client.send_template(recipient_number, "user_agreement")
         except Exception as e:
             print(f"Error requesting user agreement: {e}")
             await self.send_error_message(recipient_number)
@@ -433,11 +388,7 @@ class WhatsAppController:
         try:
             user = await UserRepository.get_user_by_phone_number(recipient_number)
             if not user:
-                decline_message = (
-                    f"We respect your choice. However, you need to agree to our data handling policy to use our services. "
-                    f"If you change your mind, please type 'Agree' to proceed."
-                )
-                await self.whatsapp_client.send_whatsapp_message(recipient_number, decline_message, 'text')
+                await self.whatsapp_client.send_template(recipient_number, "decline")
         except Exception as e:
             print(f"Error sending decline message: {e}")
             await self.send_error_message(recipient_number)
@@ -450,15 +401,7 @@ class WhatsAppController:
             recipient_number (str): The phone number of the recipient.
         """
         try:
-            help_message = (
-                "📋 *Help Guide*\n\n"
-                "   🔹 *Post Job:* Type 'Post Job' to start posting a new job.\n\n"
-                "   🔹 *Find Job:* Type 'Find Job' to search for available jobs.\n\n"
-                "   🔹 *My Jobs:* Type 'My Jobs' to see a list of jobs you have posted or accepted.\n\n"
-                "   🔹 *Privacy:* Your data is secure. Type 'Privacy' for info.\n"
-
-            )
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, help_message, 'text')
+            await self.whatsapp_client.send_template(recipient_number, "help")
         except Exception as e:
             print(f"Error sending help message: {e}")
             await self.send_error_message(recipient_number)
@@ -471,13 +414,7 @@ class WhatsAppController:
             recipient_number (str): The phone number of the recipient.
         """
         try:
-            privacy_message = (
-                "🔒 *Privacy Policy Overview*\n\n"
-                "We take your privacy seriously. Your phone number and data are stored securely and used only for service-related communications, such as job notifications and updates. We do not share your data with unauthorized third parties.\n\n"
-                "If you wish to delete your account and all associated data, please type 'Delete Account'.\n\n"
-                f"For more details, please visit our full privacy policy at: {self.website_url}/privacy-policy"
-            )
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, privacy_message, 'text')
+            await self.whatsapp_client.send_template(recipient_number, "privacy")
         except Exception as e:
             print(f"Error sending privacy message: {e}")
             await self.send_error_message(recipient_number)
@@ -491,8 +428,7 @@ class WhatsAppController:
             recipient_number (str): The phone number of the recipient.
         """
         try:
-            response_message = "We encountered an issue processing your request. Please try again later."
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, response_message, 'text')
+            await self.whatsapp_client.send_template(recipient_number, "error")
         except Exception as e:
             print(f"Error sending error message: {e}")
 
@@ -550,7 +486,7 @@ class WhatsAppController:
                 }
             ]
             interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-            await self.whatsapp_client.send_whatsapp_message(session.metadata.recipient_number, interactive_message, 'interactive')
+            await self.outbound_dispatcher.send(session.metadata.recipient_number, interactive_message, 'interactive')
         except Exception as e:
             print(f"Error generating payment success message: {e}")
 
@@ -587,8 +523,9 @@ class WhatsAppController:
                     response_message += "🌟 *Your Posted Jobs:*\n\n"
                     for idx, job in enumerate(posted_jobs, 1):
                         job_time_str = job.date_time.strftime("%m/%d/%Y at %I:%M %p")
+                        job_category_name = await category_catalog.get_name(job.category_id)
                         response_message += (
-                            f"*{idx}) Job ID #{job.id}:* {job.category.name.capitalize()} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f} - {job.status.capitalize()}\n\n"
+                            f"*{idx}) Job ID #{job.id}:* {job_category_name} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f} - {job.status.capitalize()}\n\n"
                         )
 
                 # Check and list accepted jobs
@@ -596,8 +533,9 @@ class WhatsAppController:
                     response_message += "👍 *Your Accepted Jobs:*\n\n"
                     for idx, job in enumerate(accepted_jobs, 1):
                         job_time_str = job.date_time.strftime("%m/%d/%Y at %I:%M %p")
+                        job_category_name = await category_catalog.get_name(job.category_id)
                         response_message += (
-                            f"*{idx}) Job ID #{job.id}:* {job.category.name.capitalize()} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f} - {job.status.capitalize()}\n\n"
+                            f"*{idx}) Job ID #{job.id}:* {job_category_name} on {job_time_str} in ZIP {job.zip_code} for ${job.amount:.2f} - {job.status.capitalize()}\n\n"
                         )
 
                 # If no jobs were found, provide a different response
@@ -632,18 +570,7 @@ class WhatsAppController:
                 return
             
             # Send acknowledgment and ask for confirmation
-            buttons = [
-                {"type": "reply", "reply": {"id": "Confirm Delete", "title": "Confirm Delete"}},
-                {"type": "reply", "reply": {"id": "Cancel", "title": "Cancel"}}
-            ]
-            response_message = (
-                "⚠️ *Account Deletion Request*\n\n"
-                "You have requested to delete your account. This action is irreversible. All your data, "
-                "including posted jobs, accepted jobs, and payment details, will be permanently deleted.\n\n"
-                "If you wish to proceed, please confirm by clicking 'Confirm Delete' below."
-            )
-            interactive_message = await self.dialogflow_controller.create_button_message(response_message, buttons)
-            await self.whatsapp_client.send_whatsapp_message(recipient_number, interactive_message, "interactive")
+            await self.whatsapp_client.send_template(recipient_number, "delete_account_confirm")
         except Exception as e:
             logging.error(f"Error handling delete account request for {recipient_number}: {e}")
             await self.send_error_message(recipient_number)
@@ -685,8 +612,10 @@ class WhatsAppController:
             # Perform the deletion steps
             deletion_success = True
             try:
+                # Collected first: anonymizing clears accepted_by, which the notifications are addressed by
+                notifications = await self.get_affected_user_notifications(user)
                 await self.anonymize_user_data(user)
-                await self.notify_affected_users(user)
+                await self.notify_affected_users(notifications)
                 await self.log_deletion_request(user)
             except Exception as deletion_error:
                 deletion_success = False
@@ -737,6 +666,7 @@ class WhatsAppController:
                 update_data={
                     "name": "Deleted User",
                     "phone_number": None,
+                    "phone_number_index": None,
                     "deleted_at": datetime.now(timezone.utc),
                 }
             )
@@ -785,42 +715,66 @@ class WhatsAppController:
             logging.error(f"Error anonymizing user data: {e}")
             raise e
 
-    async def notify_affected_users(self, user):
+    async def get_affected_user_notifications(self, user):
         """
-        Notify users affected by the account deletion.
+        Build the notifications for users affected by an account deletion, before it changes their jobs.
 
         Args:
             user (User): The user object whose deletion affects other users.
+
+        Returns:
+            list: The messages in the WhatsAppClient.broadcast format.
         """
         try:
-            # Step 1: Notify job seekers
-            posted_jobs = await JobRepository.find_all_jobs_with_conditions(
-                conditions={"posted_by": user.id},
-                order=[("id", "asc")]
+            posted_jobs, accepted_jobs = await asyncio.gather(
+                JobRepository.find_all_jobs_with_conditions(
+                    conditions={"posted_by": user.id},
+                    order=[("id", "asc")]
+                ),
+                JobRepository.find_all_jobs_with_conditions(
+                    conditions={"accepted_by": user.id},
+                    order=[("id", "asc")]
+                )
             )
-            for job in posted_jobs:
-                if job.accepted_by:
-                    seeker = await UserRepository.get_user_by_id(job.accepted_by)
-                    if seeker:
-                        await self.whatsapp_client.send_whatsapp_message(
-                            seeker.phone_number,
-                            f"⚠️ The job ID #{job.id} has been canceled due to the poster's account deletion.",
-                            "text"
-                        )
+
+            # Step 1: Notify job seekers
+            messages = [
+                {
+                    "user_id": job.accepted_by,
+                    "message": f"⚠️ The job ID #{job.id} has been canceled due to the poster's account deletion.",
+                    "message_type": "text"
+                }
+                for job in posted_jobs or [] if job.accepted_by
+            ]
 
             # Step 2: Notify job posters
-            accepted_jobs = await JobRepository.find_all_jobs_with_conditions(
-                conditions={"accepted_by": user.id},
-                order=[("id", "asc")]
-            )
-            for job in accepted_jobs:
-                poster = await UserRepository.get_user_by_id(job.posted_by)
-                if poster:
-                    await self.whatsapp_client.send_whatsapp_message(
-                        poster.phone_number,
-                        f"⚠️ The job ID #{job.id} has been marked as available due to the acceptor's account deletion.",
-                        "text"
-                    )
+            messages += [
+                {
+                    "user_id": job.posted_by,
+                    "message": f"⚠️ The job ID #{job.id} has been marked as available due to the acceptor's account deletion.",
+                    "message_type": "text"
+                }
+                for job in accepted_jobs or []
+            ]
+            return messages
+        except Exception as e:
+            logging.error(f"Error collecting affected users: {e}")
+            raise e
+
+    async def notify_affected_users(self, notifications):
+        """
+        Queue the notifications for users affected by an account deletion.
+
+        Args:
+            notifications (list): The messages built by get_affected_user_notifications.
+        """
+        try:
+            if notifications:
+                results = await self.whatsapp_client.broadcast(
+                    notifications, send=self.outbound_dispatcher.send, accepted_status="queued"
+                )
+                queued = sum(result["status"] == "queued" for result in results)
+                logging.info(f"Queued {queued} of {len(results)} account deletion notifications.")
         except Exception as e:
             logging.error(f"Error notifying affected users: {e}")
             raise e
@@ -0,0 +1,113 @@
+import time
+from database.repositories import CategoryRepository
+from config import CATEGORY_CATALOG_REFRESH_SECONDS
+
+
+class CategoryCatalog:
+    # Minimum seconds between reloads triggered by a lookup miss
+    MISS_REFRESH_INTERVAL = 60
+
+    def __init__(self, refresh_interval=CATEGORY_CATALOG_REFRESH_SECONDS):
+        """
+        Initialize an in-memory catalog of the categories table with O(1) lookups
+        by ID and by case-insensitive name.
+
+        Args:
+            refresh_interval (float): The number of seconds before the catalog is reloaded.
+        """
+        self.refresh_interval = refresh_interval
+        self._by_id = {}
+        self._by_name = {}
+        self._loaded_at = None
+
+    async def refresh(self):
+        """
+        Reload every category from the database.
+
+        Returns:
+            bool: True if the catalog was reloaded, False if the query failed.
+        """
+        categories = await CategoryRepository.get_all_categories()
+        if categories is None:
+            return False
+
+        # Swap both maps at once so readers never see a half-built catalog
+        by_id = {category.id: category for category in categories}
+        by_name = {category.name.casefold(): category for category in categories}
+        self._by_id, self._by_name = by_id, by_name
+        self._loaded_at = time.monotonic()
+        return True
+
+    async def get_by_id(self, category_id):
+        """
+        Retrieve a category by its ID.
+
+        Args:
+            category_id (int): The ID of the category.
+
+        Returns:
+            Category: The category object if found, else None.
+        """
+        await self._refresh_if_stale()
+        category = self._by_id.get(category_id)
+        if category is None and await self._refresh_on_miss():
+            category = self._by_id.get(category_id)
+        return category
+
+    async def get_by_name(self, category_name):
+        """
+        Retrieve a category by its name, ignoring case.
+
+        Args:
+            category_name (str): The name of the category.
+
+        Returns:
+            Category: The category object if found, else None.
+        """
+        if not category_name:
+            return None
+
+        await self._refresh_if_stale()
+        key = category_name.strip().casefold()
+        category = self._by_name.get(key)
+        if category is None and await self._refresh_on_miss():
+            category = self._by_name.get(key)
+        return category
+
+    async def get_name(self, category_id):
+        """
+        Retrieve the display name of a category.
+
+        Args:
+            category_id (int): The ID of the category.
+
+        Returns:
+            str: The capitalized category name, or "Unknown" if not found.
+        """
+        category = await self.get_by_id(category_id)
+        return category.name.capitalize() if category else "Unknown"
+
+    def stats(self):
+        """
+        Return the catalog size and age.
+
+        Returns:
+            dict: The catalog statistics.
+        """
+        return {
+            "size": len(self._by_id),
+            "age_seconds": round(time.monotonic() - self._loaded_at) if self._loaded_at else None,
+        }
+
+    async def _refresh_if_stale(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.refresh_interval:
+            await self.refresh()
+
+    async def _refresh_on_miss(self):
+        # A category added after the last load; reload, but not on every miss
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.MISS_REFRESH_INTERVAL:
+            return False
+        return await self.refresh()
+
+
+category_catalog = CategoryCatalog()
@@ -1,4 +1,8 @@
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
@@ -8,6 +12,22 @@ from sqlalchemy.engine import URL
 # Load environment variables from .env file
 load_dotenv()
 
+# Connection pool settings (shared by every session in the process)
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", 30))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", 1800))
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+
+# Threads used to run blocking queries off the event loop. Sized to the pool so
+# a worker never waits on a connection checkout; 0 runs queries inline instead.
+DATABASE_EXECUTOR_WORKERS = int(os.getenv("DATABASE_EXECUTOR_WORKERS", DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW))
+
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+_executor = None
+
 def create_engine():
     """
     Create and return a SQLAlchemy engine using environment variables.
@@ -25,16 +45,103 @@ def create_engine():
             "mssql+pyodbc",
             query={"odbc_connect": connection_string}
         )
-        engine = sa.create_engine(connection_url)
+        engine = sa.create_engine(
+            connection_url,
+            pool_size=DATABASE_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_timeout=DATABASE_POOL_TIMEOUT,
+            pool_recycle=DATABASE_POOL_RECYCLE,
+            pool_pre_ping=DATABASE_POOL_PRE_PING,
+        )
         return engine
     except Exception as e:
         print(f"Error creating engine: {e}")
         raise e
 
+def get_engine():
+    """
+    Return the process-wide SQLAlchemy engine, creating it on first use.
+    """
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine()
+                # Keep loaded attributes usable after the session is closed,
+                # since repositories return detached objects to the controllers.
+                _session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+                _engine = engine
+    return _engine
+
 def create_session():
     """
-    Create and return a SQLAlchemy session.
+    Create and return a SQLAlchemy session bound to the shared engine.
+
+    The caller is responsible for closing the session; prefer session_scope().
+    """
+    get_engine()
+    return _session_factory()
+
+@contextmanager
+def session_scope():
+    """
+    Provide a session that is rolled back on error and always closed,
+    returning its connection to the pool.
+
+    Yields:
+        Session: A SQLAlchemy session bound to the shared engine.
+    """
+    session = create_session()
+    try:
+        yield session
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+def get_executor():
+    """
+    Return the process-wide executor used for database work, creating it on first use.
+    """
+    global _executor
+    if _executor is None:
+        with _engine_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DATABASE_EXECUTOR_WORKERS,
+                    thread_name_prefix="db"
+                )
+    return _executor
+
+def run_in_session_sync(work):
+    """
+    Run a unit of database work inside session_scope() on the calling thread.
+
+    Args:
+        work (callable): A function taking a session and returning a result.
+
+    Returns:
+        The value returned by work.
+    """
+    with session_scope() as session:
+        return work(session)
+
+async def run_in_session(work):
     """
-    engine = create_engine()
-    Session = sessionmaker(bind=engine)
-    return Session()
\ No newline at end of file
+    Run a unit of database work on the database executor so the event loop
+    keeps serving other requests while the query is in flight.
+
+    Falls back to running inline when DATABASE_EXECUTOR_WORKERS is 0.
+
+    Args:
+        work (callable): A function taking a session and returning a result.
+
+    Returns:
+        The value returned by work.
+    """
+    if DATABASE_EXECUTOR_WORKERS <= 0:
+        return run_in_session_sync(work)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), run_in_session_sync, work)
@@ -14,6 +14,8 @@ class User(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(255), nullable=False)
     phone_number = Column(Text, nullable=True)
+    phone_number_index = Column(String(64), nullable=True)
+    stripe_customer_id = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime(timezone=True), onupdate=lambda: datetime.now(timezone.utc))
     deleted_at = Column(DateTime(timezone=True), nullable=True)
@@ -24,6 +26,13 @@ class User(Base):
     addresses = relationship('Address', back_populates='user')
     stripe_user = relationship('StripeUser', back_populates='user')
 
+    __table_args__ = (
+        Index(
+            'idx_user_phone_number_index', 'phone_number_index',
+            unique=True, mssql_where=phone_number_index.isnot(None)
+        ),
+    )
+
 class Category(Base):
     __tablename__ = 'categories'
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -102,6 +111,26 @@ class StripeUser(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     stripe_user_id = Column(String(255), nullable=False)
+    payouts_enabled = Column(NVARCHAR(10), default="false")
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     updated_at = Column(DateTime(timezone=True), onupdate=lambda: datetime.now(timezone.utc))
     user = relationship('User', back_populates='stripe_user')
+
+class StripeOperation(Base):
+    __tablename__ = 'stripe_operations'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idempotency_key = Column(String(255), nullable=False, unique=True)
+    operation = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    job_id = Column(Integer, ForeignKey('jobs.id'), nullable=True)
+    status = Column(Enum('pending', 'processing', 'succeeded', 'failed', name='stripe_operation_status_enum'), default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    result_id = Column(String(255), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(DateTime(timezone=True), onupdate=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index('idx_stripe_operation_due', 'status', 'next_attempt_at'),
+    )
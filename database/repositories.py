@@ -1,10 +1,12 @@
 import datetime
-from sqlalchemy import asc, desc, select, cast, String
-from sqlalchemy.orm import joinedload
-from database.models import User, Job, Category, ChatSession, Address, StripeUser
-from database.db_session import create_session
-from sqlalchemy.exc import SQLAlchemyError
+import json
+from sqlalchemy import asc, desc, select, cast, func, String
+from database.models import User, Job, Category, ChatSession, Address, StripeUser, StripeOperation
+from database.db_session import run_in_session, run_in_session_sync
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from utils.general_utils import GeneralUtils
+from utils.user_cache import user_cache
+from config import BLIND_INDEX_LEGACY_FALLBACK
 
 
 
@@ -13,28 +15,52 @@ class UserRepository:
     async def get_user_by_phone_number(phone_number: str):
         """
         Retrieve a user by their phone number.
-        
+
         Args:
             phone_number (str): The phone number of the user.
-        
+
         Returns:
             User: The user object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             utils = GeneralUtils()
-            encrypt_phone_number = utils.encrypt_aes(phone_number)
-            user = session.query(User).filter(cast(User.phone_number, String) == encrypt_phone_number).first()
+            phone_number_index = utils.get_blind_index(phone_number)
+            user = session.query(User).filter(User.phone_number_index == phone_number_index).first()
+
+            if not user and BLIND_INDEX_LEGACY_FALLBACK:
+                # Rows created before the blind index existed are matched on the
+                # encrypted column once, then indexed so the next lookup is a seek
+                encrypt_phone_number = utils.encrypt_aes(phone_number)
+                user = session.query(User).filter(
+                    User.phone_number_index == None,
+                    cast(User.phone_number, String) == encrypt_phone_number
+                ).first()
+                if user:
+                    user.phone_number_index = phone_number_index
+                    session.commit()
 
             if user:
                 decrypt_phone_number = utils.decrypt_aes(user.phone_number)
                 user.phone_number = decrypt_phone_number
-            
+
             return user
+
+        cached, user = user_cache.get_by_phone_number(phone_number)
+        if cached:
+            return user
+
+        try:
+            user = await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving user by phone number: {e}")
             return None
 
+        if user:
+            user_cache.set(user, phone_number)
+        else:
+            user_cache.set_missing(phone_number)
+        return user
+
     @staticmethod
     async def get_user_by_id(user_id: int):
         """
@@ -46,47 +72,112 @@ class UserRepository:
         Returns:
             User: The user object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             utils = GeneralUtils()
             user = session.query(User).filter(User.id == user_id).first()
 
             if user:
                 decrypt_phone_number = utils.decrypt_aes(user.phone_number)
                 user.phone_number = decrypt_phone_number
-            
+
+            return user
+
+        cached, user = user_cache.get_by_id(user_id)
+        if cached:
             return user
+
+        try:
+            user = await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving user by ID: {e}")
             return None
 
+        if user:
+            user_cache.set(user)
+        return user
+
+    @staticmethod
+    async def get_users_by_ids(user_ids):
+        """
+        Retrieve many users by ID, serving cached users and loading the rest in one query.
+
+        Args:
+            user_ids (iterable): The unique identifiers of the users.
+
+        Returns:
+            dict: The users found, keyed by ID. Missing IDs are left out.
+        """
+        users = {}
+        missing = []
+        for user_id in set(user_ids):
+            cached, user = user_cache.get_by_id(user_id)
+            if cached:
+                if user:
+                    users[user_id] = user
+            else:
+                missing.append(user_id)
+
+        if not missing:
+            return users
+
+        def _work(session):
+            utils = GeneralUtils()
+            loaded = session.query(User).filter(User.id.in_(missing)).all()
+            for user in loaded:
+                if user.phone_number:
+                    user.phone_number = utils.decrypt_aes(user.phone_number)
+            return loaded
+
+        try:
+            loaded = await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error retrieving users by ID: {e}")
+            return users
+
+        for user in loaded:
+            user_cache.set(user)
+            users[user.id] = user
+        return users
+
     @staticmethod
     async def create_user(name: str, phone_number: str):
         """
         Create a new user with the given name and phone number.
-        
+
         Args:
             name (str): The name of the user.
             phone_number (str): The phone number of the user.
-        
+
         Returns:
             User: The created user object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             utils = GeneralUtils()
             encrypt_phone_number = utils.encrypt_aes(phone_number)
-            user = User(name=name, phone_number=encrypt_phone_number)
+            user = User(
+                name=name,
+                phone_number=encrypt_phone_number,
+                phone_number_index=utils.get_blind_index(phone_number)
+            )
             session.add(user)
             session.commit()
             session.refresh(user)
             user.phone_number = phone_number
             return user
+
+        # Drop a memoized "not registered" answer for this number
+        user_cache.invalidate(phone_number=phone_number)
+
+        try:
+            user = await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error creating user: {e}")
-            session.rollback()
             return None
 
+        if user:
+            user_cache.set(user, phone_number)
+        return user
+
     @staticmethod
     async def update_user(user_id, update_data):
         """
@@ -99,62 +190,173 @@ class UserRepository:
         Returns:
             User: The updated user object, or None if the update failed.
         """
-        try:
-            session = create_session()
+        def _work(session):
             user = session.query(User).filter(User.id == user_id).first()
             if not user:
                 return None
 
+            fields = dict(update_data)
+
+            # Keep the encrypted phone number and its blind index in step
+            if "phone_number" in fields:
+                utils = GeneralUtils()
+                phone_number = fields["phone_number"]
+                fields["phone_number"] = utils.encrypt_aes(phone_number) if phone_number else None
+                fields.setdefault("phone_number_index", utils.get_blind_index(phone_number) if phone_number else None)
+
             # Update the fields provided in the update_data dictionary
-            for key, value in update_data.items():
+            for key, value in fields.items():
                 setattr(user, key, value)
 
             session.commit()
             session.refresh(user)
             return user
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
-            session.rollback()
             print(f"Error updating user: {e}")
             return None
+        finally:
+            user_cache.invalidate(user_id=user_id)
+
+    @staticmethod
+    async def set_stripe_customer_id(user_id, stripe_customer_id):
+        """
+        Store a user's Stripe customer ID unless one is already stored.
+
+        Args:
+            user_id (int): The ID of the user.
+            stripe_customer_id (str): The Stripe customer ID.
+
+        Returns:
+            str: The stored Stripe customer ID, which is the earlier one if another request won the race,
+                or None if the update failed.
+        """
+        def _work(session):
+            # Only fill an empty mapping, so concurrent first posts agree on one customer
+            session.query(User).filter(
+                User.id == user_id, User.stripe_customer_id == None
+            ).update({User.stripe_customer_id: stripe_customer_id}, synchronize_session=False)
+            session.commit()
+            return session.query(User.stripe_customer_id).filter(User.id == user_id).scalar()
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error storing Stripe customer ID: {e}")
+            return None
+        finally:
+            user_cache.invalidate(user_id=user_id)
+
+    @staticmethod
+    async def backfill_phone_number_index(batch_size=500):
+        """
+        Populate the phone number blind index for users created before it existed.
+
+        Legacy rows may share a phone number, which the unique index rejects. Such a user is left
+        unindexed and reported, and the backfill carries on with the next users.
+
+        Args:
+            batch_size (int): The number of users to index per transaction.
+
+        Returns:
+            tuple: (indexed, duplicates): the number of users indexed, and a list of
+                (user_id, indexed_user_id) pairs of users whose phone number another user already has.
+        """
+        def _work(session, after_id):
+            utils = GeneralUtils()
+            users = (
+                session.query(User)
+                .filter(User.id > after_id, User.phone_number_index == None, User.phone_number != None)
+                .order_by(User.id)
+                .limit(batch_size)
+                .all()
+            )
+            indexes = {user.id: utils.get_blind_index(utils.decrypt_aes(user.phone_number)) for user in users}
+            for user in users:
+                user.phone_number_index = indexes[user.id]
+            try:
+                session.commit()
+                return len(users), [], max(indexes) if indexes else None
+            except IntegrityError:
+                session.rollback()
+
+            # A duplicate is in the batch: index one user at a time to find it
+            indexed = 0
+            duplicates = []
+            for user_id, phone_number_index in indexes.items():
+                session.query(User).filter(User.id == user_id).update(
+                    {User.phone_number_index: phone_number_index}, synchronize_session=False
+                )
+                try:
+                    session.commit()
+                    indexed += 1
+                except IntegrityError:
+                    session.rollback()
+                    indexed_user_id = session.query(User.id).filter(User.phone_number_index == phone_number_index).scalar()
+                    duplicates.append((user_id, indexed_user_id))
+            return indexed, duplicates, max(indexes)
+
+        total_indexed = 0
+        all_duplicates = []
+        after_id = 0
+        try:
+            while True:
+                indexed, duplicates, last_id = await run_in_session(lambda session: _work(session, after_id))
+                total_indexed += indexed
+                all_duplicates += duplicates
+                for user_id, indexed_user_id in duplicates:
+                    print(f"User {user_id} not indexed: user {indexed_user_id} has the same phone number.")
+                if last_id is None:
+                    return total_indexed, all_duplicates
+                after_id = last_id
+        except SQLAlchemyError as e:
+            print(f"Error backfilling phone number index: {e}")
+            return total_indexed, all_duplicates
+
 class ChatSessionRepository:
     @staticmethod
     async def create_chat_session(chat_session_id, job_type, user_id):
         """
         Create a new chat session.
-        
+
         Args:
             chat_session_id (str): The ID of the chat session.
             job_type (str): The type of job associated with the chat session.
             user_id (int): The ID of the user associated with the chat session.
-        
+
         Returns:
             ChatSession: The created chat session object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             new_session = ChatSession(id=chat_session_id, job_type=job_type, user_id=user_id)
             session.add(new_session)
             session.commit()
             return new_session
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error creating chat session: {e}")
-            session.rollback()
             return None
 
     @staticmethod
     async def get_latest_chat_session_by_user(user_id):
         """
         Retrieve the latest chat session for a user.
-        
+
         Args:
             user_id (int): The ID of the user.
-        
+
         Returns:
             ChatSession: The latest chat session object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(ChatSession).filter_by(user_id=user_id).order_by(ChatSession.created_at.desc()).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving latest chat session: {e}")
             return None
@@ -163,27 +365,28 @@ class ChatSessionRepository:
     async def update_chat_session_job_id(chat_session_id: str, job_id: int):
         """
         Update the job ID associated with a chat session.
-        
+
         Args:
             chat_session_id (str): The ID of the chat session.
             job_id (int): The new job ID to associate with the chat session.
-        
+
         Returns:
             ChatSession: The updated chat session object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             chat_session = session.query(ChatSession).filter(ChatSession.id == chat_session_id).first()
             if chat_session:
                 chat_session.job_id = job_id
                 session.commit()
                 session.refresh(chat_session)
             return chat_session
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error updating chat session job ID: {e}")
-            session.rollback()
             return None
-    
+
     @staticmethod
     async def update_chat_sessions(where_criteria: dict, update_data: dict):
         """
@@ -196,8 +399,7 @@ class ChatSessionRepository:
         Returns:
             ChatSession: The updated chat_session object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             query = session.query(ChatSession)
 
             # Apply filters from the 'where_criteria' dictionary
@@ -215,35 +417,56 @@ class ChatSessionRepository:
             session.commit()
             session.refresh(chat_session)
             return chat_session
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error updating chat_session: {e}")
-            session.rollback()
             return None
 class CategoryRepository:
     @staticmethod
     async def get_category_by_name(category_name):
         """
         Retrieve a category by its name.
-        
+
         Args:
             category_name (str): The name of the category.
-        
+
         Returns:
             Category: The category object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(Category).filter_by(name=category_name).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving category by name: {e}")
             return None
 
+    @staticmethod
+    async def get_all_categories():
+        """
+        Retrieve every category.
+
+        Returns:
+            List[Category]: All category objects, or None if the query failed.
+        """
+        def _work(session):
+            return session.query(Category).order_by(Category.id).all()
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error retrieving categories: {e}")
+            return None
+
 class JobRepository:
     @staticmethod
     async def create_job(job_description, category_id, date_time, amount, posting_fee, zip_code, posted_by):
         """
         Create a new job posting.
-        
+
         Args:
             job_description (str): The description of the job.
             category_id (int): The ID of the category for the job.
@@ -252,12 +475,11 @@ class JobRepository:
             posting_fee (float): The fee for posting the job.
             zip_code (str): The ZIP code where the job is located.
             posted_by (int): The ID of the user who posted the job.
-        
+
         Returns:
             Job: The created job object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             job = Job(
                 job_description=job_description,
                 category_id=category_id,
@@ -271,43 +493,72 @@ class JobRepository:
             session.commit()
             session.refresh(job)
             return job
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error creating job: {e}")
-            session.rollback()
+            return None
+
+    @staticmethod
+    async def get_job_descriptions_with_categories():
+        """
+        Retrieve the description and category name of every job that was not deleted, for
+        training the embedded category classifier.
+
+        Returns:
+            List[tuple]: (job_description, category_name) pairs, or None if the query failed.
+        """
+        def _work(session):
+            return (
+                session.query(Job.job_description, Category.name)
+                .join(Category, Job.category_id == Category.id)
+                .filter(Job.status != 'deleted')
+                .all()
+            )
+
+        try:
+            return [tuple(row) for row in await run_in_session(_work)]
+        except SQLAlchemyError as e:
+            print(f"Error retrieving job descriptions: {e}")
             return None
 
     @staticmethod
     async def get_job_by_id(job_id):
         """
         Retrieve a job by its ID.
-        
+
         Args:
             job_id (int): The ID of the job.
-        
+
         Returns:
             Job: The job object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(Job).filter_by(id=job_id).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving job by ID: {e}")
             return None
-    
+
     @staticmethod
     async def get_job_by_payment_id(payment_id):
         """
         Retrieve a job by its Payment ID.
-        
+
         Args:
             payment_id (int): The payment ID associated with the job.
-        
+
         Returns:
             Job: The job object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(Job).filter_by(payment_id=payment_id).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving job by Payment ID: {e}")
             return None
@@ -316,22 +567,21 @@ class JobRepository:
     async def update_job(where, update_data):
         """
         Update a job based on custom criteria.
-        
+
         Args:
             where (dict): A dictionary specifying the filter criteria.
             update_data (dict): A dictionary specifying the fields to update.
-        
+
         Returns:
             Job: The updated job object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             query = session.query(Job)
-            
+
             # Apply filters from the 'where' dictionary
             for key, value in where.items():
                 query = query.filter(getattr(Job, key) == value)
-            
+
             job = query.first()
             if not job:
                 return None
@@ -343,11 +593,96 @@ class JobRepository:
             session.commit()
             session.refresh(job)
             return job
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error updating job: {e}")
-            session.rollback()
             return None
 
+    @staticmethod
+    async def transition_payment_status(job_id, from_payment_status, update_data):
+        """
+        Update a job only if its payment status is still from_payment_status. The check and the update
+        are a single statement, so when the same payment event is handled twice only one wins.
+
+        Args:
+            job_id (int): The ID of the job.
+            from_payment_status (str): The payment status the job must have.
+            update_data (dict): A dictionary specifying the fields to update.
+
+        Returns:
+            Job: The updated job object if this call made the transition, else None.
+
+        Raises:
+            SQLAlchemyError: If the update failed, so callers can tell a failure from a lost race.
+        """
+        def _work(session):
+            updated = session.query(Job).filter(
+                Job.id == job_id, Job.payment_status == from_payment_status
+            ).update({getattr(Job, key): value for key, value in update_data.items()}, synchronize_session=False)
+            session.commit()
+            if updated != 1:
+                return None
+            return session.query(Job).filter_by(id=job_id).first()
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error updating job payment status: {e}")
+            raise
+
+    @staticmethod
+    async def record_payment_transfer(job_ids, settlement_key, transfer_id):
+        """
+        Record the transfer that paid out jobs claimed by a settlement.
+
+        Args:
+            job_ids (list): The IDs of the jobs.
+            settlement_key (str): The settlement the jobs were claimed by.
+            transfer_id (str): The Stripe transfer ID.
+
+        Returns:
+            int: The number of jobs updated.
+        """
+        def _work(session):
+            updated = session.query(Job).filter(
+                Job.id.in_(job_ids), Job.payment_transfer_id == settlement_key
+            ).update({Job.payment_transfer_id: transfer_id}, synchronize_session=False)
+            session.commit()
+            return updated
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error recording payment transfer: {e}")
+            return 0
+
+    @staticmethod
+    async def release_settlement_jobs(job_ids, settlement_key):
+        """
+        Return jobs claimed by a failed settlement to the pool of jobs to pay out.
+
+        Args:
+            job_ids (list): The IDs of the jobs.
+            settlement_key (str): The settlement the jobs were claimed by.
+
+        Returns:
+            int: The number of jobs released.
+        """
+        def _work(session):
+            updated = session.query(Job).filter(
+                Job.id.in_(job_ids), Job.payment_transfer_id == settlement_key
+            ).update({Job.payment_transfer_id: None}, synchronize_session=False)
+            session.commit()
+            return updated
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error releasing settlement jobs: {e}")
+            return 0
+
     @staticmethod
     async def find_all_jobs_with_conditions(conditions, order, limit=10):
         """
@@ -362,9 +697,8 @@ class JobRepository:
         Returns:
             List[Job]: A list of job objects matching the conditions.
         """
-        try:
-            session = create_session()
-            query = session.query(Job).options(joinedload(Job.category))
+        def _work(session):
+            query = session.query(Job)
 
             # Apply filter conditions
             for key, value in conditions.items():
@@ -394,6 +728,8 @@ class JobRepository:
             found_jobs = query.limit(limit).all()
             return found_jobs
 
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error finding jobs with conditions: {e}")
             return None
@@ -409,11 +745,8 @@ class JobRepository:
         Returns:
             Job: A job object matching the conditions, or None if not found.
         """
-        try:
-            session = create_session()
-            query = session.query(Job).options(
-                joinedload(Job.category)
-            )
+        def _work(session):
+            query = session.query(Job)
             # Apply filter conditions dynamically
             for key, value in conditions.items():
                 query = query.filter(getattr(Job, key) == value)
@@ -423,6 +756,8 @@ class JobRepository:
                 return None
             return job
 
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error finding job with conditions: {e}")
             return None
@@ -431,16 +766,15 @@ class AddressRepository:
     async def register_address(address_data, user_id):
         """
         Register an address for a user.
-        
+
         Args:
             address_data (dict): Dictionary containing address details.
             user_id (int): The ID of the user.
-        
+
         Returns:
             dict: A dictionary containing the registration status and address data.
         """
-        try:
-            session = create_session()
+        def _work(session):
             utils = GeneralUtils()
             address_index = utils.get_address_index(address_data)
 
@@ -462,11 +796,13 @@ class AddressRepository:
                 return {"existing_address": False, "address_data": new_address}
             else:
                 return {"existing_address": True, "address_data": existing_address}
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error registering user address: {e}")
-            session.rollback()
             raise e
-    
+
     @staticmethod
     async def get_address_by_id(address_id):
         """
@@ -478,13 +814,15 @@ class AddressRepository:
         Returns:
             Address: An Address object containing the details of the address or None if not found.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(Address).filter_by(id=address_id).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving address by ID: {e}")
             return None
-        
+
     @staticmethod
     async def update_address(where_criteria: dict, update_data: dict):
         """
@@ -497,8 +835,7 @@ class AddressRepository:
         Returns:
             Address: The updated address object if successful, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             query = session.query(Address)
 
             # Apply filters from the 'where_criteria' dictionary
@@ -516,11 +853,13 @@ class AddressRepository:
             session.commit()
             session.refresh(address)
             return address
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error updating address: {e}")
-            session.rollback()
             return None
-        
+
 class StripeUserRepository:
     @staticmethod
     async def create_stripe_user(user_id, stripe_user_id):
@@ -534,8 +873,7 @@ class StripeUserRepository:
         Returns:
             StripeUser: The created StripeUser object.
         """
-        try:
-            session = create_session()
+        def _work(session):
             stripe_user = StripeUser(
                 user_id=user_id,
                 stripe_user_id=stripe_user_id
@@ -544,8 +882,10 @@ class StripeUserRepository:
             session.commit()
             session.refresh(stripe_user)
             return stripe_user
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
-            session.rollback()
             print(f"Error creating StripeUser: {e}")
             return None
 
@@ -560,13 +900,15 @@ class StripeUserRepository:
         Returns:
             StripeUser: The StripeUser object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(StripeUser).filter_by(user_id=user_id).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving StripeUser by user ID: {e}")
             return None
-        
+
     @staticmethod
     async def get_stripe_user_by_stripe_user_id(stripe_user_id):
         """
@@ -578,14 +920,95 @@ class StripeUserRepository:
         Returns:
             StripeUser: The StripeUser object if found, else None.
         """
-        try:
-            session = create_session()
+        def _work(session):
             return session.query(StripeUser).filter_by(stripe_user_id=stripe_user_id).first()
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
             print(f"Error retrieving StripeUser by Stripe user ID: {e}")
             return None
 
+    @staticmethod
+    async def set_payouts_enabled(stripe_user_id, payouts_enabled):
+        """
+        Record whether a Stripe Connect account can receive transfers.
+
+        Args:
+            stripe_user_id (str): The Stripe user ID.
+            payouts_enabled (bool): Whether the account can receive transfers.
+
+        Returns:
+            bool: True if the flag was recorded.
+        """
+        def _work(session):
+            session.query(StripeUser).filter(StripeUser.stripe_user_id == stripe_user_id).update(
+                {StripeUser.payouts_enabled: "true" if payouts_enabled else "false"}, synchronize_session=False
+            )
+            session.commit()
+            return True
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error updating StripeUser payouts: {e}")
+            return False
+
+    @staticmethod
+    async def get_accounts_awaiting_payouts(limit):
+        """
+        Retrieve the Stripe accounts, not yet able to receive transfers, of seekers with paid jobs to pay out.
+
+        Args:
+            limit (int): The maximum number of accounts to return.
+
+        Returns:
+            List[str]: The Stripe user IDs.
+        """
+        def _work(session):
+            rows = (
+                session.query(StripeUser.stripe_user_id)
+                .join(Job, Job.accepted_by == StripeUser.user_id)
+                .filter(
+                    Job.status == 'completed',
+                    Job.payment_status == 'paid',
+                    Job.payment_transfer_id == None,
+                    (StripeUser.payouts_enabled == None) | (StripeUser.payouts_enabled != "true")
+                )
+                .distinct()
+                .limit(limit)
+                .all()
+            )
+            return [row[0] for row in rows]
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error retrieving Stripe accounts awaiting payouts: {e}")
+            return []
+
+    @staticmethod
+    def get_stripe_user_by_stripe_user_id_sync(stripe_user_id):
+        """
+        Retrieve a StripeUser by the Stripe user ID from synchronous code.
+
+        Args:
+            stripe_user_id (str): The Stripe user ID.
+
+        Returns:
+            StripeUser: The StripeUser object if found, else None.
+        """
+        def _work(session):
+            return session.query(StripeUser).filter_by(stripe_user_id=stripe_user_id).first()
+
+        try:
+            return run_in_session_sync(_work)
+        except SQLAlchemyError as e:
+            print(f"Error retrieving StripeUser by Stripe user ID: {e}")
+            return None
 
+    @staticmethod
+    async def update_stripe_user(user_id, update_data):
         """
         Update a StripeUser entry.
 
@@ -596,8 +1019,7 @@ class StripeUserRepository:
         Returns:
             StripeUser: The updated StripeUser object.
         """
-        try:
-            session = create_session()
+        def _work(session):
             stripe_user = session.query(StripeUser).filter_by(user_id=user_id).first()
             if not stripe_user:
                 return None
@@ -608,11 +1030,15 @@ class StripeUserRepository:
             session.commit()
             session.refresh(stripe_user)
             return stripe_user
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
-            session.rollback()
             print(f"Error updating StripeUser: {e}")
             return None
 
+    @staticmethod
+    async def delete_stripe_user(user_id):
         """
         Delete a StripeUser entry.
 
@@ -622,8 +1048,7 @@ class StripeUserRepository:
         Returns:
             bool: True if deletion was successful, False otherwise.
         """
-        try:
-            session = create_session()
+        def _work(session):
             stripe_user = session.query(StripeUser).filter_by(user_id=user_id).first()
             if not stripe_user:
                 return False
@@ -631,7 +1056,245 @@ class StripeUserRepository:
             session.delete(stripe_user)
             session.commit()
             return True
+
+        try:
+            return await run_in_session(_work)
         except SQLAlchemyError as e:
-            session.rollback()
             print(f"Error deleting StripeUser: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+class StripeOperationRepository:
+    @staticmethod
+    async def enqueue_operation(idempotency_key, operation, payload, job_id=None, run_at=None):
+        """
+        Record a Stripe operation in the outbox. Enqueuing the same idempotency key twice returns
+        the operation recorded first.
+
+        Args:
+            idempotency_key (str): The Stripe idempotency key, unique per operation.
+            operation (str): The operation name, e.g. "capture_payment".
+            payload (str): The JSON encoded operation arguments.
+            job_id (int, optional): The job the operation belongs to.
+            run_at (datetime, optional): The earliest time the operation is executed; defaults to now.
+
+        Returns:
+            StripeOperation: The recorded operation, or None if it could not be recorded.
+        """
+        def _work(session):
+            existing = session.query(StripeOperation).filter_by(idempotency_key=idempotency_key).first()
+            if existing:
+                return existing
+
+            stripe_operation = StripeOperation(
+                idempotency_key=idempotency_key,
+                operation=operation,
+                payload=payload,
+                job_id=job_id,
+                status='pending',
+                attempts=0,
+                next_attempt_at=run_at or datetime.datetime.now(datetime.timezone.utc)
+            )
+            session.add(stripe_operation)
+            try:
+                session.commit()
+            except IntegrityError:
+                # Another request recorded the same key in the meantime
+                session.rollback()
+                return session.query(StripeOperation).filter_by(idempotency_key=idempotency_key).first()
+            session.refresh(stripe_operation)
+            return stripe_operation
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error recording Stripe operation: {e}")
+            return None
+
+    @staticmethod
+    async def enqueue_settlement(settlement_key, limit, jobs_per_transfer):
+        """
+        Claim completed, captured jobs not yet paid out, whose seeker's Stripe account can receive
+        transfers, and record one top-up operation funding them all. The claim marks each job's payment_transfer_id with the settlement key, and is
+        committed together with the operation, so a job is settled once and never left claimed
+        without an operation to pay it out.
+
+        Args:
+            settlement_key (str): The unique key of this settlement.
+            limit (int): The maximum number of jobs claimed.
+            jobs_per_transfer (int): The maximum number of jobs paid out by one transfer.
+
+        Returns:
+            StripeOperation: The recorded top-up operation, or None if there was nothing to settle.
+        """
+        def _work(session):
+            candidates = (
+                session.query(Job.id, Job.amount, Job.posting_fee, StripeUser.stripe_user_id)
+                .join(StripeUser, StripeUser.user_id == Job.accepted_by)
+                .filter(
+                    Job.status == 'completed',
+                    Job.payment_status == 'paid',
+                    Job.payment_transfer_id == None,
+                    Job.amount > func.coalesce(Job.posting_fee, 0),
+                    StripeUser.payouts_enabled == "true"
+                )
+                .order_by(Job.id)
+                .limit(limit)
+                .all()
+            )
+
+            transfers = []
+            open_transfers = {}  # Connected account ID -> the transfer its next job is added to
+            for job_id, amount, posting_fee, account_id in candidates:
+                # Conditional, so a concurrent settlement, or a second Stripe account row, skips the job
+                updated = session.query(Job).filter(
+                    Job.id == job_id, Job.payment_transfer_id == None
+                ).update({Job.payment_transfer_id: settlement_key}, synchronize_session=False)
+                if updated != 1:
+                    continue
+                transfer = open_transfers.get(account_id)
+                if transfer is None or len(transfer["job_ids"]) >= jobs_per_transfer:
+                    transfer = {"account_id": account_id, "amount": 0, "job_ids": []}
+                    open_transfers[account_id] = transfer
+                    transfers.append(transfer)
+                transfer["amount"] += int((amount - (posting_fee or 0)) * 100)
+                transfer["job_ids"].append(job_id)
+
+            if not transfers:
+                session.rollback()
+                return None
+
+            payload = {
+                "settlement": settlement_key,
+                "amount": sum(transfer["amount"] for transfer in transfers),
+                "transfers": transfers
+            }
+            stripe_operation = StripeOperation(
+                idempotency_key=f"{settlement_key}-topup",
+                operation="create_settlement_topup",
+                payload=json.dumps(payload),
+                status='pending',
+                attempts=0,
+                next_attempt_at=datetime.datetime.now(datetime.timezone.utc)
+            )
+            session.add(stripe_operation)
+            session.commit()
+            session.refresh(stripe_operation)
+            return stripe_operation
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error recording settlement: {e}")
+            return None
+
+    @staticmethod
+    async def get_recorded_keys(idempotency_keys):
+        """
+        Return which of the given idempotency keys have an operation recorded.
+
+        Args:
+            idempotency_keys (list): The idempotency keys.
+
+        Returns:
+            set: The recorded keys, or None if they could not be read.
+        """
+        def _work(session):
+            rows = session.query(StripeOperation.idempotency_key).filter(
+                StripeOperation.idempotency_key.in_(idempotency_keys)
+            ).all()
+            return {row[0] for row in rows}
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error retrieving Stripe operations: {e}")
+            return None
+
+    @staticmethod
+    async def claim_due_operations(limit, lease_seconds):
+        """
+        Claim pending operations that are due, and processing ones whose lease expired after a crash.
+        Each claim is a conditional update, so concurrent workers never claim the same operation.
+
+        Args:
+            limit (int): The maximum number of operations to claim.
+            lease_seconds (float): The number of seconds a claimed operation is reserved.
+
+        Returns:
+            List[StripeOperation]: The claimed operations.
+        """
+        def _work(session):
+            now = datetime.datetime.now(datetime.timezone.utc)
+            candidates = (
+                session.query(StripeOperation.id, StripeOperation.next_attempt_at)
+                .filter(
+                    StripeOperation.status.in_(['pending', 'processing']),
+                    StripeOperation.next_attempt_at <= now
+                )
+                .order_by(StripeOperation.next_attempt_at)
+                .limit(limit)
+                .all()
+            )
+
+            claimed_ids = []
+            for operation_id, next_attempt_at in candidates:
+                updated = session.query(StripeOperation).filter(
+                    StripeOperation.id == operation_id,
+                    StripeOperation.next_attempt_at == next_attempt_at
+                ).update({
+                    StripeOperation.status: 'processing',
+                    StripeOperation.attempts: StripeOperation.attempts + 1,
+                    StripeOperation.next_attempt_at: now + datetime.timedelta(seconds=lease_seconds)
+                }, synchronize_session=False)
+                if updated == 1:
+                    claimed_ids.append(operation_id)
+            session.commit()
+
+            if not claimed_ids:
+                return []
+            return session.query(StripeOperation).filter(StripeOperation.id.in_(claimed_ids)).all()
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error claiming Stripe operations: {e}")
+            return []
+
+    @staticmethod
+    async def finish_operation(operation_id, status, result_id=None, error=None, retry_at=None, deferred=False):
+        """
+        Record the outcome of an operation attempt.
+
+        Args:
+            operation_id (int): The ID of the operation.
+            status (str): "succeeded", "failed", or "pending" to retry at retry_at.
+            result_id (str, optional): The ID of the Stripe object the operation created or updated.
+            error (str, optional): The error of a failed attempt.
+            retry_at (datetime, optional): When a pending operation is retried.
+            deferred (bool): The operation could not run yet, so the attempt is not counted.
+
+        Returns:
+            bool: True if the outcome was recorded.
+        """
+        def _work(session):
+            update_data = {
+                StripeOperation.status: status,
+                StripeOperation.result_id: result_id,
+                StripeOperation.last_error: error,
+            }
+            if retry_at is not None:
+                update_data[StripeOperation.next_attempt_at] = retry_at
+            if deferred:
+                update_data[StripeOperation.attempts] = StripeOperation.attempts - 1
+            session.query(StripeOperation).filter(StripeOperation.id == operation_id).update(
+                update_data, synchronize_session=False
+            )
+            session.commit()
+            return True
+
+        try:
+            return await run_in_session(_work)
+        except SQLAlchemyError as e:
+            print(f"Error recording Stripe operation outcome: {e}")
+            return False
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    def __init__(self, name="background-loop"):
+        """
+        Initialize a long-lived event loop running in a daemon thread.
+
+        Flask runs every async view on its own short-lived loop, so anything that
+        must outlive a request (workers, queues, pooled async clients) lives here.
+
+        Args:
+            name (str): The name of the loop thread.
+        """
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the loop thread if it is not running yet.
+
+        Returns:
+            asyncio.AbstractEventLoop: The background event loop.
+        """
+        if self.loop is None:
+            with self._lock:
+                if self.loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=self._run, args=(loop,), name=self.name, daemon=True)
+                    self._thread.start()
+                    self.loop = loop
+        return self.loop
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the background loop from any thread.
+
+        Args:
+            coro (coroutine): The coroutine to run.
+
+        Returns:
+            concurrent.futures.Future: A future resolved with the coroutine's result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    async def run(self, coro):
+        """
+        Run a coroutine on the background loop and await its result from the calling loop.
+
+        Args:
+            coro (coroutine): The coroutine to run.
+
+        Returns:
+            The coroutine's result.
+        """
+        if self.in_loop():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def call_soon(self, callback, *args):
+        """
+        Schedule a plain callback on the background loop from any thread.
+        """
+        self.start().call_soon_threadsafe(callback, *args)
+
+    def in_loop(self):
+        """
+        Return True when called from the background loop thread.
+        """
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def _run(self, loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+
+background_loop = BackgroundLoop()
@@ -0,0 +1,222 @@
+import os
+import re
+import zlib
+import numpy as np
+from config import CATEGORY_CLASSIFIER_PATH, CATEGORY_CLASSIFIER_MODE, CATEGORY_CLASSIFIER_THRESHOLD
+
+WORD = re.compile(r"\w+")
+
+
+class HashedNgramClassifier:
+    def __init__(self, classes, weights, bias, n_features):
+        """
+        Initialize a multinomial naive Bayes classifier over hashed word and character n-grams.
+
+        Args:
+            classes (list): The category names, one per weight column.
+            weights (numpy.ndarray): The (n_features, n_classes) log-likelihoods of each hashed feature.
+            bias (numpy.ndarray): The (n_classes,) log-priors.
+            n_features (int): The number of hash buckets.
+        """
+        self.classes = list(classes)
+        self.weights = weights
+        self.bias = bias
+        self.n_features = n_features
+
+    @staticmethod
+    def features(text, n_features):
+        """
+        Hash a description into sparse features: word unigrams and bigrams, and character
+        trigrams so misspellings still share features.
+
+        Args:
+            text (str): The job description.
+            n_features (int): The number of hash buckets.
+
+        Returns:
+            tuple: (indices, values) numpy arrays, with log-scaled counts normalized to unit length.
+        """
+        words = WORD.findall(text.casefold()) if text else []
+        grams = [f"w:{word}" for word in words]
+        grams += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        if not grams:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        hashed = np.fromiter((zlib.crc32(gram.encode()) % n_features for gram in grams), dtype=np.int64, count=len(grams))
+        indices, counts = np.unique(hashed, return_counts=True)
+        values = np.log1p(counts).astype(np.float32)
+        return indices, values / np.linalg.norm(values)
+
+    @classmethod
+    def train(cls, descriptions, categories, n_features=2 ** 16, alpha=0.1):
+        """
+        Train a classifier from labelled job descriptions.
+
+        Args:
+            descriptions (list): The job descriptions.
+            categories (list): The category name of each description.
+            n_features (int): The number of hash buckets.
+            alpha (float): The additive smoothing of the feature counts.
+
+        Returns:
+            HashedNgramClassifier: The trained classifier.
+        """
+        classes = sorted(set(categories))
+        class_index = {category: i for i, category in enumerate(classes)}
+        feature_counts = np.zeros((len(classes), n_features), dtype=np.float64)
+        class_counts = np.zeros(len(classes), dtype=np.float64)
+
+        for description, category in zip(descriptions, categories):
+            row = class_index[category]
+            indices, values = cls.features(description, n_features)
+            feature_counts[row, indices] += values
+            class_counts[row] += 1
+
+        smoothed = feature_counts + alpha
+        log_likelihoods = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+        log_priors = np.log(class_counts / class_counts.sum())
+        return cls(classes, np.ascontiguousarray(log_likelihoods.T, dtype=np.float32), log_priors.astype(np.float32), n_features)
+
+    def predict(self, text, top=2):
+        """
+        Rank the categories of a description.
+
+        Args:
+            text (str): The job description.
+            top (int): The number of categories returned.
+
+        Returns:
+            list: (category, probability) tuples, most likely first; empty if the text has no words.
+        """
+        indices, values = self.features(text, self.n_features)
+        if not len(indices):
+            return []
+        scores = self.bias + values @ self.weights[indices]
+        probabilities = np.exp(scores - scores.max())
+        probabilities /= probabilities.sum()
+        ranked = np.argsort(probabilities)[::-1][:top]
+        return [(self.classes[i], float(probabilities[i])) for i in ranked]
+
+    def save(self, path):
+        """
+        Write the classifier to a compressed .npz artifact.
+
+        Args:
+            path (str): The artifact path.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            classes=np.array(self.classes),
+            weights=self.weights,
+            bias=self.bias,
+            n_features=np.array(self.n_features)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a classifier written by save.
+
+        Args:
+            path (str): The artifact path.
+
+        Returns:
+            HashedNgramClassifier: The classifier.
+        """
+        with np.load(path) as artifact:
+            return cls(
+                [str(category) for category in artifact["classes"]],
+                artifact["weights"],
+                artifact["bias"],
+                int(artifact["n_features"])
+            )
+
+
+class CategoryClassifier:
+    def __init__(self, path, mode, threshold):
+        """
+        Initialize the embedded category classifier, loaded from its artifact when one exists.
+
+        Args:
+            path (str): The artifact path.
+            mode (str): "fallback" to answer only when the remote model fails, "fast_path" to also
+                answer before calling it when confident, or "off".
+            threshold (float): The probability above which a single category is suggested.
+        """
+        self.path = path
+        self.mode = mode
+        self.threshold = threshold
+        self.model = None
+        self.answered = 0
+        if mode != "off":
+            self.reload()
+
+    def reload(self):
+        """
+        Load, or reload after retraining, the classifier artifact.
+        """
+        if not os.path.exists(self.path):
+            print(f"No category classifier at {self.path}; the embedded classifier is disabled.")
+            return
+        try:
+            self.model = HashedNgramClassifier.load(self.path)
+        except Exception as e:
+            print(f"Error loading category classifier: {e}")
+
+    @property
+    def fast_path(self):
+        return self.model is not None and self.mode == "fast_path"
+
+    @property
+    def fallback(self):
+        return self.model is not None and self.mode in ("fallback", "fast_path")
+
+    def predict(self, service_description, confident_only=False):
+        """
+        Predict a category in the classification model API's response format, so predict_category
+        handles it unchanged: one category when confident, otherwise the two most likely.
+
+        Args:
+            service_description (str): The cleaned job description.
+            confident_only (bool): Return None unless one category reaches the threshold.
+
+        Returns:
+            dict: The prediction, or None if there is no model or no usable prediction.
+        """
+        if self.model is None:
+            return None
+        ranked = self.model.predict(service_description)
+        if not ranked:
+            return None
+
+        category, probability = ranked[0]
+        if probability >= self.threshold:
+            self.answered += 1
+            return {"category": category, "suggested_by_gen_ai": None, "verification_status_by_gen_ai": "correct"}
+        if confident_only or len(ranked) < 2:
+            return None
+        self.answered += 1
+        return {"category": category, "suggested_by_gen_ai": ranked[1][0], "verification_status_by_gen_ai": "correct"}
+
+    def stats(self):
+        """
+        Return the classifier state and how many predictions it answered.
+
+        Returns:
+            dict: The classifier statistics.
+        """
+        return {
+            "mode": self.mode,
+            "loaded": self.model is not None,
+            "categories": len(self.model.classes) if self.model is not None else 0,
+            "answered": self.answered,
+        }
+
+
+category_classifier = CategoryClassifier(CATEGORY_CLASSIFIER_PATH, CATEGORY_CLASSIFIER_MODE, CATEGORY_CLASSIFIER_THRESHOLD)
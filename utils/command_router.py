@@ -0,0 +1,115 @@
+from collections import deque
+
+
+class CommandRouter:
+    def __init__(self, max_contains_words=6):
+        """
+        Initialize a router that maps user messages to commands by exact phrase, or by a phrase
+        contained in a short message, without calling Dialogflow.
+
+        Containment uses an Aho-Corasick automaton, so a message is scanned once however many
+        phrases are registered.
+
+        Args:
+            max_contains_words (int): Longer messages are only matched exactly, so free-form
+                answers inside a Dialogflow flow are not mistaken for commands.
+        """
+        self.max_contains_words = max_contains_words
+        self._exact = {}
+        self._contains = {}
+        self._goto = None
+        self._fail = None
+        self._output = None
+
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize a message for matching: case-folded, with runs of whitespace collapsed.
+
+        Args:
+            text (str): The message.
+
+        Returns:
+            str: The normalized message.
+        """
+        return " ".join(text.casefold().split()) if text else ""
+
+    def add(self, command, *phrases, contains=False):
+        """
+        Register phrases for a command.
+
+        Args:
+            command (str): The command returned when a phrase matches.
+            *phrases (str): The phrases.
+            contains (bool): Whether the phrases also match when contained in a short message.
+        """
+        for phrase in phrases:
+            phrase = self.normalize(phrase)
+            self._exact[phrase] = command
+            if contains:
+                self._contains[phrase] = command
+        self._goto = None
+
+    def route(self, text, contains=True):
+        """
+        Resolve a message to a command.
+
+        Args:
+            text (str): The message.
+            contains (bool): Whether phrases contained in a short message match; False while the
+                sender is in a flow, so their answers are not mistaken for commands.
+
+        Returns:
+            str: The command, or None if the message is not a known command.
+        """
+        normalized = self.normalize(text)
+        command = self._exact.get(normalized)
+        if command or not contains or not self._contains or normalized.count(" ") >= self.max_contains_words:
+            return command
+        return self._match_contains(normalized)
+
+    def _match_contains(self, text):
+        if self._goto is None:
+            self._compile()
+
+        state = 0
+        best = None
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for phrase in self._output[state]:
+                start = position - len(phrase) + 1
+                # Only whole words count, so "hiking" does not contain "hi"
+                if (start == 0 or text[start - 1] == " ") and (position + 1 == len(text) or text[position + 1] == " "):
+                    # Prefer the longest phrase, e.g. "mark job as complete" over "job complete"
+                    if best is None or len(phrase) > len(best):
+                        best = phrase
+        return self._contains[best] if best else None
+
+    def _compile(self):
+        goto, fail, output = [{}], [0], [[]]
+        for phrase in self._contains:
+            state = 0
+            for char in phrase:
+                if char not in goto[state]:
+                    goto.append({})
+                    fail.append(0)
+                    output.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].append(phrase)
+
+        # Breadth-first, so every fail link points at an already finished state
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = output[next_state] + output[fail[next_state]]
+
+        self._goto, self._fail, self._output = goto, fail, output
@@ -0,0 +1,218 @@
+import os
+import sqlite3
+import threading
+import time
+from config import DEDUP_BACKEND, DEDUP_TTL_SECONDS, DEDUP_MAX_SIZE, DEDUP_SQLITE_PATH
+
+
+class MemoryDedupStore:
+    def __init__(self, ttl, max_size, buckets=24):
+        """
+        Initialize an in-process store of seen IDs kept in a ring of time buckets.
+        Expiry drops a whole bucket at once, so memory is bounded by the TTL and max_size.
+
+        Args:
+            ttl (float): The number of seconds an ID is remembered.
+            max_size (int): The maximum number of IDs kept; the oldest buckets are dropped first.
+            buckets (int): The number of buckets the TTL is split into.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.bucket_width = max(ttl / buckets, 1)
+        self.claimed = 0
+        self.duplicates = 0
+        self._buckets = []  # (bucket_start, set of IDs), oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """
+        Record an ID unless it was already seen, including while its first copy is still in flight.
+
+        Args:
+            key (str): The ID to claim, e.g. a WhatsApp message ID.
+
+        Returns:
+            bool: True if the caller owns the ID, False if it is a duplicate.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if any(key in ids for _, ids in self._buckets):
+                self.duplicates += 1
+                return False
+
+            if not self._buckets or now - self._buckets[-1][0] >= self.bucket_width:
+                self._buckets.append((now, set()))
+            self._buckets[-1][1].add(key)
+            self._size += 1
+            self.claimed += 1
+
+            while self._size > self.max_size and len(self._buckets) > 1:
+                self._size -= len(self._buckets.pop(0)[1])
+            return True
+
+    def release(self, key):
+        """
+        Forget an ID so a redelivery is processed, e.g. when it could not be queued.
+
+        Args:
+            key (str): The ID to release.
+        """
+        with self._lock:
+            for _, ids in self._buckets:
+                if key in ids:
+                    ids.discard(key)
+                    self._size -= 1
+                    return
+
+    def stats(self):
+        """
+        Return the store size and claim counters.
+
+        Returns:
+            dict: The store statistics.
+        """
+        return {
+            "backend": "memory",
+            "size": self._size,
+            "max_size": self.max_size,
+            "buckets": len(self._buckets),
+            "claimed": self.claimed,
+            "duplicates": self.duplicates,
+        }
+
+    def _expire(self, now):
+        while self._buckets and now - self._buckets[0][0] >= self.ttl + self.bucket_width:
+            self._size -= len(self._buckets.pop(0)[1])
+
+
+class SQLiteDedupStore:
+    # Seconds between sweeps of expired rows
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path, ttl, max_size):
+        """
+        Initialize a store of seen IDs in a SQLite file shared by every worker process on the host.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            ttl (float): The number of seconds an ID is remembered.
+            max_size (int): The maximum number of rows kept; the oldest are deleted first.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.claimed = 0
+        self.duplicates = 0
+        self._local = threading.local()
+        self._purged_at = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS dedup_ids (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_dedup_ids_expires_at ON dedup_ids (expires_at)")
+
+    def claim(self, key):
+        """
+        Record an ID unless any worker already claimed it and it has not expired.
+
+        Args:
+            key (str): The ID to claim, e.g. a WhatsApp message ID.
+
+        Returns:
+            bool: True if the caller owns the ID, False if it is a duplicate.
+        """
+        now = time.time()
+        try:
+            with self._connect() as connection:
+                # A single statement, so two workers racing on one ID cannot both win
+                cursor = connection.execute(
+                    "INSERT INTO dedup_ids (id, expires_at) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET expires_at = excluded.expires_at "
+                    "WHERE dedup_ids.expires_at <= ?",
+                    (key, now + self.ttl, now)
+                )
+                claimed = cursor.rowcount == 1
+                if now - self._purged_at >= self.PURGE_INTERVAL:
+                    self._purge(connection, now)
+        except sqlite3.Error as e:
+            # Processing a rare duplicate beats dropping a message
+            print(f"Error claiming message ID: {e}")
+            return True
+
+        if claimed:
+            self.claimed += 1
+        else:
+            self.duplicates += 1
+        return claimed
+
+    def release(self, key):
+        """
+        Forget an ID so a redelivery is processed, e.g. when it could not be queued.
+
+        Args:
+            key (str): The ID to release.
+        """
+        try:
+            with self._connect() as connection:
+                connection.execute("DELETE FROM dedup_ids WHERE id = ?", (key,))
+        except sqlite3.Error as e:
+            print(f"Error releasing message ID: {e}")
+
+    def stats(self):
+        """
+        Return the store size and this process's claim counters.
+
+        Returns:
+            dict: The store statistics.
+        """
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM dedup_ids").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "max_size": self.max_size,
+            "claimed": self.claimed,
+            "duplicates": self.duplicates,
+        }
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+        return connection
+
+    def _purge(self, connection, now):
+        self._purged_at = now
+        connection.execute("DELETE FROM dedup_ids WHERE expires_at <= ?", (now,))
+        connection.execute(
+            "DELETE FROM dedup_ids WHERE id IN "
+            "(SELECT id FROM dedup_ids ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,)
+        )
+
+
+def create_dedup_store(backend=DEDUP_BACKEND):
+    """
+    Create the dedup store selected by DEDUP_BACKEND.
+
+    Args:
+        backend (str): "memory" for a per-process store or "sqlite" for one shared by all workers.
+
+    Returns:
+        MemoryDedupStore | SQLiteDedupStore: The dedup store.
+    """
+    if backend == "sqlite":
+        return SQLiteDedupStore(DEDUP_SQLITE_PATH, DEDUP_TTL_SECONDS, DEDUP_MAX_SIZE)
+    if backend != "memory":
+        print(f"Unknown DEDUP_BACKEND '{backend}', using memory.")
+    return MemoryDedupStore(DEDUP_TTL_SECONDS, DEDUP_MAX_SIZE)
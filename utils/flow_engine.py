@@ -0,0 +1,156 @@
+END = "__end__"
+
+
+class Turn:
+    def __init__(self, response=None, goto=None):
+        """
+        The outcome of a step: what to reply and where to go next.
+
+        Args:
+            response (dict, optional): A webhook-style response, with "fulfillmentResponse" messages
+                and "sessionInfo" parameters, as DialogflowController.webhook_response builds.
+            goto (str, optional): The next step, END to finish the flow, or None to stay on this step.
+        """
+        self.response = response
+        self.goto = goto
+
+
+class Step:
+    def __init__(self, prompt=None, extract=None, retry_prompt=None, skip_words=(), on_enter=None, on_input=None, next=None):
+        """
+        A state of a flow, usually one slot to fill.
+
+        Args:
+            prompt (dict, optional): The response sent when the step is entered.
+            extract (callable, optional): Maps the user's text to a dict of parameters, or None if
+                nothing usable was found.
+            retry_prompt (dict, optional): The response sent when extract finds nothing. Defaults to prompt.
+            skip_words (tuple): Answers, e.g. "any", that leave the step's parameters unset.
+            on_enter (callable, optional): async (session) -> Turn, used instead of prompt for dynamic prompts.
+            on_input (callable, optional): async (session, text) -> Turn, run after extraction.
+            next (str, optional): The step entered after the input is accepted, when on_input does not decide.
+        """
+        self.prompt = prompt
+        self.extract = extract
+        self.retry_prompt = retry_prompt
+        self.skip_words = frozenset(word.casefold() for word in skip_words)
+        self.on_enter = on_enter
+        self.on_input = on_input
+        self.next = next
+
+
+class Flow:
+    def __init__(self, name, start, steps, parameters=None):
+        """
+        A declarative conversation flow.
+
+        Args:
+            name (str): The flow name.
+            start (str): The first step.
+            steps (dict): The steps by name.
+            parameters (dict, optional): The parameters every session of the flow starts with.
+        """
+        self.name = name
+        self.start = start
+        self.steps = steps
+        self.parameters = parameters or {}
+
+
+class FlowSession:
+    def __init__(self, flow, recipient_number, chat_session_id=None):
+        """
+        The state of one user's conversation in a flow.
+
+        Args:
+            flow (Flow): The flow.
+            recipient_number (str): The phone number of the user.
+            chat_session_id (str, optional): The chat session ID.
+        """
+        self.flow = flow
+        self.step = None
+        self.parameters = dict(flow.parameters)
+        self.recipient_number = recipient_number
+        self.chat_session_id = chat_session_id
+
+    @property
+    def finished(self):
+        return self.step == END
+
+
+class FlowEngine:
+    async def start(self, session):
+        """
+        Enter the first step of a session's flow.
+
+        Args:
+            session (FlowSession): A new session.
+
+        Returns:
+            dict: The webhook-style response for the user.
+        """
+        responses = []
+        await self._enter(session, session.flow.start, responses)
+        return self._merge(responses)
+
+    async def handle(self, session, text):
+        """
+        Feed the user's message to the current step and move through the flow.
+
+        Args:
+            session (FlowSession): An active session.
+            text (str): The user's message.
+
+        Returns:
+            dict: The webhook-style response for the user.
+        """
+        step = session.flow.steps[session.step]
+        responses = []
+
+        if text and text.strip().casefold() in step.skip_words:
+            turn = Turn(goto=step.next)
+        else:
+            if step.extract:
+                values = step.extract(text)
+                if not values:
+                    responses.append(step.retry_prompt or step.prompt)
+                    return self._merge(responses)
+                session.parameters.update(values)
+            turn = await step.on_input(session, text) if step.on_input else Turn(goto=step.next)
+
+        self._apply(session, turn.response, responses)
+        if turn.goto is None:
+            # Staying put: repeat the prompt unless the handler already answered
+            if not turn.response or "fulfillmentResponse" not in turn.response:
+                responses.append(step.retry_prompt or step.prompt)
+        else:
+            await self._enter(session, turn.goto, responses)
+        return self._merge(responses)
+
+    async def _enter(self, session, step_name, responses):
+        # Steps entered without user input (e.g. validations) chain until one waits for an answer
+        while step_name is not None:
+            session.step = step_name
+            if step_name == END:
+                return
+            step = session.flow.steps[step_name]
+            if not step.on_enter:
+                responses.append(step.prompt)
+                return
+            turn = await step.on_enter(session)
+            self._apply(session, turn.response, responses)
+            step_name = turn.goto
+
+    def _apply(self, session, response, responses):
+        if response:
+            # Like Dialogflow session parameters: returned values overwrite, None clears
+            session.parameters.update(response.get("sessionInfo", {}).get("parameters", {}))
+            responses.append(response)
+
+    def _merge(self, responses):
+        messages = []
+        parameters = {}
+        for response in responses:
+            if response:
+                messages.extend(response.get("fulfillmentResponse", {}).get("messages", []))
+                parameters.update(response.get("sessionInfo", {}).get("parameters", {}))
+        return {"fulfillmentResponse": {"messages": messages}, "sessionInfo": {"parameters": parameters}}
@@ -1,15 +1,23 @@
 import os
+import hmac
+import hashlib
 from base64 import b64decode, b64encode
 from urllib.parse import quote, unquote
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
-from config import AES_KEY, AES_IV
+from config import AES_KEY, AES_IV, BLIND_INDEX_KEY
 class GeneralUtils:
     def __init__(self):
         # Fetch and decode AES_KEY and AES_IV
         self.aes_key = b64decode(AES_KEY)
         self.aes_iv = b64decode(AES_IV)
 
+        # Use a dedicated blind index key, or derive one so the AES key is never used directly
+        if BLIND_INDEX_KEY:
+            self.blind_index_key = b64decode(BLIND_INDEX_KEY)
+        else:
+            self.blind_index_key = hmac.new(self.aes_key, b"phone-number-blind-index", hashlib.sha256).digest()
+
     def get_address_index(self, address):
         """
         Generate an address index by concatenating and formatting address components.
@@ -29,6 +37,20 @@ class GeneralUtils:
 
         return address_index
 
+    def get_blind_index(self, value):
+        """
+        Generate a keyed HMAC-SHA256 blind index so an encrypted value can be looked up
+        with an indexed equality match.
+
+        Args:
+            value (str): The plain value, e.g. a phone number.
+
+        Returns:
+            str: The hex encoded blind index.
+        """
+        normalized_value = str(value).strip().replace(' ', '').replace('-', '').lstrip('+')
+        return hmac.new(self.blind_index_key, normalized_value.encode(), hashlib.sha256).hexdigest()
+
     def encrypt_aes(self, value):
         """Encrypt a value."""
         # Create AES cipher in CBC mode
@@ -63,9 +85,9 @@ class GeneralUtils:
         return decrypted_data.decode()
     
     def encrypt_aes_url_safe(self, value):
-        encrypted_data = self.encrypt_aes(value, self.aes_key, self.aes_iv)
-        return quote(encrypted_data)
+        encrypted_data = self.encrypt_aes(value)
+        return quote(encrypted_data, safe='')
 
     def decrypt_aes_url_safe(self,encrypted_value):
         encrypted_data = unquote(encrypted_value)
-        return self.decrypt_aes(encrypted_data, self.aes_key, self.aes_iv)
\ No newline at end of file
+        return self.decrypt_aes(encrypted_data)
\ No newline at end of file
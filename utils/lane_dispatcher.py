@@ -0,0 +1,119 @@
+import asyncio
+from utils.background_loop import background_loop
+
+
+class _Lane:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.processed = 0
+
+
+class LaneDispatcher:
+    def __init__(self, name, idle_timeout, loop=background_loop):
+        """
+        Initialize a dispatcher that runs jobs for the same key strictly in order,
+        one lane (a lightweight actor) per key, while different keys run concurrently.
+
+        Args:
+            name (str): The dispatcher name used in logs and metrics.
+            idle_timeout (float): The number of seconds an empty lane is kept before it is reaped.
+            loop (BackgroundLoop): The loop the lanes run on.
+        """
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.background_loop = loop
+        self.lanes_created = 0
+        self.lanes_reaped = 0
+        self._lanes = {}
+
+    async def dispatch(self, key, handler, *args):
+        """
+        Run handler(*args) in the lane for key, after every job already queued for that key.
+        Can be awaited from any event loop.
+
+        Args:
+            key (str): The ordering key, e.g. the sender's wa_id.
+            handler (callable): An async function to run.
+            *args: The arguments passed to the handler.
+
+        Returns:
+            The handler's result.
+        """
+        if not self.background_loop.in_loop():
+            return await self.background_loop.run(self.dispatch(key, handler, *args))
+        return await self.submit(key, handler, *args)
+
+    def submit(self, key, handler, *args):
+        """
+        Queue handler(*args) in the lane for key without waiting for it to run.
+        Must be called on the background loop.
+
+        Args:
+            key (str): The ordering key, e.g. the sender's wa_id.
+            handler (callable): An async function to run.
+            *args: The arguments passed to the handler.
+
+        Returns:
+            asyncio.Future: Resolves to the handler's result.
+        """
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = _Lane()
+            lane.task = asyncio.create_task(self._run_lane(key, lane))
+            self._lanes[key] = lane
+            self.lanes_created += 1
+
+        future = asyncio.get_running_loop().create_future()
+        lane.queue.put_nowait((future, handler, args))
+        return future
+
+    def stats(self, top=10):
+        """
+        Return lane counts and the deepest lanes, with keys masked.
+
+        Args:
+            top (int): The number of deepest lanes to list.
+
+        Returns:
+            dict: The dispatcher statistics.
+        """
+        lanes = list(self._lanes.items())
+        deepest = sorted(lanes, key=lambda item: item[1].queue.qsize(), reverse=True)[:top]
+        return {
+            "active_lanes": len(lanes),
+            "lanes_created": self.lanes_created,
+            "lanes_reaped": self.lanes_reaped,
+            "deepest_lanes": [
+                {"lane": self._mask(key), "depth": lane.queue.qsize(), "processed": lane.processed}
+                for key, lane in deepest
+            ],
+        }
+
+    async def _run_lane(self, key, lane):
+        while True:
+            try:
+                future, handler, args = await asyncio.wait_for(lane.queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # No await between the check and the removal, so no job can slip in
+                if lane.queue.empty():
+                    del self._lanes[key]
+                    self.lanes_reaped += 1
+                    return
+                continue
+
+            try:
+                result = await handler(*args)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                print(f"Error processing {self.name} lane job: {e}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                lane.processed += 1
+
+    @staticmethod
+    def _mask(key):
+        key = str(key)
+        return f"***{key[-4:]}" if len(key) > 4 else key
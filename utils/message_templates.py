@@ -0,0 +1,103 @@
+import json
+import re
+
+# Slots are written as {{name}} in template text; the recipient is always the "to" slot
+SLOT_PATTERN = re.compile(rb"\{\{(\w+)\}\}")
+
+
+class MessageTemplate:
+    def __init__(self, name, message, message_type='text'):
+        """
+        Compile a WhatsApp message into the JSON request body, split around its {{slot}} markers,
+        so rendering only splices escaped slot values between ready-made bytes.
+
+        Args:
+            name (str): The template name.
+            message (str | dict): The text body, or the {"interactive": {...}} message for interactive templates.
+            message_type (str): The type of message ('text' or 'interactive').
+        """
+        self.name = name
+        self.message_type = message_type
+
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": "{{to}}",
+        }
+        if message_type == 'interactive':
+            data.update({"type": "interactive", "interactive": message["interactive"]})
+        else:
+            data.update({"type": "text", "text": {"preview_url": False, "body": message}})
+
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        parts = SLOT_PATTERN.split(body)
+        # Even positions hold literal bytes, odd positions hold slot names
+        self._literals = parts[0::2]
+        self._slots = [slot.decode("ascii") for slot in parts[1::2]]
+        self.slots = frozenset(self._slots)
+
+    def render(self, to_number, **slots):
+        """
+        Build the request body for a recipient.
+
+        Args:
+            to_number (str): The phone number of the recipient.
+            **slots: The values of the template's slots.
+
+        Returns:
+            bytes: The UTF-8 JSON request body.
+
+        Raises:
+            KeyError: If a slot value is missing.
+        """
+        slots["to"] = to_number
+        chunks = [self._literals[0]]
+        for slot, literal in zip(self._slots, self._literals[1:]):
+            # Escape the value as the inside of a JSON string literal
+            chunks.append(json.dumps(str(slots[slot]), ensure_ascii=False)[1:-1].encode("utf-8"))
+            chunks.append(literal)
+        return b"".join(chunks)
+
+
+class TemplateRegistry:
+    def __init__(self):
+        """
+        Initialize an empty registry of compiled message templates.
+        """
+        self._templates = {}
+
+    def register(self, name, message, message_type='text'):
+        """
+        Compile and register a template.
+
+        Args:
+            name (str): The template name.
+            message (str | dict): The text body or interactive message, with {{slot}} markers.
+            message_type (str): The type of message ('text' or 'interactive').
+
+        Returns:
+            MessageTemplate: The compiled template.
+        """
+        template = MessageTemplate(name, message, message_type)
+        self._templates[name] = template
+        return template
+
+    def render(self, name, to_number, **slots):
+        """
+        Build the request body of a registered template for a recipient.
+
+        Args:
+            name (str): The template name.
+            to_number (str): The phone number of the recipient.
+            **slots: The values of the template's slots.
+
+        Returns:
+            bytes: The UTF-8 JSON request body.
+
+        Raises:
+            KeyError: If the template or a slot value is missing.
+        """
+        return self._templates[name].render(to_number, **slots)
+
+    def __contains__(self, name):
+        return name in self._templates
@@ -0,0 +1,89 @@
+import re
+from config import CATEGORY_PREDICTION_CACHE_MAX_SIZE, CATEGORY_PREDICTION_CACHE_TTL
+from utils.single_flight import SingleFlight
+from utils.ttl_cache import TTLCache
+
+WORD = re.compile(r"\w+")
+
+
+class PredictionCache:
+    def __init__(self, max_size=CATEGORY_PREDICTION_CACHE_MAX_SIZE, ttl=CATEGORY_PREDICTION_CACHE_TTL):
+        """
+        Initialize a cache of category predictions keyed by normalized job description, in front
+        of a single-flight coalescer so identical concurrent predictions make one model call.
+
+        Args:
+            max_size (int): The maximum number of predictions kept.
+            ttl (float): The number of seconds a prediction stays cached.
+        """
+        self.cache = TTLCache(max_size, ttl)
+        self.flights = SingleFlight()
+        self.invalidations = 0
+
+    @staticmethod
+    def key(description):
+        """
+        Normalize a description so case, punctuation and spacing differences share an entry.
+
+        Args:
+            description (str): The cleaned job description.
+
+        Returns:
+            str: The cache key.
+        """
+        return " ".join(WORD.findall(description.casefold())) if description else ""
+
+    async def get_or_predict(self, description, predict):
+        """
+        Return the cached prediction for a description, or predict it once for all concurrent callers.
+
+        Args:
+            description (str): The cleaned job description.
+            predict (callable): Returns a coroutine that calls the model; a None result is not cached.
+
+        Returns:
+            dict: The model response, or None if the prediction failed.
+        """
+        key = self.key(description)
+        found, prediction = self.cache.lookup(key)
+        if found:
+            return prediction
+        return await self.flights.run(key, lambda: self._predict(key, predict))
+
+    def invalidate(self, description, confirmed_category=None):
+        """
+        Drop a cached prediction the user corrected.
+
+        Args:
+            description (str): The cleaned job description.
+            confirmed_category (str, optional): The category the user confirmed; a matching
+                prediction is kept. Drops the entry unconditionally when None.
+        """
+        key = self.key(description)
+        prediction = self.cache.peek(key)
+        if prediction is None:
+            return
+        predicted = {
+            (prediction.get(field) or "").casefold() for field in ("category", "suggested_by_gen_ai")
+        }
+        if confirmed_category is None or confirmed_category.casefold() not in predicted:
+            self.cache.pop(key)
+            self.invalidations += 1
+
+    def stats(self):
+        """
+        Return the cache and coalescer counters.
+
+        Returns:
+            dict: The cache statistics.
+        """
+        return {**self.cache.stats(), **self.flights.stats(), "invalidations": self.invalidations}
+
+    async def _predict(self, key, predict):
+        prediction = await predict()
+        if prediction is not None:
+            self.cache.set(key, prediction)
+        return prediction
+
+
+category_predictions = PredictionCache()
@@ -0,0 +1,64 @@
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, rate, burst):
+        """
+        Initialize a set of token buckets, one per key, shared by every thread and event loop.
+
+        Args:
+            rate (float): The number of tokens added to each bucket per second.
+            burst (int): The maximum number of tokens a bucket holds.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.waits = 0
+        self._buckets = {}  # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def reserve(self, key):
+        """
+        Take a token from the key's bucket, going into debt when it is empty.
+
+        Args:
+            key (str): The bucket key, e.g. a WhatsApp phone number ID.
+
+        Returns:
+            float: The number of seconds to wait before the reserved token is valid.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate) - 1
+            self._buckets[key] = (tokens, now)
+            if tokens >= 0:
+                return 0.0
+            self.waits += 1
+            return -tokens / self.rate
+
+    async def acquire(self, key):
+        """
+        Wait until a token is available in the key's bucket.
+
+        Args:
+            key (str): The bucket key, e.g. a WhatsApp phone number ID.
+        """
+        delay = self.reserve(key)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        """
+        Return the configured limit and how often callers had to wait.
+
+        Returns:
+            dict: The limiter statistics.
+        """
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "keys": len(self._buckets),
+            "waits": self.waits,
+        }
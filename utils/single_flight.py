@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from utils.background_loop import background_loop
+
+
+class SingleFlight:
+    def __init__(self, loop=background_loop):
+        """
+        Initialize a coalescer that lets concurrent callers with the same key share one call.
+
+        Calls run on the background loop, so callers on different request loops can share them.
+
+        Args:
+            loop (BackgroundLoop): The loop the shared calls run on.
+        """
+        self.background_loop = loop
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    async def run(self, key, coro_factory):
+        """
+        Run a call, or join the identical call already in flight.
+
+        Args:
+            key: Identifies identical calls.
+            coro_factory (callable): Returns the coroutine to run; only called by the first caller.
+
+        Returns:
+            The call's result.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            started = future is None
+            if started:
+                future = self.background_loop.submit(coro_factory())
+                self._inflight[key] = future
+                self.calls += 1
+            else:
+                self.shared += 1
+        if started:
+            # Outside the lock: a call that already finished runs the callback here, and it takes the lock
+            future.add_done_callback(lambda _, key=key: self._forget(key, future))
+        # Shielded, so a caller that gives up does not cancel the call for the others
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self):
+        """
+        Return the number of calls made and joined.
+
+        Returns:
+            dict: The coalescer statistics.
+        """
+        return {"in_flight": len(self._inflight), "calls": self.calls, "shared": self.shared}
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
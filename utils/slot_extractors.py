@@ -0,0 +1,182 @@
+import datetime
+import re
+
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",),
+        ("jun", "june"), ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"),
+        ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ], 1)
+    for name in names
+}
+WEEKDAYS = {
+    name: number
+    for number, names in enumerate([
+        ("mon", "monday"), ("tue", "tues", "tuesday"), ("wed", "wednesday"), ("thu", "thur", "thurs", "thursday"),
+        ("fri", "friday"), ("sat", "saturday"), ("sun", "sunday"),
+    ])
+    for name in names
+}
+
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2}|\d{4}))?\b")
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+MONTH_NAME_DATE = re.compile(r"\b([a-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?\b")
+DAY_MONTH_NAME_DATE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]{3,9})\.?(?:,?\s+(\d{4}))?\b")
+WEEKDAY = re.compile(r"\b(next\s+)?([a-z]{3,9})\b")
+TIME_12H = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*([ap])\.?\s*m\b\.?")
+TIME_24H = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)\b")
+NUMBER = r"(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?"
+DOLLAR_AMOUNT = re.compile(r"\$\s*" + NUMBER + r"|\b" + NUMBER + r"\s*(?:dollars?|bucks|usd)\b")
+AMOUNT = re.compile(NUMBER)
+ZIP_CODE = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+JOB_ID = re.compile(r"#?\s*(\d+)")
+
+
+def extract_date(text, today=None):
+    """
+    Extract a calendar date from free text, e.g. "12/24", "2024-12-24", "Dec 24", "tomorrow" or "next friday".
+
+    Args:
+        text (str): The message.
+        today (datetime.date, optional): The reference date. Defaults to today.
+
+    Returns:
+        dict: {"year", "month", "day"} in the Dialogflow date format, or None if no valid date is found.
+    """
+    today = today or datetime.date.today()
+    text = text.casefold()
+    date = None
+
+    if "today" in text or "tonight" in text:
+        date = today
+    elif "tomorrow" in text:
+        date = today + datetime.timedelta(days=1)
+
+    match = date is None and ISO_DATE.search(text)
+    if match:
+        date = _make_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    match = date is None and NUMERIC_DATE.search(text)
+    if match:
+        year = match.group(3)
+        date = _make_date(
+            int(year) + (2000 if len(year) == 2 else 0) if year else None,
+            int(match.group(1)), int(match.group(2)), today
+        )
+
+    if date is None:
+        for pattern, month_group, day_group in ((MONTH_NAME_DATE, 1, 2), (DAY_MONTH_NAME_DATE, 2, 1)):
+            for match in pattern.finditer(text):
+                month = MONTHS.get(match.group(month_group))
+                if month:
+                    year = match.group(3)
+                    date = _make_date(int(year) if year else None, month, int(match.group(day_group)), today)
+                    break
+            if date:
+                break
+
+    if date is None:
+        for match in WEEKDAY.finditer(text):
+            weekday = WEEKDAYS.get(match.group(2))
+            if weekday is not None:
+                days_ahead = (weekday - today.weekday()) % 7 or 7
+                if match.group(1) and days_ahead < 7:
+                    days_ahead += 7
+                date = today + datetime.timedelta(days=days_ahead)
+                break
+
+    return {"year": date.year, "month": date.month, "day": date.day} if date else None
+
+
+def extract_time(text):
+    """
+    Extract a time of day from free text, e.g. "3pm", "3:30 p.m.", "15:00", "noon" or "midnight".
+
+    Args:
+        text (str): The message.
+
+    Returns:
+        dict: {"hours", "minutes", "seconds", "nanos"} in the Dialogflow time format, or None if no time is found.
+    """
+    text = text.casefold()
+    hours = minutes = None
+
+    match = TIME_12H.search(text)
+    if match and 1 <= int(match.group(1)) <= 12:
+        hours = int(match.group(1)) % 12 + (12 if match.group(3) == "p" else 0)
+        minutes = int(match.group(2) or 0)
+    else:
+        match = TIME_24H.search(text)
+        if match:
+            hours, minutes = int(match.group(1)), int(match.group(2))
+        elif "noon" in text:
+            hours, minutes = 12, 0
+        elif "midnight" in text:
+            hours, minutes = 0, 0
+
+    if hours is None or minutes > 59:
+        return None
+    return {"hours": hours, "minutes": minutes, "seconds": 0, "nanos": 0}
+
+
+def extract_amount(text):
+    """
+    Extract a dollar amount from free text, e.g. "$45", "45.50" or "1,200 dollars". A number marked
+    as dollars wins over other numbers, so "2 hours for $45" is $45; otherwise the first number is used.
+
+    Args:
+        text (str): The message.
+
+    Returns:
+        dict: {"amount", "currency"} in the Dialogflow currency format, or None if no amount is found.
+    """
+    match = DOLLAR_AMOUNT.search(text.lower())
+    if match:
+        dollars, cents = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+    else:
+        match = AMOUNT.search(text)
+        if not match:
+            return None
+        dollars, cents = match.group(1), match.group(2)
+    amount = float(dollars.replace(",", "") + "." + (cents or "0"))
+    return {"amount": amount, "currency": "USD"}
+
+
+def extract_zip_code(text):
+    """
+    Extract a US ZIP code from free text.
+
+    Args:
+        text (str): The message.
+
+    Returns:
+        str: The five-digit ZIP code, or None if none is found.
+    """
+    match = ZIP_CODE.search(text)
+    return match.group(1) if match else None
+
+
+def extract_job_id(text):
+    """
+    Extract a job ID from a list reply or free text, e.g. "12", "#00012" or "Job #12".
+
+    Args:
+        text (str): The message.
+
+    Returns:
+        int: The job ID, or None if none is found.
+    """
+    match = JOB_ID.search(text)
+    return int(match.group(1)) if match else None
+
+
+def _make_date(year, month, day, today=None):
+    # A date without a year means its next occurrence
+    try:
+        if year is not None:
+            return datetime.date(year, month, day)
+        date = datetime.date(today.year, month, day)
+        return date if date >= today else datetime.date(today.year + 1, month, day)
+    except ValueError:
+        return None
@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from sqlalchemy import inspect
+from config import USER_CACHE_MAX_SIZE, USER_CACHE_TTL
+from utils.ttl_cache import TTLCache
+
+# Per-request memo; None outside of a request scope
+_request_memo = ContextVar("user_cache_request_memo", default=None)
+
+
+class UserCache:
+    def __init__(self, max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL):
+        """
+        Initialize the user cache: a per-request memo in front of a bounded
+        cross-request LRU keyed by phone number and user ID.
+
+        The cache holds copies of the user's column values, never the ORM object, and every
+        lookup returns a fresh copy, so requests cannot see each other's changes to a user.
+        The cache is per process: an update or deletion made through another gunicorn worker
+        is only seen here once the entry expires after ttl seconds.
+
+        Args:
+            max_size (int): The maximum number of cache keys kept across requests.
+            ttl (float): The number of seconds a user stays cached across requests.
+        """
+        self.cache = TTLCache(max_size, ttl)
+        self.memo_hits = 0
+
+    @contextmanager
+    def request_scope(self):
+        """
+        Memoize user lookups, including misses, for the duration of one request.
+        """
+        token = _request_memo.set({})
+        try:
+            yield
+        finally:
+            _request_memo.reset(token)
+
+    def get_by_phone_number(self, phone_number):
+        """
+        Look up a cached user by phone number.
+
+        Returns:
+            tuple: (True, user) on a hit, where user may be None for a memoized miss; (False, None) otherwise.
+        """
+        return self._lookup(("phone_number", phone_number))
+
+    def get_by_id(self, user_id):
+        """
+        Look up a cached user by ID.
+
+        Returns:
+            tuple: (True, user) on a hit; (False, None) otherwise.
+        """
+        return self._lookup(("id", user_id))
+
+    def set(self, user, phone_number=None):
+        """
+        Cache a user under its ID and, when known, its plain phone number.
+
+        Args:
+            user (User): The detached user object with a decrypted phone number.
+            phone_number (str, optional): The phone number used for the lookup.
+        """
+        phone_number = phone_number or user.phone_number
+        keys = [("id", user.id)]
+        if phone_number:
+            keys.append(("phone_number", phone_number))
+
+        fields = {attribute.key: getattr(user, attribute.key) for attribute in inspect(user).mapper.column_attrs}
+        memo = _request_memo.get()
+        for key in keys:
+            self.cache.set(key, fields)
+            if memo is not None:
+                memo[key] = fields
+
+    def set_missing(self, phone_number):
+        """
+        Remember for the current request only that no user has this phone number.
+        """
+        memo = _request_memo.get()
+        if memo is not None:
+            memo[("phone_number", phone_number)] = None
+
+    def invalidate(self, user_id=None, phone_number=None):
+        """
+        Drop a user from the memo and the LRU by ID and/or phone number.
+
+        Args:
+            user_id (int, optional): The ID of the user.
+            phone_number (str, optional): The plain phone number of the user.
+        """
+        keys = set()
+        if phone_number:
+            keys.add(("phone_number", phone_number))
+        if user_id is not None:
+            keys.add(("id", user_id))
+
+        memo = _request_memo.get()
+        if user_id is not None:
+            # Also drop the phone number keys of any cached copies
+            cached_users = [self.cache.peek(("id", user_id))]
+            if memo is not None:
+                cached_users.append(memo.get(("id", user_id)))
+            for cached_user in cached_users:
+                if cached_user is not None and cached_user["phone_number"]:
+                    keys.add(("phone_number", cached_user["phone_number"]))
+
+        for key in keys:
+            self.cache.pop(key)
+            if memo is not None:
+                memo.pop(key, None)
+
+    def stats(self):
+        """
+        Return the hit/miss counters of the memo and the LRU.
+
+        Returns:
+            dict: The cache statistics.
+        """
+        return {**self.cache.stats(), "request_memo_hits": self.memo_hits}
+
+    def _lookup(self, key):
+        memo = _request_memo.get()
+        if memo is not None and key in memo:
+            self.memo_hits += 1
+            return True, self._copy(memo[key])
+
+        found, fields = self.cache.lookup(key)
+        if found and memo is not None:
+            memo[key] = fields
+        return found, self._copy(fields)
+
+    @staticmethod
+    def _copy(fields):
+        # A plain object with the user's attributes, owned by the caller
+        return SimpleNamespace(**fields) if fields is not None else None
+
+
+user_cache = UserCache()
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+from utils.background_loop import background_loop
+
+
+class WorkQueue:
+    def __init__(self, name, max_size, workers, lanes=None, loop=background_loop):
+        """
+        Initialize a bounded queue of coroutine jobs processed by async workers
+        on the background loop.
+
+        With lanes, jobs queued with a key are handed to that key's lane instead of being run by
+        the worker, so a key with a backlog waits in its own lane without holding up other keys.
+
+        Args:
+            name (str): The queue name used in logs and metrics.
+            max_size (int): The maximum number of queued or running jobs before enqueue is refused.
+            workers (int): The maximum number of jobs running at once.
+            lanes (LaneDispatcher): Optional; runs jobs with the same key in order.
+            loop (BackgroundLoop): The loop the workers run on.
+        """
+        self.name = name
+        self.max_size = max_size
+        self.workers = workers
+        self.lanes = lanes
+        self.background_loop = loop
+        self.accepting = False
+        self._queue = None
+        self._running = None
+        self._tasks = []
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_last = 0.0
+
+    def start(self):
+        """
+        Start the worker tasks on the background loop.
+        """
+        if self.accepting:
+            return
+        self.background_loop.submit(self._start()).result()
+        self.accepting = True
+
+    def enqueue(self, handler, *args, key=None):
+        """
+        Queue handler(*args) without waiting for it to run. Safe to call from any thread.
+
+        Args:
+            handler (callable): An async function to run on a worker.
+            *args: The arguments passed to the handler.
+            key (str): Optional; with lanes, jobs with the same key run in the order they were queued.
+
+        Returns:
+            bool: True if the job was queued, False if the queue is full or shut down.
+        """
+        with self._lock:
+            if not self.accepting or self._pending >= self.max_size:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            self.enqueued += 1
+
+        item = (time.monotonic(), key, handler, args)
+        self.background_loop.call_soon(self._queue.put_nowait, item)
+        return True
+
+    def shutdown(self, timeout=30):
+        """
+        Stop accepting jobs and wait up to timeout seconds for queued jobs to finish.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait for the queue to drain.
+        """
+        if not self.accepting:
+            return
+        self.accepting = False
+        try:
+            self.background_loop.submit(self._drain(timeout)).result(timeout + 5)
+        except Exception as e:
+            print(f"Error draining {self.name} queue: {e}")
+
+    def stats(self):
+        """
+        Return queue depth, throughput and queue latency counters.
+
+        Returns:
+            dict: The queue statistics.
+        """
+        started = self.processed + self.failed
+        return {
+            "depth": self._pending,
+            "max_size": self.max_size,
+            "workers": self.workers,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queue_latency_ms": {
+                "last": round(self.latency_last * 1000, 2),
+                "avg": round(self.latency_total / started * 1000, 2) if started else 0.0,
+                "max": round(self.latency_max * 1000, 2),
+            },
+        }
+
+    async def _start(self):
+        self._queue = asyncio.Queue()
+        self._running = asyncio.Semaphore(self.workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            enqueued_at, key, handler, args = await self._queue.get()
+            if self.lanes is not None and key is not None:
+                # Handed off without waiting; the job still counts as pending until its lane runs it
+                self.lanes.submit(key, self._run, enqueued_at, handler, args)
+            else:
+                await self._run(enqueued_at, handler, args)
+
+    async def _run(self, enqueued_at, handler, args):
+        try:
+            async with self._running:
+                latency = time.monotonic() - enqueued_at
+                self.latency_last = latency
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                await handler(*args)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Error processing {self.name} job: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._queue.task_done()
+
+    async def _drain(self, timeout):
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{self.name} queue did not drain within {timeout}s; {self._pending} jobs dropped.")
+        for task in self._tasks:
+            task.cancel()
@@ -0,0 +1,209 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import ZIP_CODE_DB_PATH, ZIP_CODE_NEGATIVE_TTL
+
+ZIP_CODE = re.compile(r"(\d{5})(?:-\d{4})?")
+
+
+class ZipCodeStore:
+    def __init__(self, path, negative_ttl):
+        """
+        Initialize a ZIP code to city and state index in a SQLite file, fronted by an in-process
+        dictionary so repeated lookups never leave memory.
+
+        Valid ZIP codes are kept until the file is rebuilt. Invalid ones are remembered for
+        negative_ttl seconds, so a typo does not reach the geocoder on every retry.
+
+        Args:
+            path (str): The path of the SQLite database file.
+            negative_ttl (float): The number of seconds an invalid ZIP code is remembered.
+        """
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}  # zip_code -> (city, state_id), or (None, expires_at) for invalid ones
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS zip_codes ("
+                "zip_code TEXT PRIMARY KEY, city TEXT, state_id TEXT, expires_at REAL"
+                ") WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def normalize(zip_code):
+        """
+        Normalize a ZIP code to its five digits.
+
+        Args:
+            zip_code (str | int | float): The ZIP code, e.g. "10001", "10001-1234" or 10001.0 from Dialogflow.
+
+        Returns:
+            str: The five-digit ZIP code, or None if it is not a US ZIP code.
+        """
+        if isinstance(zip_code, float):
+            zip_code = int(zip_code)
+        if isinstance(zip_code, int):
+            zip_code = f"{zip_code:05d}"
+        match = ZIP_CODE.fullmatch(str(zip_code).strip()) if zip_code is not None else None
+        return match.group(1) if match else None
+
+    def lookup(self, zip_code):
+        """
+        Look up a ZIP code without calling the geocoder.
+
+        Args:
+            zip_code (str): A normalized ZIP code.
+
+        Returns:
+            tuple: (True, {"city", "state_id"}) or (False, {}) if known, or None on a miss.
+        """
+        now = time.time()
+        entry = self._memory.get(zip_code)
+        if entry is None:
+            entry = self._load(zip_code)
+
+        if entry is not None:
+            city, value = entry
+            if city is not None:
+                self.hits += 1
+                return True, {"city": city, "state_id": value}
+            if value is None or value > now:
+                self.hits += 1
+                return False, {}
+            self._memory.pop(zip_code, None)
+
+        self.misses += 1
+        return None
+
+    def store(self, zip_code, city, state_id):
+        """
+        Remember a valid ZIP code.
+
+        Args:
+            zip_code (str): A normalized ZIP code.
+            city (str): The city.
+            state_id (str): The two-letter state code.
+        """
+        self._write(zip_code, city, state_id, None)
+
+    def store_invalid(self, zip_code):
+        """
+        Remember an invalid ZIP code for the negative TTL.
+
+        Args:
+            zip_code (str): A normalized ZIP code.
+        """
+        self._write(zip_code, None, None, time.time() + self.negative_ttl)
+
+    def preload(self, rows):
+        """
+        Bulk load valid ZIP codes, replacing existing entries.
+
+        Args:
+            rows (iterable): (zip_code, city, state_id) tuples.
+
+        Returns:
+            int: The number of ZIP codes loaded.
+        """
+        rows = [
+            (zip_code, city, state_id)
+            for zip_code, city, state_id in ((self.normalize(row[0]), row[1], row[2]) for row in rows)
+            if zip_code and city and state_id
+        ]
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO zip_codes (zip_code, city, state_id, expires_at) VALUES (?, ?, ?, NULL)",
+                rows
+            )
+        with self._lock:
+            self._memory.clear()
+        return len(rows)
+
+    def stats(self):
+        """
+        Return the index size and lookup counters.
+
+        Returns:
+            dict: The store statistics.
+        """
+        try:
+            size = self._connect().execute("SELECT COUNT(*) FROM zip_codes").fetchone()[0]
+        except sqlite3.Error:
+            size = None
+        return {
+            "size": size,
+            "in_memory": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _load(self, zip_code):
+        # Rows written by other workers, or loaded before this process started
+        try:
+            row = self._connect().execute(
+                "SELECT city, state_id, expires_at FROM zip_codes WHERE zip_code = ?", (zip_code,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading ZIP code index: {e}")
+            return None
+        if row is None:
+            return None
+        entry = (row[0], row[1]) if row[0] is not None else (None, row[2])
+        with self._lock:
+            self._memory[zip_code] = entry
+        return entry
+
+    def _write(self, zip_code, city, state_id, expires_at):
+        with self._lock:
+            self._memory[zip_code] = (city, state_id) if city is not None else (None, expires_at)
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO zip_codes (zip_code, city, state_id, expires_at) VALUES (?, ?, ?, ?)",
+                    (zip_code, city, state_id, expires_at)
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing ZIP code index: {e}")
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            self._local.connection = connection
+        return connection
+
+
+def read_zip_code_csv(path):
+    """
+    Read an offline US ZIP code dataset, e.g. the simplemaps uszips.csv.
+
+    Args:
+        path (str): The path of a CSV file with zip (or zip_code), city and state_id (or state) columns.
+
+    Returns:
+        generator: (zip_code, city, state_id) tuples.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            # Spreadsheets drop the leading zeros of New England ZIP codes
+            yield (
+                (row.get("zip") or row.get("zip_code") or "").strip().zfill(5),
+                row.get("city"),
+                row.get("state_id") or row.get("state")
+            )
+
+
+zip_code_store = ZipCodeStore(ZIP_CODE_DB_PATH, ZIP_CODE_NEGATIVE_TTL)
+